@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'system.middleware.DriverContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'system.context_processors.driver_context',
             ],
         },
     },
@@ -129,6 +131,66 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# uploaded screenshots wait here until the huey worker moves them to MEDIA_ROOT; uploads larger than
+# FILE_UPLOAD_MAX_MEMORY_SIZE are renamed here from FILE_UPLOAD_TEMP_DIR, which has to be on the same
+# file system for that (they are copied otherwise)
+SCREENSHOTS_SPOOL_DIR = os.path.join(BASE_DIR, 'spool/screenshots/')
+SCREENSHOT_CHUNK_SIZE = 64 * 1024
+SCREENSHOT_MAX_SIZE = 20 * 1024 * 1024
+# unreferenced screenshot files are collected only after this many hours since their last upload
+SCREENSHOT_BLOB_GRACE_HOURS = 24
+# resized variants of uploaded images, cached under MEDIA_ROOT/IMAGE_DERIVATIVES_DIR
+IMAGE_DERIVATIVES_DIR = 'derivatives'
+IMAGE_DERIVATIVE_WIDTH = 320
+IMAGE_DERIVATIVE_FORMAT = 'webp'
+IMAGE_DERIVATIVE_QUALITY = 80
+IMAGE_DERIVATIVE_EAGER_WIDTHS = (320, 1280)
+# screenshots whose dHashes differ by at most this many bits are reported as near-duplicates
+PERCEPTUAL_HASH_MAX_DISTANCE = 7
+
+# limits of a single telemetry batch posted by JustDeliver Desktop
+TELEMETRY_MAX_BATCH_BYTES = 8 * 1024 * 1024
+TELEMETRY_MAX_SAMPLES = 5000
+TELEMETRY_INSERT_BATCH_SIZE = 1000
+# raw samples older than TELEMETRY_PACK_AFTER_SECONDS are packed into NumPy segment files
+TELEMETRY_SEGMENTS_DIR = os.path.join(BASE_DIR, 'telemetry/')
+TELEMETRY_SEGMENT_MAX_SAMPLES = 100000
+TELEMETRY_PACK_AFTER_SECONDS = 120
+TELEMETRY_CHART_POINTS = 400
+TELEMETRY_CHART_MAX_POINTS = 2000
+# latest driver positions, kept in Redis when FLEET_REDIS_URL is set and in process memory otherwise
+FLEET_REDIS_URL = os.environ.get('FLEET_REDIS_URL')
+FLEET_POSITION_TTL = 120
+# side of a spatial index cell in game units (1000 units = 19 km)
+FLEET_GRID_CELL = 2000
+FLEET_NEAR_RADIUS_KM = 100
+# the ?near= lookup visits every grid cell within the radius, so larger radii are refused
+FLEET_NEAR_MAX_RADIUS_KM = 500
+# under ASGI (e.g. uvicorn justdeliver.asgi:application) ASYNC_VIEWS=1 serves the dashboard, drivers card,
+# offers market and driver search with async views querying in a thread pool of ASYNC_VIEWS_THREADS;
+# its threads reconnect for every job unless DATABASES sets CONN_MAX_AGE
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+ASYNC_VIEWS_THREADS = int(os.environ.get('ASYNC_VIEWS_THREADS', '16'))
+
+# waybill OCR: a TorchScript CRNN returning (batch, time, classes) logits, class 0 being the CTC blank.
+# OCR stays disabled until OCR_MODEL_PATH points to the model file.
+OCR_MODEL_PATH = os.environ.get('OCR_MODEL_PATH')
+OCR_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyząćęłńóśźżABCDEFGHIJKLMNOPQRSTUVWXYZĄĆĘŁŃÓŚŹŻ .,-/%€'
+OCR_INPUT_HEIGHT = 32
+OCR_MAX_WIDTH = 512
+OCR_BATCH_SIZE = 32
+OCR_TORCH_THREADS = 2
+OCR_MIN_CONFIDENCE = 0.8
+# (left, top, right, bottom) of every field as fractions of the delivery summary screenshot
+OCR_FIELD_REGIONS = {
+    'loading_city': (0.08, 0.22, 0.40, 0.27),
+    'unloading_city': (0.60, 0.22, 0.92, 0.27),
+    'cargo': (0.08, 0.32, 0.50, 0.37),
+    'tonnage': (0.60, 0.32, 0.92, 0.37),
+    'distance': (0.08, 0.42, 0.40, 0.47),
+    'income': (0.60, 0.62, 0.92, 0.68),
+    'damage': (0.08, 0.52, 0.40, 0.57),
+}
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -136,6 +198,27 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Offers market, generated nightly by huey
+OFFERS_PER_MAP = {
+    'base': 350,
+    'promods': 100,
+}
+OFFERS_BATCH_SIZE = 1000
+OFFERS_MARKET_LIMIT = 5000
+OFFER_TTL_HOURS = 72
+OFFERS_PURGE_BATCH_SIZE = 500
+# seconds for which the recommended offers ranking is reused per origin city
+OFFER_RECOMMENDATIONS_TTL = 300
+
+# shared by the web processes and the huey worker, so e.g. the offers market version bumped by a
+# nightly refresh is seen by every process at once
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/1'),
+    }
+}
+
 HUEY = {
     'huey_class': 'huey.RedisHuey',  # Huey implementation to use.
     'name': 'justdeliver',  # Use db name for huey.
@@ -2,22 +2,30 @@ from django.contrib import admin
 
 from .models import (
     Driver,
+    DriverStats,
     Delivery,
     Disposition,
     Employee,
     Vehicle,
     Company,
+    CompanyDirectorySnapshot,
     Offer,
     DeliveryScreenshot,
-    EmployeeApplication
+    ScreenshotBlob,
+    EmployeeApplication,
+    TelemetryToken,
 )
 
 admin.site.register(Driver)
+admin.site.register(DriverStats)
 admin.site.register(Employee)
 admin.site.register(Delivery)
 admin.site.register(Disposition)
 admin.site.register(Vehicle)
 admin.site.register(Company)
+admin.site.register(CompanyDirectorySnapshot)
 admin.site.register(Offer)
 admin.site.register(DeliveryScreenshot)
-admin.site.register(EmployeeApplication)
\ No newline at end of file
+admin.site.register(ScreenshotBlob)
+admin.site.register(EmployeeApplication)
+admin.site.register(TelemetryToken)
\ No newline at end of file
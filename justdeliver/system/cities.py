@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import networkx as nx
+import numpy as np
+from django.conf import settings as django_settings
+
+# in-game coordinates are metres of a map scaled 1:19 against the real world
+MAP_SCALE = 19
+ROUTE_NEIGHBOURS = 6
+
+logger = logging.getLogger(__name__)
+
+
+def get_cities_path():
+    return os.path.join(django_settings.STATIC_ROOT, 'files/cities.json')
+
+
+def get_distances_path():
+    return os.path.join(django_settings.STATIC_ROOT, 'files/distances.npy')
+
+
+def get_distances_meta_path():
+    return os.path.join(django_settings.STATIC_ROOT, 'files/distances.json')
+
+
+class CityCatalog:
+    """
+    Array-backed view of cities.json with precomputed indexes. Cities are addressed by
+    their position in the file, the same position used by every index.
+    """
+    def __init__(self, cities, checksum: str = None, distances=None):
+        self.checksum = checksum
+        self.distances = distances
+        self.names = [city.get("realName") for city in cities]
+        self.countries = [city.get("country") for city in cities]
+        self.companies = [tuple(city.get("companies") or ()) for city in cities]
+        self.companies_counts = np.array([len(companies) for companies in self.companies], dtype=np.int32)
+        self.is_promods = np.array([city.get("mod") == "promods" for city in cities], dtype=bool)
+        self.coordinates = np.array(
+            [(city.get("x", np.nan), city.get("z", city.get("y", np.nan))) for city in cities],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+
+        self.by_name = {name: index for index, name in enumerate(self.names)}
+        self.by_mod = {
+            "base": np.flatnonzero(~self.is_promods),
+            "promods": np.flatnonzero(self.is_promods),
+        }
+        self.all_cities = np.arange(len(self.names))
+        self.by_country = {}
+        for index, country in enumerate(self.countries):
+            self.by_country.setdefault(country, []).append(index)
+        self.by_country = {country: np.array(indices) for country, indices in self.by_country.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_city_index(self, name: str):
+        return self.by_name.get(name)
+
+    def get_cities(self, country: str = None, promods: bool = False):
+        if country and country != "random":
+            cities = self.by_country.get(country, np.array([], dtype=int))
+            if not promods:
+                cities = cities[~self.is_promods[cities]]
+            return cities
+        return self.all_cities if promods else self.by_mod["base"]
+
+    def random_city(self, rng, country: str = None, promods: bool = False):
+        cities = self.get_cities(country, promods)
+        if not len(cities):
+            return None
+        return int(cities[rng.integers(len(cities))])
+
+    def random_cities(self, rng, count: int, country: str = None, promods: bool = False):
+        cities = self.get_cities(country, promods)
+        if not len(cities):
+            return None
+        return cities[rng.integers(0, len(cities), count)]
+
+    def distance(self, loading_city: int, unloading_city: int):
+        if self.distances is None:
+            return 0
+        return int(self.distances[loading_city, unloading_city])
+
+    def get_distances(self, loading_cities: np.ndarray, unloading_cities: np.ndarray):
+        if self.distances is None:
+            return np.zeros(len(loading_cities), dtype=np.uint32)
+        return np.asarray(self.distances[loading_cities, unloading_cities])
+
+    def random_company(self, rng, city: int):
+        if not self.companies_counts[city]:
+            return "Dowolna"
+        return self.companies[city][rng.integers(self.companies_counts[city])]
+
+    def random_companies(self, rng, cities: np.ndarray):
+        # one draw per city scaled by its companies count picks all companies at once
+        picks = (rng.random(len(cities)) * self.companies_counts[cities]).astype(int)
+        return [
+            self.companies[city][pick] if self.companies_counts[city] else "Dowolna"
+            for city, pick in zip(cities.tolist(), picks.tolist())
+        ]
+
+
+def build_route_graph(catalog: CityCatalog, neighbours: int = ROUTE_NEIGHBOURS):
+    """
+    Approximates the road network by connecting every city with its nearest neighbours,
+    weighted with the real-world distance in kilometres.
+    """
+    graph = nx.Graph()
+    graph.add_nodes_from(range(len(catalog)))
+    located = np.flatnonzero(~np.isnan(catalog.coordinates).any(axis=1))
+    points = catalog.coordinates[located]
+    pairwise = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=-1)) * MAP_SCALE / 1000
+    np.fill_diagonal(pairwise, np.inf)
+    nearest = np.argsort(pairwise, axis=1)[:, :neighbours]
+    for row, city in enumerate(located.tolist()):
+        for column in nearest[row].tolist():
+            graph.add_edge(city, int(located[column]), weight=float(pairwise[row, column]))
+    return graph
+
+
+def build_distance_matrix(catalog: CityCatalog):
+    graph = build_route_graph(catalog)
+    distances = nx.floyd_warshall_numpy(graph, nodelist=range(len(catalog)), weight="weight")
+    # unreachable cities keep 0, the same as offers with an unknown distance
+    distances[np.isinf(distances)] = 0
+    return np.rint(distances).astype(np.uint32)
+
+
+def save_distance_matrix(catalog: CityCatalog):
+    distances = build_distance_matrix(catalog)
+    np.save(get_distances_path(), distances)
+    with open(get_distances_meta_path(), "w", encoding="UTF-8") as meta_file:
+        json.dump({"cities_checksum": catalog.checksum, "cities_count": len(catalog)}, meta_file)
+    return distances
+
+
+def load_distance_matrix(checksum: str):
+    try:
+        with open(get_distances_meta_path(), "r", encoding="UTF-8") as meta_file:
+            meta = json.load(meta_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get("cities_checksum") != checksum:
+        logger.warning("Distance matrix is out of date with cities.json. Run manage.py build_distance_matrix.")
+        return None
+    return np.load(get_distances_path(), mmap_mode="r")
+
+
+def load_catalog():
+    with open(get_cities_path(), "rb") as cities_file:
+        content = cities_file.read()
+    checksum = hashlib.sha256(content).hexdigest()
+    cities = json.loads(content.decode("UTF-8"))
+    return CityCatalog(cities["response"], checksum, load_distance_matrix(checksum))
+
+
+_catalog = None
+_catalog_version = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog_version():
+    try:
+        distances_mtime = os.stat(get_distances_meta_path()).st_mtime_ns
+    except FileNotFoundError:
+        distances_mtime = None
+    return os.stat(get_cities_path()).st_mtime_ns, distances_mtime
+
+
+def get_catalog():
+    """
+    Returns the process-wide catalog, reloading it when cities.json or the distance
+    matrix has changed on disk.
+    """
+    global _catalog, _catalog_version
+    version = get_catalog_version()
+    if _catalog is None or version != _catalog_version:
+        with _catalog_lock:
+            if _catalog is None or version != _catalog_version:
+                _catalog = load_catalog()
+                _catalog_version = version
+    return _catalog
@@ -0,0 +1,47 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings as django_settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Thread pool shared by the async views. Its size bounds the number of queries running at once,
+    and so the number of database connections the web process opens.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=django_settings.ASYNC_VIEWS_THREADS,
+                    thread_name_prefix="justdeliver-views",
+                )
+    return _executor
+
+
+def call_with_fresh_connections(func, args, kwargs):
+    # pool threads outlive requests, so every job is handled like a request: the connection a thread keeps
+    # is closed once older than CONN_MAX_AGE or broken by an error
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Runs blocking (ORM, template rendering) code in the shared pool. Django 4.0 has no async ORM,
+    so this is how the async views fetch independent parts of a page concurrently.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, call_with_fresh_connections, func, args, kwargs)
+    return await loop.run_in_executor(get_executor(), call)
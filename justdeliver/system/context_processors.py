@@ -0,0 +1,9 @@
+def driver_context(request):
+    driver_ctx = getattr(request, "driver_ctx", None)
+    if driver_ctx is None or driver_ctx.driver is None:
+        return {}
+    return {
+        "driver_ctx": driver_ctx,
+        "is_employed": driver_ctx.is_employed,
+        "has_speditor_permissions": driver_ctx.has_speditor_permissions,
+    }
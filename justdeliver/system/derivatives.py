@@ -0,0 +1,88 @@
+import hashlib
+import os
+from uuid import uuid4
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from huey.contrib import djhuey as huey
+from PIL import Image, ImageOps
+
+FORMATS = {"webp": "WEBP", "jpg": "JPEG", "png": "PNG"}
+
+
+def get_content_hash(path: str):
+    """
+    Returns the SHA-256 of a file. The digest is cached per path, size and mtime,
+    so an unchanged upload is read only once.
+    """
+    stat = os.stat(path)
+    cache_key = f"image-hash:{path}:{stat.st_size}:{stat.st_mtime_ns}"
+    content_hash = cache.get(cache_key)
+    if content_hash is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as image_file:
+            for chunk in iter(lambda: image_file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        cache.set(cache_key, content_hash, None)
+    return content_hash
+
+
+def get_derivative_name(content_hash: str, width: int, extension: str, quality: int):
+    # the parameters are part of the name, so changing them never serves a stale variant
+    return f"{content_hash[:2]}/{content_hash}-w{width}-q{quality}.{extension}"
+
+
+def render_derivative(source: str, target: str, width: int, extension: str, quality: int):
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        if extension == "jpg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # written under a name of its own first, so a concurrent reader never sees half a file
+        # and concurrent renders of the same variant (threads included) never share a file
+        partial = f"{target}.{uuid4().hex}.part"
+        try:
+            image.save(partial, FORMATS[extension], quality=quality)
+        except Exception:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+    os.replace(partial, target)
+
+
+def get_derivative(image, width: int = None, extension: str = None, quality: int = None, content_hash: str = None):
+    """
+    Returns the storage name of a resized variant of an uploaded image (a field file or its storage name).
+    The variant is rendered on first use and then served from the disk cache.
+    The SHA-256 of the image is hashed from the file unless it is passed as content_hash
+    or stored on the field file's instance (screenshots and their blobs).
+    """
+    width = width or django_settings.IMAGE_DERIVATIVE_WIDTH
+    extension = extension or django_settings.IMAGE_DERIVATIVE_FORMAT
+    quality = quality or django_settings.IMAGE_DERIVATIVE_QUALITY
+    if extension not in FORMATS:
+        raise ValueError(f"Unsupported derivative format: {extension}")
+    source = default_storage.path(getattr(image, "name", image))
+    content_hash = content_hash or getattr(getattr(image, "instance", None), "sha256", None) or get_content_hash(source)
+    name = get_derivative_name(content_hash, width, extension, quality)
+    target = os.path.join(django_settings.MEDIA_ROOT, django_settings.IMAGE_DERIVATIVES_DIR, name)
+    if not os.path.exists(target):
+        render_derivative(source, target, width, extension, quality)
+    return f"{django_settings.IMAGE_DERIVATIVES_DIR}/{name}"
+
+
+def get_derivative_url(image, width: int = None, extension: str = None, quality: int = None):
+    return f"{django_settings.MEDIA_URL}{get_derivative(image, width, extension, quality)}"
+
+
+@huey.task()
+def generate_derivatives(name: str, widths=None, content_hash: str = None):
+    """
+    Renders the configured variants of a stored image ahead of the first page view.
+    """
+    for width in widths or django_settings.IMAGE_DERIVATIVE_EAGER_WIDTHS:
+        get_derivative(name, width, content_hash=content_hash)
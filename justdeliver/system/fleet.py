@@ -0,0 +1,182 @@
+import json
+import math
+import threading
+import time
+
+from django.conf import settings as django_settings
+
+from .cities import MAP_SCALE
+
+# compact snapshot rows, the field names are sent once per payload
+SNAPSHOT_FIELDS = ("driver", "nick", "x", "z", "speed", "t")
+
+
+def get_cell(x: float, z: float):
+    cell_size = django_settings.FLEET_GRID_CELL
+    return int(x // cell_size), int(z // cell_size)
+
+
+def get_cells_around(x: float, z: float, radius: float):
+    (min_x, min_z), (max_x, max_z) = get_cell(x - radius, z - radius), get_cell(x + radius, z + radius)
+    return [(cell_x, cell_z) for cell_x in range(min_x, max_x + 1) for cell_z in range(min_z, max_z + 1)]
+
+
+def km_to_game_units(km: float):
+    return km * 1000 / MAP_SCALE
+
+
+def build_position(driver_id: int, nick: str, company_id, sample):
+    return {
+        "driver": driver_id,
+        "nick": nick,
+        "company": company_id,
+        "x": round(sample.x, 1),
+        "z": round(sample.z, 1),
+        "speed": round(sample.speed, 1),
+        "t": int(sample.recorded_at.timestamp() * 1000),
+    }
+
+
+def within(position, x: float, z: float, radius: float):
+    return math.hypot(position["x"] - x, position["z"] - z) <= radius
+
+
+class LocalFleetStore:
+    """
+    Process-local stand-in for Redis. Every web process sees only the positions it received,
+    so it suits development and single-process deployments.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.positions = {}
+        self.companies = {}
+        self.cells = {}
+
+    def update(self, position):
+        driver_id = position["driver"]
+        cell = get_cell(position["x"], position["z"])
+        with self.lock:
+            previous = self.positions.get(driver_id)
+            if previous:
+                if previous[0]["t"] > position["t"]:
+                    # a delayed batch must not move the driver back in time
+                    return
+                self.discard_indexes(driver_id, previous[0])
+            self.positions[driver_id] = (position, time.monotonic() + self.ttl)
+            self.companies.setdefault(position["company"], set()).add(driver_id)
+            self.cells.setdefault(cell, set()).add(driver_id)
+
+    def discard_indexes(self, driver_id, position):
+        self.companies.get(position["company"], set()).discard(driver_id)
+        self.cells.get(get_cell(position["x"], position["z"]), set()).discard(driver_id)
+
+    def get_many(self, driver_ids):
+        now = time.monotonic()
+        positions = []
+        with self.lock:
+            for driver_id in list(driver_ids):
+                position, expires_at = self.positions.get(driver_id, (None, 0))
+                if position is None:
+                    continue
+                if expires_at < now:
+                    self.discard_indexes(driver_id, position)
+                    del self.positions[driver_id]
+                    continue
+                positions.append(position)
+        return positions
+
+    def get_company(self, company_id):
+        with self.lock:
+            driver_ids = set(self.companies.get(company_id, ()))
+        return self.get_many(driver_ids)
+
+    def get_near(self, x: float, z: float, radius: float):
+        driver_ids = set()
+        with self.lock:
+            for cell in get_cells_around(x, z, radius):
+                driver_ids |= self.cells.get(cell, set())
+        return [position for position in self.get_many(driver_ids) if within(position, x, z, radius)]
+
+
+class RedisFleetStore:
+    """
+    Positions are kept as JSON strings expiring after the TTL, indexed by sorted sets
+    (company and grid cell) scored with the time of the last update.
+    """
+
+    def __init__(self, client, ttl: int):
+        self.client = client
+        self.ttl = ttl
+
+    def update(self, position):
+        driver_id = position["driver"]
+        now = time.time()
+        position_key = f"fleet:position:{driver_id}"
+        company_key = f"fleet:company:{position['company']}"
+        cell_key = "fleet:cell:{}:{}".format(*get_cell(position["x"], position["z"]))
+        previous = self.client.get(position_key)
+        pipeline = self.client.pipeline()
+        if previous:
+            previous = json.loads(previous)
+            if previous["t"] > position["t"]:
+                return
+            previous_cell_key = "fleet:cell:{}:{}".format(*get_cell(previous["x"], previous["z"]))
+            if previous_cell_key != cell_key:
+                pipeline.zrem(previous_cell_key, driver_id)
+            if previous["company"] != position["company"]:
+                pipeline.zrem(f"fleet:company:{previous['company']}", driver_id)
+        pipeline.set(position_key, json.dumps(position, separators=(",", ":")), ex=self.ttl)
+        for index_key in (company_key, cell_key):
+            pipeline.zadd(index_key, {driver_id: now})
+            pipeline.zremrangebyscore(index_key, "-inf", now - self.ttl)
+            pipeline.expire(index_key, self.ttl)
+        pipeline.execute()
+
+    def get_many(self, driver_ids):
+        driver_ids = list(driver_ids)
+        if not driver_ids:
+            return []
+        values = self.client.mget([f"fleet:position:{int(driver_id)}" for driver_id in driver_ids])
+        return [json.loads(value) for value in values if value]
+
+    def get_company(self, company_id):
+        driver_ids = self.client.zrangebyscore(f"fleet:company:{company_id}", time.time() - self.ttl, "+inf")
+        # a driver who changed companies may still linger in the old index until the next update
+        return [position for position in self.get_many(driver_ids) if position["company"] == company_id]
+
+    def get_near(self, x: float, z: float, radius: float):
+        pipeline = self.client.pipeline()
+        since = time.time() - self.ttl
+        for cell in get_cells_around(x, z, radius):
+            pipeline.zrangebyscore("fleet:cell:{}:{}".format(*cell), since, "+inf")
+        driver_ids = {driver_id for cell_ids in pipeline.execute() for driver_id in cell_ids}
+        return [position for position in self.get_many(driver_ids) if within(position, x, z, radius)]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_fleet_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if django_settings.FLEET_REDIS_URL:
+                    import redis
+
+                    client = redis.Redis.from_url(django_settings.FLEET_REDIS_URL)
+                    _store = RedisFleetStore(client, django_settings.FLEET_POSITION_TTL)
+                else:
+                    _store = LocalFleetStore(django_settings.FLEET_POSITION_TTL)
+    return _store
+
+
+def build_snapshot(positions):
+    positions = sorted(positions, key=lambda position: position["driver"])
+    return {
+        "fields": SNAPSHOT_FIELDS,
+        "drivers": [[position[field] for field in SNAPSHOT_FIELDS] for position in positions],
+    }
@@ -0,0 +1,153 @@
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from system.models import Delivery, Driver
+
+
+def percentile(latencies, fraction: float):
+    return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = "Serves the site with uvicorn once with the sync and once with the async views " \
+           "and compares their latency under many concurrent clients."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=50, help="Number of concurrent clients.")
+        parser.add_argument("--requests", type=int, default=20, help="Requests sent by every client.")
+        parser.add_argument("--path", default="/dashboard/", help="Page to request, e.g. /drivers-card/ or /offers-market.")
+        parser.add_argument("--threads", type=int, default=django_settings.ASYNC_VIEWS_THREADS,
+                            help="ASYNC_VIEWS_THREADS of the async run.")
+        parser.add_argument("--mode", choices=("both", "sync", "async"), default="both")
+
+    def create_fixtures(self, run_id):
+        user = User.objects.create_user(username=f"bench-{run_id}", password=uuid.uuid4().hex)
+        driver = Driver.objects.create(user=user, nick=user.username)
+        Delivery.objects.bulk_create([
+            Delivery(
+                driver=driver,
+                loading_city="Berlin",
+                loading_spedition="Benchmark",
+                unloading_city="Praha",
+                unloading_spedition="Benchmark",
+                cargo="Benchmark",
+                tonnage=10,
+                distance=350,
+                income=1000,
+                is_edited=False,
+            )
+            for _ in range(10)
+        ])
+        client = Client()
+        client.force_login(user)
+        return user, client.cookies[django_settings.SESSION_COOKIE_NAME].value
+
+    def start_server(self, port: int, async_views: bool, threads: int):
+        env = dict(os.environ, ASYNC_VIEWS="1" if async_views else "0", ASYNC_VIEWS_THREADS=str(threads))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "justdeliver.asgi:application", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning", "--app-dir", str(django_settings.BASE_DIR)],
+            env=env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("uvicorn exited before accepting connections.")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError("uvicorn did not start within 30 seconds.")
+
+    def run_load(self, url: str, session_cookie: str, clients: int, requests: int):
+        latencies, errors = [], {}
+        lock = threading.Lock()
+        headers = {"Cookie": f"{django_settings.SESSION_COOKIE_NAME}={session_cookie}"}
+
+        def fetch():
+            request = urllib.request.Request(url, headers=headers)
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as exception:
+                return exception.code
+            except (OSError, urllib.error.URLError) as exception:
+                return type(exception).__name__
+
+        def run_client():
+            for _ in range(requests):
+                started = time.monotonic()
+                status = fetch()
+                elapsed = time.monotonic() - started
+                with lock:
+                    if status == 200:
+                        latencies.append(elapsed)
+                    else:
+                        errors[status] = errors.get(status, 0) + 1
+
+        # a few requests first, so imports and the first connections are not measured
+        for _ in range(3):
+            fetch()
+        workers = [threading.Thread(target=run_client) for _ in range(clients)]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sorted(latencies), errors, time.monotonic() - started
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec("uvicorn") is None:
+            raise CommandError("The benchmark needs uvicorn (pip install uvicorn).")
+        if options["clients"] < 1 or options["requests"] < 1:
+            raise CommandError("At least one client sending at least one request is needed.")
+
+        modes = ("sync", "async") if options["mode"] == "both" else (options["mode"],)
+        user, session_cookie = self.create_fixtures(uuid.uuid4().hex[:8])
+        try:
+            for mode in modes:
+                port = get_free_port()
+                server = self.start_server(port, mode == "async", options["threads"])
+                try:
+                    latencies, errors, elapsed = self.run_load(
+                        f"http://127.0.0.1:{port}{options['path']}", session_cookie,
+                        options["clients"], options["requests"],
+                    )
+                finally:
+                    server.terminate()
+                    server.wait(timeout=30)
+
+                if latencies:
+                    self.stdout.write(
+                        f"{mode:>5}: {len(latencies) / elapsed:.1f} req/s, "
+                        f"p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+                        f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+                    )
+                else:
+                    self.stdout.write(f"{mode:>5}: no successful requests")
+                if errors:
+                    self.stdout.write("       failed: " + ", ".join(f"{status}: {count}" for status, count in sorted(errors.items(), key=str)))
+        finally:
+            User.objects.filter(id=user.id).delete()
@@ -0,0 +1,100 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+
+from system.models import Disposition, Driver, Offer
+
+
+class Command(BaseCommand):
+    help = "Hammers OffersMarket/AcceptOffer/<id> from many threads and reports throughput and double claims."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Number of concurrent drivers.")
+        parser.add_argument("--offers", type=int, default=50, help="Number of offers to fight over.")
+
+    def create_fixtures(self, run_id, threads, offers):
+        users = [
+            User.objects.create_user(username=f"bench-{run_id}-{i}", password=uuid.uuid4().hex)
+            for i in range(threads)
+        ]
+        for user in users:
+            Driver.objects.create(user=user, nick=user.username)
+        offer_ids = [
+            Offer.objects.create(
+                loading_city="Berlin",
+                loading_spedition="Benchmark",
+                unloading_city="Praha",
+                unloading_spedition="Benchmark",
+                # the cargo marks which offer a disposition was claimed from
+                cargo=f"bench-{run_id}-{i}",
+                tonnage=10,
+                income=1000,
+                distance=350,
+            ).id
+            for i in range(offers)
+        ]
+        return users, offer_ids
+
+    def handle(self, *args, **options):
+        if options["threads"] < 2 or options["offers"] < 1:
+            raise CommandError("The benchmark needs at least 2 threads and 1 offer.")
+
+        run_id = uuid.uuid4().hex[:8]
+        users, offer_ids = self.create_fixtures(run_id, options["threads"], options["offers"])
+        statuses = Counter()
+        statuses_lock = threading.Lock()
+        barrier = threading.Barrier(len(users))
+
+        def claim_offers(user):
+            client = Client(HTTP_HOST="localhost")
+            client.force_login(user)
+            local = Counter()
+            try:
+                for offer_id in offer_ids:
+                    # every driver goes for the same offer at the same moment
+                    barrier.wait()
+                    try:
+                        response = client.get(f"/OffersMarket/AcceptOffer/{offer_id}")
+                        local[response.status_code] += 1
+                    except Exception as exception:
+                        local[type(exception).__name__] += 1
+            finally:
+                with statuses_lock:
+                    statuses.update(local)
+                connection.close()
+
+        workers = [threading.Thread(target=claim_offers, args=(user,)) for user in users]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            claims = (
+                Disposition.objects.filter(cargo__startswith=f"bench-{run_id}-")
+                .values("cargo")
+                .annotate(claims=Count("id"))
+            )
+            claimed_offers = len(claims)
+            double_claims = sum(row["claims"] - 1 for row in claims if row["claims"] > 1)
+        finally:
+            Disposition.objects.filter(cargo__startswith=f"bench-{run_id}-").delete()
+            Offer.objects.filter(id__in=offer_ids).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        requests = sum(statuses.values())
+        self.stdout.write(f"{requests} requests in {elapsed:.2f} s ({requests / elapsed:.1f} req/s)")
+        self.stdout.write("Responses: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+        self.stdout.write(f"Claimed offers: {claimed_offers}/{len(offer_ids)}")
+        if double_claims:
+            raise CommandError(f"{double_claims} offers were claimed more than once.")
+        self.stdout.write(self.style.SUCCESS("No offer was claimed more than once."))
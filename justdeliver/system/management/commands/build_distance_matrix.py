@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from system.cities import get_distances_path, load_catalog, save_distance_matrix
+
+
+class Command(BaseCommand):
+    help = "Precomputes the city-to-city road distance matrix for the current cities.json."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild the matrix even if it matches the current cities.json.",
+        )
+
+    def handle(self, *args, **options):
+        catalog = load_catalog()
+        if catalog.distances is not None and not options["force"]:
+            self.stdout.write("Distance matrix is up to date with cities.json.")
+            return
+        distances = save_distance_matrix(catalog)
+        reachable = (distances > 0).sum()
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {distances.shape[0]}x{distances.shape[1]} distance matrix to {get_distances_path()} "
+            f"({reachable} connected city pairs)."
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from system.models import ScreenshotBlob
+
+
+class Command(BaseCommand):
+    help = "Computes the perceptual hash of stored screenshots that do not have one yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Hand the screenshots over to the huey workers instead of hashing them here.",
+        )
+
+    def handle(self, *args, **options):
+        blob_ids = list(ScreenshotBlob.objects.filter(dhash__isnull=True).values_list("id", flat=True))
+        failed = 0
+        for blob_id in blob_ids:
+            if options["enqueue"]:
+                ScreenshotBlob.compute_perceptual_hash(blob_id)
+                continue
+            try:
+                ScreenshotBlob.compute_perceptual_hash.call_local(blob_id)
+            except OSError as exception:
+                failed += 1
+                self.stderr.write(f"Screenshot {blob_id}: {exception}")
+        action = "Enqueued" if options["enqueue"] else "Hashed"
+        self.stdout.write(self.style.SUCCESS(f"{action} {len(blob_ids) - failed} screenshots."))
@@ -0,0 +1,82 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from system.models import (
+    Company,
+    CompanyDirectorySnapshot,
+    Delivery,
+    Disposition,
+    Driver,
+    DriverStats,
+    Employee,
+    Offer,
+    ScreenshotBlob,
+    Vehicle,
+)
+
+
+def get_hot_queries():
+    # the lookups run against ids that don't exist, only their query plans matter
+    driver = Driver(id=0)
+    employee = Employee(id=0, driver=driver)
+    return {
+        "recent deliveries": lambda: Delivery.get_last_deliveries_for_driver(driver),
+        "last delivery date": lambda: Delivery.get_driver_last_delivery_date(driver),
+        "driver deliveries": lambda: list(Delivery.get_all_driver_deliveries(driver)[:10]),
+        "delivery by key": lambda: Delivery.objects.filter(delivery_key=uuid.uuid4()).first(),
+        "driver statistics": lambda: DriverStats.objects.filter(driver=driver).first(),
+        "current disposition": lambda: Disposition.get_disposition_for_driver(driver),
+        "unaccepted dispositions": lambda: list(Disposition.get_unaccepted_dispositions(driver)),
+        "driver vehicle": lambda: Vehicle.get_vehicle_for_driver(driver=driver),
+        "employee vehicle": lambda: Vehicle.get_vehicle_for_driver(employee=employee),
+        "offers market": lambda: list(Offer.get_offers()[:10]),
+        "offers by trailer": lambda: list(Offer.get_filtered_offers("Plandeka")[:10]),
+        "expired offers": lambda: list(Offer.objects.filter(expires_at__lte=timezone.now()).values_list("id")[:10]),
+        "company statistics": lambda: Company.get_companies_statistics([0]),
+        "company directory": lambda: list(CompanyDirectorySnapshot.get_directory("distance")[:10]),
+        "screenshot by content": lambda: ScreenshotBlob.get_known_hashes(["0" * 64]),
+        "similar screenshots": lambda: ScreenshotBlob(id=0, dhash=0).find_similar(),
+    }
+
+
+def find_unindexed_steps(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        plan = [row[-1] for row in cursor.fetchall()]
+    scans = [
+        detail for detail in plan
+        if detail.startswith("SCAN") and "USING" not in detail and "CONSTANT ROW" not in detail
+        # a sort means every matching row is read before the first one is returned
+        or detail == "USE TEMP B-TREE FOR ORDER BY"
+    ]
+    return plan, scans
+
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN QUERY PLAN on the hot model queries and fails if any of them is a full table scan " \
+           "or sorts its rows instead of reading them in index order."
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Query plans can be checked only on SQLite databases.")
+
+        failures = []
+        for name, run_query in get_hot_queries().items():
+            with CaptureQueriesContext(connection) as context:
+                run_query()
+            for query in context.captured_queries:
+                plan, scans = find_unindexed_steps(query["sql"])
+                if scans:
+                    failures.append(name)
+                    self.stderr.write(f"{name}: not index-backed ({'; '.join(scans)})")
+                    self.stderr.write(f"    {query['sql']}")
+                elif options["verbosity"] > 1:
+                    self.stdout.write(f"{name}: {'; '.join(plan)}")
+
+        if failures:
+            raise CommandError(f"{len(failures)} hot queries degrade to a full table scan or a sort.")
+        self.stdout.write(self.style.SUCCESS("All hot queries use indexes."))
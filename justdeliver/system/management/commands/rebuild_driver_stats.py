@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from system.models import DriverStats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-driver statistics ledger from accepted deliveries and checks it against live aggregates."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the ledger with live aggregates, without rebuilding it.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            DriverStats.rebuild_all()
+            self.stdout.write(f"Rebuilt statistics for {DriverStats.objects.count()} drivers.")
+
+        mismatches = DriverStats.find_mismatches()
+        for driver_id, field, ledger_value, live_value in mismatches:
+            self.stderr.write(f"Driver {driver_id}: {field} is {ledger_value} in ledger, {live_value} in deliveries.")
+        if mismatches:
+            raise CommandError(f"Statistics ledger has {len(mismatches)} mismatches.")
+        self.stdout.write(self.style.SUCCESS("Statistics ledger matches accepted deliveries."))
@@ -0,0 +1,154 @@
+import math
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from system.models import Driver, TelemetrySample, TelemetryToken
+from system.telemetry import encode_batch
+
+
+class FakeDesktop:
+    """
+    Imitates JustDeliver Desktop: a truck driving in circles, sampled several times per second.
+    """
+
+    def __init__(self, token: str, samples_per_batch: int, sample_interval_ms: int):
+        self.token = token
+        self.session = uuid.uuid4().hex
+        self.samples_per_batch = samples_per_batch
+        self.sample_interval_ms = sample_interval_ms
+        self.seq = 0
+        self.angle = random.random() * math.tau
+        self.odometer = random.random() * 100000
+        self.clock = int(time.time() * 1000)
+
+    def next_batch(self):
+        samples = []
+        for _ in range(self.samples_per_batch):
+            speed = 60 + 30 * math.sin(self.seq / 50)
+            self.angle += 0.001
+            self.odometer += speed * self.sample_interval_ms / 3600000
+            self.clock += self.sample_interval_ms
+            samples.append({
+                "seq": self.seq,
+                "t": self.clock,
+                "x": 10000 * math.cos(self.angle),
+                "y": 50.0,
+                "z": 10000 * math.sin(self.angle),
+                "speed": round(speed, 2),
+                "rpm": int(1100 + speed * 4),
+                "gear": min(12, int(speed // 8) + 1),
+                "fuel": 600 - self.seq * 0.01,
+                "odometer": round(self.odometer, 3),
+                "damage": 0.0,
+            })
+            self.seq += 1
+        return encode_batch(samples)
+
+
+class Command(BaseCommand):
+    help = "Simulates many JustDeliver Desktop clients posting gzip NDJSON telemetry and reports ingestion throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=100, help="Number of simulated desktop clients.")
+        parser.add_argument("--duration", type=float, default=30, help="Test length in seconds.")
+        parser.add_argument("--interval", type=float, default=2, help="Seconds between two batches of one client.")
+        parser.add_argument("--samples", type=int, default=20, help="Samples per batch.")
+        parser.add_argument(
+            "--url",
+            help="Ingestion URL of a running server, e.g. http://localhost:8000/api/Telemetry/ingest. "
+                 "Without it the requests go through the Django test client in this process.",
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep the fake drivers and their samples.")
+
+    def create_clients(self, run_id, count, samples, interval):
+        clients = []
+        for i in range(count):
+            user = User.objects.create_user(username=f"telemetry-{run_id}-{i}", password=uuid.uuid4().hex)
+            driver = Driver.objects.create(user=user, nick=user.username)
+            desktop = FakeDesktop(TelemetryToken.issue(driver), samples, max(int(interval * 1000 / samples), 1))
+            clients.append((user, desktop))
+        return clients
+
+    def handle(self, *args, **options):
+        if options["clients"] < 1 or options["samples"] < 1:
+            raise CommandError("At least one client posting at least one sample is needed.")
+
+        run_id = uuid.uuid4().hex[:8]
+        clients = self.create_clients(run_id, options["clients"], options["samples"], options["interval"])
+        latencies, statuses = [], {}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def post(body, desktop):
+            headers = {
+                "Authorization": f"Token {desktop.token}",
+                "Content-Encoding": "gzip",
+                "Content-Type": "application/x-ndjson",
+                "X-Telemetry-Session": desktop.session,
+            }
+            if not options["url"]:
+                client = Client(HTTP_HOST="localhost")
+                return client.generic(
+                    "POST", "/api/Telemetry/ingest", body, content_type="application/x-ndjson",
+                    HTTP_AUTHORIZATION=headers["Authorization"], HTTP_CONTENT_ENCODING="gzip",
+                    HTTP_X_TELEMETRY_SESSION=desktop.session).status_code
+            request = urllib.request.Request(options["url"], data=body, headers=headers, method="POST")
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    return response.status
+            except urllib.error.HTTPError as exception:
+                return exception.code
+
+        def run_client(desktop):
+            # clients start spread over one interval, like real desktops do
+            time.sleep(random.random() * options["interval"])
+            try:
+                while time.monotonic() < deadline:
+                    started = time.monotonic()
+                    try:
+                        status = post(desktop.next_batch(), desktop)
+                    except (OSError, urllib.error.URLError) as exception:
+                        status = type(exception).__name__
+                    elapsed = time.monotonic() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses[status] = statuses.get(status, 0) + 1
+                    time.sleep(max(options["interval"] - elapsed, 0))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=run_client, args=(desktop,)) for _, desktop in clients]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        driver_ids = Driver.objects.filter(user__in=[user for user, _ in clients]).values_list("id", flat=True)
+        stored = TelemetrySample.objects.filter(driver_id__in=list(driver_ids)).count()
+        if not options["keep"]:
+            User.objects.filter(id__in=[user.id for user, _ in clients]).delete()
+
+        requests = sum(statuses.values())
+        self.stdout.write(f"{requests} batches in {elapsed:.1f} s ({requests / elapsed:.1f} req/s)")
+        self.stdout.write(f"{stored} samples stored ({stored / elapsed:.0f} samples/s)")
+        if latencies:
+            latencies.sort()
+            self.stdout.write(
+                f"Latency: median {statistics.median(latencies) * 1000:.1f} ms, "
+                f"p95 {latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000:.1f} ms"
+            )
+        self.stdout.write("Responses: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+        if any(status != 202 for status in statuses):
+            raise CommandError("Some telemetry batches were not accepted.")
@@ -0,0 +1,45 @@
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from .models import Driver
+
+
+class DriverContext:
+    def __init__(self, driver: Driver = None):
+        self.driver = driver
+        self.employee = driver.employment if driver else None
+        self.company = self.employee.company if self.employee else None
+
+    @property
+    def is_employed(self):
+        return self.employee is not None
+
+    @property
+    def job_title(self):
+        if self.employee:
+            return self.employee.job_title
+        return None
+
+    @property
+    def has_speditor_permissions(self):
+        if self.employee:
+            return self.employee.check_speditor_permissions()
+        return self.driver is not None
+
+
+def get_driver_context(request):
+    if not request.user.is_authenticated:
+        return DriverContext()
+    driver = Driver.objects.select_related("employee__company").filter(user=request.user).first()
+    return DriverContext(driver)
+
+
+class DriverContextMiddleware(MiddlewareMixin):
+    """
+    Resolves the logged in driver with their employment and company once per request
+    and exposes it as request.driver_ctx. The lookup runs on first access only.
+    Works in async mode too, so the async views are not pushed back into a sync thread;
+    they have to resolve the context with run_sync before touching it.
+    """
+    def process_request(self, request):
+        request.driver_ctx = SimpleLazyObject(lambda: get_driver_context(request))
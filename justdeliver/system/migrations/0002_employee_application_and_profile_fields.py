@@ -0,0 +1,116 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='vehicle',
+            name='owner',
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='has_week_limit',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='is_realistic',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='social_media_url',
+            field=models.URLField(default=''),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='accepted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='reason',
+            field=models.CharField(blank=True, max_length=2048),
+        ),
+        migrations.AddField(
+            model_name='disposition',
+            name='is_accepted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='driver',
+            name='email_confirmed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='company_owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='system.company'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='driver_owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='driver_owner', to='system.employee'),
+        ),
+        migrations.AlterField(
+            model_name='company',
+            name='logo',
+            field=models.ImageField(blank=True, upload_to='logos'),
+        ),
+        migrations.AlterField(
+            model_name='driver',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to='avatars'),
+        ),
+        migrations.AlterField(
+            model_name='employee',
+            name='company',
+            field=models.ForeignKey(blank=True, on_delete=django.db.models.deletion.CASCADE, to='system.company'),
+        ),
+        migrations.AlterField(
+            model_name='employee',
+            name='job_title',
+            field=models.CharField(choices=[('owner', 'Właściciel'), ('speditor', 'Spedytor'), ('driver', 'Kierowca')], default='driver', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='offer',
+            name='trailer',
+            field=models.CharField(blank=True, choices=[('Plandeka', 'curtain'), ('Chłodnia', 'reefer'), ('Niskopodłogowa', 'flatbed'), ('Kłonicowa', 'logger'), ('Wywrotka', 'tipper'), ('Kontener', 'container')], max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='cabin',
+            field=models.CharField(max_length=32),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='chassis',
+            field=models.CharField(default='4x2', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='driver',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='system.driver'),
+        ),
+        migrations.CreateModel(
+            name='EmployeeApplication',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dlc', models.CharField(blank=True, default='', max_length=512)),
+                ('social_media_url', models.URLField(default='')),
+                ('reason', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('Zaakceptowane', 'accepted'), ('Odrzucone', 'rejected'), ('Wysłane', 'sent')], default='Wysłana', max_length=16)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='system.company')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='system.driver')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0002_employee_application_and_profile_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.PositiveBigIntegerField(default=0)),
+                ('tonnage', models.PositiveBigIntegerField(default=0)),
+                ('deliveries_count', models.PositiveIntegerField(default=0)),
+                ('income', models.PositiveBigIntegerField(default=0)),
+                ('driver', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='system.driver')),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0003_driver_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyDirectorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.PositiveBigIntegerField(default=0)),
+                ('tonnage', models.PositiveBigIntegerField(default=0)),
+                ('deliveries_count', models.PositiveIntegerField(default=0)),
+                ('total_income', models.PositiveBigIntegerField(default=0)),
+                ('drivers_count', models.PositiveIntegerField(default=0)),
+                ('is_stale', models.BooleanField(default=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='directory_snapshot', to='system.company')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='companydirectorysnapshot',
+            index=models.Index(fields=['distance', 'id'], name='directory_distance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companydirectorysnapshot',
+            index=models.Index(fields=['total_income', 'id'], name='directory_income_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companydirectorysnapshot',
+            index=models.Index(fields=['drivers_count', 'id'], name='directory_drivers_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companydirectorysnapshot',
+            index=models.Index(fields=['is_stale'], name='directory_stale_idx'),
+        ),
+    ]
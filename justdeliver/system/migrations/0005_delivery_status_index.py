@@ -0,0 +1,17 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0004_company_directory_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['driver', 'is_edited', 'status', '-created_at'], name='delivery_driver_status_idx'),
+        ),
+    ]
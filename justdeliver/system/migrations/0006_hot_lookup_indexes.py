@@ -0,0 +1,62 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+STATUS_PRIORITY = ('Odrzucona', 'Do poprawy', 'Wysłana', 'Zaakceptowana')
+
+
+def fill_status_priority(apps, schema_editor):
+    Delivery = apps.get_model('system', 'Delivery')
+    for priority, status in enumerate(STATUS_PRIORITY):
+        Delivery.objects.filter(status=status).update(status_priority=priority)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0005_delivery_status_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='status_priority',
+            field=models.PositiveSmallIntegerField(default=2, editable=False),
+        ),
+        migrations.RunPython(fill_status_priority, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='delivery',
+            name='delivery_driver_status_idx',
+        ),
+        migrations.AlterField(
+            model_name='delivery',
+            name='driver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='system.driver'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(condition=models.Q(('is_edited', False)), fields=['driver', 'status_priority', '-created_at'], name='delivery_driver_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['driver', '-created_at'], name='delivery_driver_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_key'], name='delivery_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='disposition',
+            index=models.Index(fields=['driver', 'is_accepted'], name='disposition_driver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['-created_at'], name='offer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['trailer', '-created_at'], name='offer_trailer_created_idx'),
+        ),
+    ]
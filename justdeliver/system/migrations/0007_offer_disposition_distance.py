@@ -0,0 +1,23 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0006_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disposition',
+            name='distance',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='offer',
+            name='distance',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
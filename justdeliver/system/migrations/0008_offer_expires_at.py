@@ -0,0 +1,23 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import system.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0007_offer_disposition_distance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offer',
+            name='expires_at',
+            field=models.DateTimeField(default=system.models.get_offer_expiry),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['expires_at'], name='offer_expires_idx'),
+        ),
+    ]
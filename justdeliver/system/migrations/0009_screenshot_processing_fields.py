@@ -0,0 +1,60 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+def mark_existing_ready(apps, schema_editor):
+    # screenshots uploaded before the spool were stored during the request
+    DeliveryScreenshot = apps.get_model('system', 'DeliveryScreenshot')
+    DeliveryScreenshot.objects.update(status='Gotowy')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0008_offer_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryscreenshot',
+            name='error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='deliveryscreenshot',
+            name='height',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='deliveryscreenshot',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='deliveryscreenshot',
+            name='size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='deliveryscreenshot',
+            name='spool_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='deliveryscreenshot',
+            name='status',
+            field=models.CharField(choices=[('Przetwarzany', 'processing'), ('Gotowy', 'ready'), ('Odrzucony', 'rejected')], default='Przetwarzany', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='deliveryscreenshot',
+            name='width',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='deliveryscreenshot',
+            name='screenshot',
+            field=models.ImageField(blank=True, upload_to='waybills/'),
+        ),
+        migrations.RunPython(mark_existing_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0010_screenshot_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='ocr_fields',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='ocr_mismatches',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
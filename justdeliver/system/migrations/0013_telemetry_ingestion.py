@@ -0,0 +1,49 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0012_screenshot_blob_dhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_hash', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+                ('driver', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_token', to='system.driver')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TelemetrySample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField()),
+                ('recorded_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('x', models.FloatField()),
+                ('y', models.FloatField()),
+                ('z', models.FloatField()),
+                ('speed', models.FloatField()),
+                ('rpm', models.IntegerField(default=0)),
+                ('gear', models.SmallIntegerField(default=0)),
+                ('fuel', models.FloatField(default=0)),
+                ('odometer', models.FloatField(default=0)),
+                ('cargo_damage', models.FloatField(default=0)),
+                ('event', models.CharField(blank=True, max_length=32)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('driver', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='system.driver')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='telemetrysample',
+            constraint=models.UniqueConstraint(fields=('driver', 'seq'), name='telemetry_driver_seq_unique'),
+        ),
+    ]
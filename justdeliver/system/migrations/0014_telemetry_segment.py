@@ -0,0 +1,32 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0013_telemetry_ingestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetrySegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_seq', models.BigIntegerField()),
+                ('end_seq', models.BigIntegerField()),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField()),
+                ('file', models.CharField(max_length=255)),
+                ('delivery', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='system.delivery')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='system.driver')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='telemetrysegment',
+            index=models.Index(fields=['driver', 'started_at'], name='segment_driver_started_idx'),
+        ),
+    ]
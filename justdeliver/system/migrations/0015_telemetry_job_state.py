@@ -0,0 +1,59 @@
+# Generated by Django 4.0.7 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0014_telemetry_segment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='disposition',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='system.disposition'),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='telemetry_end_seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='telemetry_start_seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='TelemetryJobState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('Wolny', 'idle'), ('W trasie', 'on_job')], default='Wolny', max_length=16)),
+                ('last_seq', models.BigIntegerField(default=-1)),
+                ('start_odometer', models.FloatField(default=0)),
+                ('last_odometer', models.FloatField(default=0)),
+                ('last_fuel', models.FloatField(blank=True, null=True)),
+                ('fuel_used', models.FloatField(default=0)),
+                ('max_damage', models.FloatField(default=0)),
+                ('delivery', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='system.delivery')),
+                ('driver', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_state', to='system.driver')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TelemetrySession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('seq_offset', models.BigIntegerField()),
+                ('end_seq', models.BigIntegerField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='system.driver')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='telemetrysession',
+            constraint=models.UniqueConstraint(fields=('driver', 'key'), name='telemetry_session_unique'),
+        ),
+    ]
@@ -1,19 +1,38 @@
-import json
-import os
-from random import randrange
 from typing import Dict, Any
 from uuid import uuid4
+import asyncio
 import datetime
+import os
+import secrets
+import numpy as np
 from django.conf import settings as django_settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Sum, Q
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, models, transaction
+from django.db.models import Sum, Q, F, Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 
 from huey import crontab
 from huey.contrib import djhuey as huey
 
+from . import fleet, ocr, perceptual, segments, telemetry
+from .cities import CityCatalog, get_catalog
+from .concurrency import run_sync
+from .derivatives import generate_derivatives
+from .recommendations import invalidate_market, rank_offers
+from .screenshots import (
+    ScreenshotRejected,
+    discard_spooled,
+    get_content_address,
+    inspect_image,
+    move_to_storage,
+    spool_upload,
+)
+
 
 class Driver(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -22,93 +41,121 @@ class Driver(models.Model):
     email_confirmed = models.BooleanField(default=False)
 
     @property
-    def is_employed(self):
+    def employment(self):
+        # the reverse one-to-one is cached on the instance (also when loaded with select_related)
         try:
-            Employee.objects.get(driver=self)
-            return True
+            return self.employee
         except Employee.DoesNotExist:
-            return False
+            return None
+
+    @property
+    def is_employed(self):
+        return self.employment is not None
 
     @property
     def company(self):
         if self.is_employed:
-            return Employee.objects.get(driver=self).company
+            return self.employment.company
         return None
 
     @property
     def company_name(self):
         if self.is_employed:
-            return Employee.objects.get(driver=self).company.name
+            return self.employment.company.name
         return None
 
     @property
     def job_title(self):
         if self.is_employed:
-            return Employee.objects.get(driver=self).job_title
+            return self.employment.job_title
         return None
 
+    @property
+    def statistics_ledger(self):
+        try:
+            return self.stats
+        except DriverStats.DoesNotExist:
+            self.stats = DriverStats.rebuild_for_driver(self.id)
+            return self.stats
+
     @property
     def distance(self):
-        distance = Delivery.get_driver_distance(self)
-        return distance
+        return self.statistics_ledger.distance
 
     @property
     def tonnage(self):
-        tonnage = Delivery.objects.filter(driver=self, is_edited=False, status="Zaakceptowana").aggregate(Sum('tonnage'))
-        return tonnage
+        return self.statistics_ledger.tonnage
 
     @property
     def deliveries_count(self):
-        deliveries_count = Delivery.objects.filter(driver=self, is_edited=False, status="Zaakceptowana").count()
-        return deliveries_count
+        return self.statistics_ledger.deliveries_count
 
     @property
     def total_income(self):
-        total_income = Delivery.objects.filter(driver=self, is_edited=False, status="Zaakceptowana").aggregate(Sum('income'))
-        return total_income
+        return self.statistics_ledger.income
 
     @property
     def has_speditor_permissions(self):
         has_speditor_permissions = False
         if self.is_employed:
-            employee = Employee.objects.get(driver=self)
-            has_speditor_permissions = employee.check_speditor_permissions()
+            has_speditor_permissions = self.employment.check_speditor_permissions()
         elif not self.is_employed:
             has_speditor_permissions = True
         return has_speditor_permissions
 
     def get_statistics(self):
+        ledger = self.statistics_ledger
         statistics: dict[str, int] = {
-            'distance': self.distance,
-            'tonnage': self.tonnage,
-            'deliveries_count': self.deliveries_count,
-            'income': self.total_income
+            'distance': ledger.distance,
+            'tonnage': ledger.tonnage,
+            'deliveries_count': ledger.deliveries_count,
+            'income': ledger.income
         }
         return statistics
 
-    def get_driver_info(self):
+    def get_driver_info_loaders(self, last_deliveries_limit: int = 5):
+        """
+        The parts of the driver info needing a query each, independent of one another.
+        """
         if self.is_employed:
-            employee = Employee.objects.get(driver=self)
-            job_title = employee.get_job_title_display()
-            vehicle = Vehicle.get_vehicle_for_driver(employee=employee)
+            employee = self.employment
+            load_vehicle = lambda: Vehicle.get_vehicle_for_driver(employee=employee)
         else:
-            job_title = "Wolny kierowca"
-            vehicle = Vehicle.get_vehicle_for_driver(driver=self)
+            load_vehicle = lambda: Vehicle.get_vehicle_for_driver(driver=self)
+        return {
+            'statistics': self.get_statistics,
+            'disposition': lambda: Disposition.get_disposition_for_driver(self),
+            'vehicle': load_vehicle,
+            'last_deliveries': lambda: Delivery.get_last_deliveries_for_driver(self, last_deliveries_limit),
+        }
+
+    def get_driver_info_header(self):
         info: dict[Any, Any] = {
             'id': self.id,
             'avatar': self.avatar,
             'nick': self.nick,
-            'statistics': self.get_statistics(),
-            'job_title': job_title,
-            'disposition': Disposition.get_disposition_for_driver(self),
-            'vehicle': vehicle,
-            'last_deliveries': Delivery.get_last_deliveries_for_driver(self),
+            'job_title': self.employment.get_job_title_display() if self.is_employed else "Wolny kierowca",
         }
         return info
 
+    def get_driver_info(self, last_deliveries_limit: int = 5):
+        info = self.get_driver_info_header()
+        for key, load in self.get_driver_info_loaders(last_deliveries_limit).items():
+            info[key] = load()
+        return info
+
+    async def aget_driver_info(self, last_deliveries_limit: int = 5):
+        # same as get_driver_info, with the queries running side by side in the view thread pool;
+        # the employment may not be loaded yet, so even the header is built off the event loop
+        info, loaders = await run_sync(
+            lambda: (self.get_driver_info_header(), self.get_driver_info_loaders(last_deliveries_limit)))
+        results = await asyncio.gather(*(run_sync(load) for load in loaders.values()))
+        info.update(zip(loaders.keys(), results))
+        return info
+
     @staticmethod
     def get_driver_by_user_profile(user: User):
-        driver = Driver.objects.get(user=user)
+        driver = Driver.objects.select_related("employee__company").get(user=user)
         return driver
 
     @staticmethod
@@ -131,6 +178,102 @@ class Driver(models.Model):
         return self.nick
 
 
+class DriverStats(models.Model):
+    driver = models.OneToOneField(Driver, on_delete=models.CASCADE, related_name="stats")
+    distance = models.PositiveBigIntegerField(default=0)
+    tonnage = models.PositiveBigIntegerField(default=0)
+    deliveries_count = models.PositiveIntegerField(default=0)
+    income = models.PositiveBigIntegerField(default=0)
+
+    @staticmethod
+    def get_live_statistics(driver_ids=None):
+        deliveries = Delivery.objects.filter(is_edited=False, status="Zaakceptowana")
+        if driver_ids is not None:
+            deliveries = deliveries.filter(driver_id__in=driver_ids)
+        rows = deliveries.values("driver_id").annotate(
+            distance=Sum("distance"),
+            tonnage=Sum("tonnage"),
+            deliveries_count=Count("id"),
+            income=Sum("income"),
+        ).order_by()
+        return {row.pop("driver_id"): row for row in rows}
+
+    @staticmethod
+    def rebuild_for_driver(driver_id: int):
+        statistics = DriverStats.get_live_statistics([driver_id]).get(driver_id, {})
+        stats, _ = DriverStats.objects.update_or_create(
+            driver_id=driver_id,
+            defaults={
+                "distance": statistics.get("distance") or 0,
+                "tonnage": statistics.get("tonnage") or 0,
+                "deliveries_count": statistics.get("deliveries_count") or 0,
+                "income": statistics.get("income") or 0,
+            }
+        )
+        return stats
+
+    @staticmethod
+    def rebuild_all():
+        statistics = DriverStats.get_live_statistics()
+        with transaction.atomic():
+            DriverStats.objects.all().delete()
+            DriverStats.objects.bulk_create([
+                DriverStats(
+                    driver_id=driver_id,
+                    distance=statistics.get(driver_id, {}).get("distance") or 0,
+                    tonnage=statistics.get(driver_id, {}).get("tonnage") or 0,
+                    deliveries_count=statistics.get(driver_id, {}).get("deliveries_count") or 0,
+                    income=statistics.get(driver_id, {}).get("income") or 0,
+                ) for driver_id in Driver.objects.values_list("id", flat=True)
+            ], batch_size=500)
+
+    @staticmethod
+    def find_mismatches():
+        statistics = DriverStats.get_live_statistics()
+        mismatches = []
+        for stats in DriverStats.objects.all():
+            live = statistics.pop(stats.driver_id, {})
+            for field in ("distance", "tonnage", "deliveries_count", "income"):
+                if getattr(stats, field) != (live.get(field) or 0):
+                    mismatches.append((stats.driver_id, field, getattr(stats, field), live.get(field) or 0))
+        # drivers with accepted deliveries but without a ledger row at all
+        for driver_id, live in statistics.items():
+            mismatches.append((driver_id, "deliveries_count", None, live.get("deliveries_count")))
+        return mismatches
+
+    @staticmethod
+    def record_change(old_entry, new_entry):
+        """
+        Moves a delivery's contribution between ledger rows. Entries are the
+        (driver_id, distance, tonnage, income) tuples from Delivery.get_ledger_entry,
+        or None for deliveries that are not counted.
+        """
+        changes = {}
+        for entry, sign in ((old_entry, -1), (new_entry, 1)):
+            if entry:
+                driver_id, distance, tonnage, income = entry
+                delta = changes.setdefault(driver_id, [0, 0, 0, 0])
+                delta[0] += sign * distance
+                delta[1] += sign * tonnage
+                delta[2] += sign
+                delta[3] += sign * income
+        for driver_id, (distance, tonnage, deliveries_count, income) in changes.items():
+            updated = DriverStats.objects.filter(driver_id=driver_id).update(
+                distance=F("distance") + distance,
+                tonnage=F("tonnage") + tonnage,
+                deliveries_count=F("deliveries_count") + deliveries_count,
+                income=F("income") + income,
+            )
+            if not updated:
+                # no ledger row yet, so the aggregates already include this change
+                DriverStats.rebuild_for_driver(driver_id)
+        if changes:
+            CompanyDirectorySnapshot.mark_stale_for_drivers(changes.keys())
+
+    def __str__(self):
+        return f"Statystyki: {self.driver}"
+
+
 class Company(models.Model):
     name = models.CharField(max_length=128)
     logo = models.ImageField(upload_to='logos', blank=True)
@@ -140,50 +283,17 @@ class Company(models.Model):
     is_realistic = models.BooleanField(default=False)
     has_week_limit = models.BooleanField(default=False)
 
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        if is_new:
+            # a new company is listed in the directory at once, its statistics follow with the next refresh
+            CompanyDirectorySnapshot.objects.get_or_create(company=self)
+
     @property
     def drivers_list(self):
         return Employee.objects.filter(company=self)
 
-    @property
-    def company_distance(self):
-        employees = self.drivers_list
-        distance = 0
-        for employee in employees:
-            distance += Delivery.get_driver_distance(employee.driver)
-        return distance
-
-    @property
-    def company_tonnage(self):
-        employees = self.drivers_list
-        tonnage = 0
-        for employee in employees:
-            employee_tonnage = Delivery.objects.filter(driver=employee.driver, is_edited=False, status="Zaakceptowana").aggregate(
-                Sum('tonnage')).get("tonnage__sum")
-            if employee_tonnage:
-                tonnage += employee_tonnage
-        return tonnage
-
-    @property
-    def company_deliveries_count(self):
-        employees = self.drivers_list
-        deliveries_count = 0
-        for employee in employees:
-            employee_deliveries_count = Delivery.objects.filter(driver=employee.driver, is_edited=False, status="Zaakceptowana").count()
-            if employee_deliveries_count:
-                deliveries_count += employee_deliveries_count
-        return deliveries_count
-
-    @property
-    def company_total_income(self):
-        employees = self.drivers_list
-        total_income = 0
-        for employee in employees:
-            employee_total_income = Delivery.objects.filter(driver=employee.driver, is_edited=False, status="Zaakceptowana").aggregate(
-                Sum('income')).get("income__sum")
-            if employee_total_income:
-                total_income += employee_total_income
-        return total_income
-
     @property
     def drivers_count(self):
         return Employee.objects.filter(company=self).count()
@@ -193,13 +303,30 @@ class Company(models.Model):
         return Vehicle.objects.filter(company_owner=self)
 
     def get_company_statistics(self):
+        return Company.get_companies_statistics([self.id])[self.id]
+
+    @staticmethod
+    def get_companies_statistics(company_ids):
+        accepted = Q(driver__delivery__is_edited=False, driver__delivery__status="Zaakceptowana")
+        rows = Employee.objects.filter(company_id__in=company_ids).values("company_id").annotate(
+            distance=Sum("driver__delivery__distance", filter=accepted),
+            tonnage=Sum("driver__delivery__tonnage", filter=accepted),
+            deliveries_count=Count("driver__delivery", filter=accepted),
+            total_income=Sum("driver__delivery__income", filter=accepted),
+            drivers_count=Count("id", distinct=True),
+        ).order_by()
         statistics = {
-            "distance": self.company_distance,
-            "tonnage": self.company_tonnage,
-            "deliveries_count": self.company_deliveries_count,
-            "total_income": self.company_total_income,
-            "drivers_count": self.drivers_count,
+            company_id: {
+                "distance": 0,
+                "tonnage": 0,
+                "deliveries_count": 0,
+                "total_income": 0,
+                "drivers_count": 0,
+            } for company_id in company_ids
         }
+        for row in rows:
+            company_id = row.pop("company_id")
+            statistics[company_id] = {key: value or 0 for key, value in row.items()}
         return statistics
 
 
@@ -209,7 +336,9 @@ class Company(models.Model):
             return vehicles
         return None
 
-    def get_company_info(self):
+    def get_company_info(self, statistics=None):
+        if statistics is None:
+            statistics = self.get_company_statistics()
         info = {
             "company_id": self.id,
             "name": self.name,
@@ -218,7 +347,7 @@ class Company(models.Model):
             "description": self.description,
             "is_realistic": self.is_realistic,
             "has_week_limit": self.has_week_limit,
-            "statistics": self.get_company_statistics(),
+            "statistics": statistics,
             "drivers": self.drivers_list,
         }
         return info
@@ -234,10 +363,9 @@ class Company(models.Model):
     @staticmethod
     def get_all_companies():
         try:
-            companies_list = []
-            companies = Company.objects.all()
-            for company in companies:
-                companies_list.append(company.get_company_info())
+            companies = list(Company.objects.all())
+            statistics = Company.get_companies_statistics([company.id for company in companies])
+            companies_list = [company.get_company_info(statistics[company.id]) for company in companies]
             return companies_list
         except ValueError:
             return {"error": "Brak firm, które można byłoby wyświetlić."}
@@ -249,6 +377,94 @@ class Company(models.Model):
     def __str__(self):
         return self.name
 
+
+class CompanyDirectorySnapshot(models.Model):
+    SORTING = {
+        "distance": ("-distance", "-id"),
+        "income": ("-total_income", "-id"),
+        "drivers": ("-drivers_count", "-id"),
+    }
+    REFRESH_BATCH_SIZE = 200
+
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, related_name="directory_snapshot")
+    distance = models.PositiveBigIntegerField(default=0)
+    tonnage = models.PositiveBigIntegerField(default=0)
+    deliveries_count = models.PositiveIntegerField(default=0)
+    total_income = models.PositiveBigIntegerField(default=0)
+    drivers_count = models.PositiveIntegerField(default=0)
+    is_stale = models.BooleanField(default=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["distance", "id"], name="directory_distance_idx"),
+            models.Index(fields=["total_income", "id"], name="directory_income_idx"),
+            models.Index(fields=["drivers_count", "id"], name="directory_drivers_idx"),
+            models.Index(fields=["is_stale"], name="directory_stale_idx"),
+        ]
+
+    @property
+    def statistics(self):
+        return {
+            "distance": self.distance,
+            "tonnage": self.tonnage,
+            "deliveries_count": self.deliveries_count,
+            "total_income": self.total_income,
+            "drivers_count": self.drivers_count,
+        }
+
+    @staticmethod
+    def get_directory(sort: str = "distance"):
+        ordering = CompanyDirectorySnapshot.SORTING.get(sort, CompanyDirectorySnapshot.SORTING["distance"])
+        return CompanyDirectorySnapshot.objects.select_related("company").order_by(*ordering)
+
+    @staticmethod
+    def mark_stale(company_ids):
+        CompanyDirectorySnapshot.objects.filter(company_id__in=company_ids).update(is_stale=True)
+
+    @staticmethod
+    def mark_stale_for_drivers(driver_ids):
+        company_ids = Employee.objects.filter(driver_id__in=driver_ids).values("company_id")
+        CompanyDirectorySnapshot.objects.filter(company_id__in=company_ids).update(is_stale=True)
+
+    @staticmethod
+    def refresh_stale_snapshots():
+        missing = Company.objects.filter(directory_snapshot__isnull=True).values_list("id", flat=True)
+        CompanyDirectorySnapshot.objects.bulk_create(
+            [CompanyDirectorySnapshot(company_id=company_id) for company_id in missing],
+            batch_size=CompanyDirectorySnapshot.REFRESH_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        refreshed = 0
+        while True:
+            snapshots = list(CompanyDirectorySnapshot.objects.filter(is_stale=True)[:CompanyDirectorySnapshot.REFRESH_BATCH_SIZE])
+            if not snapshots:
+                return refreshed
+            company_ids = [snapshot.company_id for snapshot in snapshots]
+            # the flag is cleared before reading, so changes made meanwhile mark the company again
+            CompanyDirectorySnapshot.objects.filter(company_id__in=company_ids).update(is_stale=False)
+            statistics = Company.get_companies_statistics(company_ids)
+            refreshed_at = timezone.now()
+            for snapshot in snapshots:
+                for field, value in statistics[snapshot.company_id].items():
+                    setattr(snapshot, field, value)
+                snapshot.refreshed_at = refreshed_at
+            # is_stale is not written back, it may have been set again while the statistics were read
+            CompanyDirectorySnapshot.objects.bulk_update(
+                snapshots,
+                ["distance", "tonnage", "deliveries_count", "total_income", "drivers_count", "refreshed_at"],
+            )
+            refreshed += len(snapshots)
+
+    @staticmethod
+    @huey.periodic_task(crontab(minute='*/5'))
+    def refresh_directory():
+        CompanyDirectorySnapshot.refresh_stale_snapshots()
+
+    def __str__(self):
+        return f"Katalog: {self.company}"
+
+
 class Employee(models.Model):
     JOB_TITLES = (
         ('owner', 'Właściciel'),
@@ -260,6 +476,19 @@ class Employee(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, blank=True)
     job_title = models.CharField(max_length=64, choices=JOB_TITLES, default="driver")
 
+    def save(self, *args, **kwargs):
+        company_ids = {self.company_id}
+        if not self._state.adding:
+            # an employee moving to another company changes the statistics of the previous one as well
+            company_ids.update(Employee.objects.filter(pk=self.pk).values_list("company_id", flat=True))
+        super().save(*args, **kwargs)
+        CompanyDirectorySnapshot.mark_stale(company_ids)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        CompanyDirectorySnapshot.mark_stale([self.company_id])
+        return result
+
     def check_speditor_permissions(self):
         if self.job_title == "owner" or self.job_title == "speditor":
             return True
@@ -273,21 +502,32 @@ class Employee(models.Model):
         self.delete()
         return {"message": f"Pracownik {self.driver.nick} został zwolniony."}
 
+    def get_list_info(self):
+        info = {
+            "id": self.id,
+            "nick": self.driver.nick,
+            "job_title": self.get_job_title_display(),
+            "last_delivery_date": self.last_delivery_date,
+            "status": "OK", #TODO: ustalić metodę określania statusu
+        }
+        return info
+
+    @staticmethod
+    def get_company_employees(company):
+        return Employee.objects.filter(company=company).select_related("driver").annotate(
+            last_delivery_date=Max("driver__delivery__created_at"))
+
+    @staticmethod
+    def with_last_unloading_city(employees):
+        last_unloading_city = Delivery.objects.filter(
+            driver=OuterRef("driver"), is_edited=False, status="Zaakceptowana").order_by(
+            F("accepted_at").desc(nulls_last=True), "-created_at").values("unloading_city")[:1]
+        return employees.annotate(last_unloading_city=Subquery(last_unloading_city))
+
     @staticmethod
     def get_all_company_employees(company):
         try:
-            employees = []
-            company_employees = Employee.objects.filter(company=company)
-            for employee in company_employees:
-                last_delivery_date = Delivery.get_driver_last_delivery_date(employee.driver)
-                employee_dict = {
-                    "id": employee.id,
-                    "nick": employee.driver.nick,
-                    "job_title": employee.get_job_title_display(),
-                    "last_delivery_date": last_delivery_date,
-                    "status": "OK", #TODO: ustalić metodę określania statusu
-                }
-                employees.append(employee_dict)
+            employees = [employee.get_list_info() for employee in Employee.get_company_employees(company)]
             return employees
         except ValueError:
             return {"error": "Błąd pobierania kierowców."}
@@ -411,6 +651,12 @@ class Vehicle(models.Model):
             return {"error": "Pojazd nie istnieje."}
 
 
+class DeliveryQuerySet(models.QuerySet):
+    def recent_for_driver(self, driver, limit: int = 5):
+        # the ordering follows delivery_driver_priority_idx, so only the first rows of the index are read
+        return self.filter(driver=driver, is_edited=False).order_by("status_priority", "-created_at")[:limit]
+
+
 class Delivery(models.Model):
     DELIVERY_STATUS = (
         ('Zaakceptowana', 'accepted'),
@@ -418,9 +664,12 @@ class Delivery(models.Model):
         ('Odrzucona', 'rejected'),
         ('Wysłana', 'sent')
     )
+    # rejected and to-edit deliveries need the driver's attention first
+    STATUS_PRIORITY = ('Odrzucona', 'Do poprawy', 'Wysłana', 'Zaakceptowana')
 
     delivery_key = models.UUIDField(default=uuid4, editable=False)
-    driver = models.ForeignKey(Driver, on_delete=models.CASCADE)
+    # lookups by driver use delivery_driver_created_idx, a separate foreign key index would only duplicate it
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, db_index=False)
     loading_city = models.CharField(max_length=128)
     unloading_city = models.CharField(max_length=128)
     loading_spedition = models.CharField(max_length=128, blank=True)
@@ -432,10 +681,125 @@ class Delivery(models.Model):
     income = models.PositiveIntegerField(default=0)
     damage = models.PositiveSmallIntegerField(default=0)
     status = models.CharField(max_length=16, choices=DELIVERY_STATUS, default="Wysłana")
+    # position of status in STATUS_PRIORITY, kept in save() so the recent deliveries feed can be read from an index
+    status_priority = models.PositiveSmallIntegerField(default=STATUS_PRIORITY.index("Wysłana"), editable=False)
     reason = models.CharField(max_length=2048, blank=True)
     is_edited = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     accepted_at = models.DateTimeField(null=True, blank=True)
+    ocr_fields = models.JSONField(default=dict, blank=True)
+    ocr_mismatches = models.JSONField(default=dict, blank=True)
+    # filled when the delivery was recorded from JustDeliver Desktop telemetry
+    disposition = models.ForeignKey("Disposition", null=True, blank=True, on_delete=models.SET_NULL)
+    telemetry_start_seq = models.BigIntegerField(null=True, blank=True)
+    telemetry_end_seq = models.BigIntegerField(null=True, blank=True)
+
+    objects = DeliveryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["driver", "status_priority", "-created_at"],
+                condition=Q(is_edited=False),
+                name="delivery_driver_priority_idx",
+            ),
+            models.Index(fields=["driver", "-created_at"], name="delivery_driver_created_idx"),
+            models.Index(fields=["delivery_key"], name="delivery_key_idx"),
+        ]
+
+    LEDGER_FIELDS = ("driver_id", "distance", "tonnage", "income", "status", "is_edited")
+
+    @staticmethod
+    @huey.db_task()
+    def extract_waybill_fields(delivery_id: int):
+        """
+        Reads the waybill fields from the screenshots and pre-fills those the driver has not filled yet.
+        """
+        delivery = Delivery.objects.filter(id=delivery_id, is_edited=True).first()
+        if not delivery or not ocr.is_enabled():
+            return
+        screenshots = DeliveryScreenshot.get_screenshots(delivery).values_list("screenshot", flat=True)
+        ocr_fields = ocr.extract_fields([default_storage.path(name) for name in screenshots])
+        with transaction.atomic():
+            # the driver may have submitted the delivery while OCR was running, so the draft is read again
+            delivery = Delivery.objects.select_for_update().filter(id=delivery_id, is_edited=True).first()
+            if not delivery:
+                return
+            delivery.ocr_fields = ocr_fields
+            update_fields = ["ocr_fields"]
+            for field, reading in ocr_fields.items():
+                if reading["confidence"] < django_settings.OCR_MIN_CONFIDENCE or getattr(delivery, field):
+                    continue
+                try:
+                    Delivery._meta.get_field(field).clean(reading["value"], delivery)
+                except ValidationError:
+                    continue
+                setattr(delivery, field, reading["value"])
+                update_fields.append(field)
+            delivery.save(update_fields=update_fields)
+
+    def record_ocr_mismatches(self):
+        """
+        Stores every field where the submitted value differs from the one read from the screenshots.
+        """
+        self.ocr_mismatches = {
+            field: {"extracted": reading["value"], "submitted": getattr(self, field)}
+            for field, reading in self.ocr_fields.items()
+            if str(reading["value"]).casefold() != str(getattr(self, field)).casefold()
+        }
+        Delivery.objects.filter(id=self.id).update(ocr_mismatches=self.ocr_mismatches)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded_values = dict(zip(field_names, values))
+        if all(field in loaded_values for field in Delivery.LEDGER_FIELDS):
+            instance._ledger_entry = Delivery.build_ledger_entry(loaded_values)
+        return instance
+
+    @staticmethod
+    def build_ledger_entry(values):
+        if values["is_edited"] or values["status"] != "Zaakceptowana":
+            return None
+        return values["driver_id"], values["distance"], values["tonnage"], values["income"]
+
+    def get_ledger_entry(self):
+        return Delivery.build_ledger_entry({field: getattr(self, field) for field in Delivery.LEDGER_FIELDS})
+
+    def get_stored_ledger_entry(self):
+        if hasattr(self, "_ledger_entry"):
+            return self._ledger_entry
+        if self._state.adding or not self.pk:
+            return None
+        stored = Delivery.objects.filter(pk=self.pk).values(*Delivery.LEDGER_FIELDS).first()
+        return Delivery.build_ledger_entry(stored) if stored else None
+
+    @staticmethod
+    def get_status_priority(status: str):
+        if status in Delivery.STATUS_PRIORITY:
+            return Delivery.STATUS_PRIORITY.index(status)
+        return len(Delivery.STATUS_PRIORITY)
+
+    def save(self, *args, **kwargs):
+        self.status_priority = Delivery.get_status_priority(self.status)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "status_priority"}
+        with transaction.atomic():
+            old_entry = self.get_stored_ledger_entry()
+            super().save(*args, **kwargs)
+            new_entry = self.get_ledger_entry()
+            if old_entry != new_entry:
+                DriverStats.record_change(old_entry, new_entry)
+            self._ledger_entry = new_entry
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            old_entry = self.get_stored_ledger_entry()
+            result = super().delete(*args, **kwargs)
+            DriverStats.record_change(old_entry, None)
+            self._ledger_entry = None
+        return result
 
     def get_delivery_screenshots(self):
         try:
@@ -447,6 +811,8 @@ class Delivery(models.Model):
     def update_status(self, status: str, reason: str):
         if status in dict(Delivery.DELIVERY_STATUS).keys():
             self.status = status
+            if status == "Zaakceptowana":
+                self.accepted_at = timezone.now()
             if reason:
                 self.reason = reason
             self.save()
@@ -465,6 +831,12 @@ class Delivery(models.Model):
         except Delivery.DoesNotExist:
             return None
 
+    @staticmethod
+    def get_driver_last_unloading_city(driver: Driver):
+        last_delivery = Delivery.objects.filter(driver=driver, is_edited=False, status="Zaakceptowana").order_by(
+            F("accepted_at").desc(nulls_last=True), "-created_at").values_list("unloading_city", flat=True).first()
+        return last_delivery
+
     @staticmethod
     def get_driver_distance(driver: Driver):
         distance = Delivery.objects.filter(driver=driver, is_edited=False, status="Zaakceptowana").aggregate(
@@ -479,25 +851,9 @@ class Delivery(models.Model):
         return delivery
 
     @staticmethod
-    def get_last_deliveries_for_driver(driver: Driver):
-        deliveries = []
-        accepted = Delivery.objects.filter(driver=driver, status='Zaakceptowana', is_edited=False).order_by("-created_at")[:9]
-        sent = Delivery.objects.filter(driver=driver, status='Wysłana', is_edited=False).order_by("-created_at")[:9]
-        to_edit = Delivery.objects.filter(driver=driver, status='Do poprawy', is_edited=False).order_by("-created_at")[:9]
-        rejected = Delivery.objects.filter(driver=driver, status='Odrzucona', is_edited=False).order_by("-created_at")[:9]
-        if rejected:
-            for delivery in rejected:
-                deliveries.append(delivery)
-        if to_edit:
-            for delivery in to_edit:
-                deliveries.append(delivery)
-        if sent:
-            for delivery in sent:
-                deliveries.append(delivery)
-        if accepted:
-            for delivery in accepted:
-                deliveries.append(delivery)
-        return deliveries[:5]
+    def get_last_deliveries_for_driver(driver: Driver, limit: int = 5):
+        deliveries = list(Delivery.objects.recent_for_driver(driver, limit))
+        return deliveries
 
     @staticmethod
     def get_all_driver_deliveries(driver: Driver):
@@ -508,44 +864,264 @@ class Delivery(models.Model):
             return None
 
     @staticmethod
-    def get_all_company_deliveries(driver: Driver, company: Company):
-        if driver.company == company:
-            try:
-                employees = company.drivers_list
-                deliveries = []
-                for employee in employees:
-                    deliveries += Delivery.objects.filter(driver=employee.driver, is_edited=False)
-                return deliveries
-            except Delivery.DoesNotExist:
-                return None
-        else:
+    def get_all_company_deliveries(driver: Driver, company: Company, filters: Dict = None):
+        if driver.company != company:
             return None
+        deliveries = Delivery.objects.filter(driver__employee__company=company, is_edited=False).select_related("driver")
+        if filters:
+            status = filters.get("status")
+            if status in dict(Delivery.DELIVERY_STATUS).keys():
+                deliveries = deliveries.filter(status=status)
+            driver_id = filters.get("driver")
+            if driver_id and str(driver_id).isdigit():
+                deliveries = deliveries.filter(driver_id=int(driver_id))
+            date_from = parse_date(filters.get("date_from") or "")
+            if date_from:
+                deliveries = deliveries.filter(
+                    created_at__gte=timezone.make_aware(datetime.datetime.combine(date_from, datetime.time.min)))
+            date_to = parse_date(filters.get("date_to") or "")
+            if date_to:
+                deliveries = deliveries.filter(
+                    created_at__lt=timezone.make_aware(datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min)))
+            city = filters.get("city")
+            if city:
+                deliveries = deliveries.filter(Q(loading_city__iexact=city) | Q(unloading_city__iexact=city))
+        return deliveries.order_by("-created_at", "-id")
+
+
+class ScreenshotBlob(models.Model):
+    """
+    A stored screenshot file, addressed by the SHA-256 of its content and shared by every upload of it.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.ImageField(upload_to="waybills/")
+    size = models.PositiveIntegerField(default=0)
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # last time an upload stored or acquired the blob, which may not point to it yet
+    referenced_at = models.DateTimeField(default=timezone.now)
+    # 64-bit dHash and its four 16-bit chunks, indexed separately for multi-index Hamming search
+    dhash = models.BigIntegerField(null=True, blank=True)
+    dhash_0 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    dhash_1 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    dhash_2 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    dhash_3 = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+
+    def set_perceptual_hash(self):
+        value = perceptual.dhash(default_storage.path(self.file.name))
+        self.dhash = perceptual.to_signed(value)
+        self.dhash_0, self.dhash_1, self.dhash_2, self.dhash_3 = perceptual.split_chunks(value)
+        self.save(update_fields=["dhash", "dhash_0", "dhash_1", "dhash_2", "dhash_3"])
+
+    @staticmethod
+    @huey.db_task()
+    def compute_perceptual_hash(blob_id: int):
+        blob = ScreenshotBlob.objects.filter(id=blob_id).first()
+        if blob:
+            blob.set_perceptual_hash()
+
+    def find_similar(self, max_distance: int = None):
+        """
+        Returns {blob_id: distance} of other blobs within max_distance bits of this one.
+        Only rows sharing a near-identical chunk are fetched, so no pairwise scan is needed.
+        """
+        if self.dhash is None:
+            return {}
+        if max_distance is None:
+            max_distance = django_settings.PERCEPTUAL_HASH_MAX_DISTANCE
+        radius = perceptual.get_probe_radius(max_distance)
+        chunks = perceptual.split_chunks(perceptual.to_unsigned(self.dhash))
+        candidates = Q()
+        for index, chunk in enumerate(chunks):
+            candidates |= Q(**{f"dhash_{index}__in": perceptual.probe_values(chunk, radius)})
+        similar = {}
+        for blob_id, dhash in ScreenshotBlob.objects.filter(candidates).exclude(id=self.id).values_list("id", "dhash"):
+            distance = perceptual.hamming(self.dhash, dhash)
+            if distance <= max_distance:
+                similar[blob_id] = distance
+        return similar
+
+    @staticmethod
+    def get_known_hashes(hashes):
+        return set(ScreenshotBlob.objects.filter(sha256__in=hashes).values_list("sha256", flat=True))
+
+    @staticmethod
+    def acquire(sha256: str):
+        """
+        Takes a reference to an already stored blob, or returns None if the content is new.
+        """
+        if ScreenshotBlob.objects.filter(sha256=sha256).update(ref_count=F("ref_count") + 1, referenced_at=timezone.now()):
+            return ScreenshotBlob.objects.get(sha256=sha256)
+        return None
+
+    @staticmethod
+    def store(path: str, sha256: str, size: int):
+        width, height, extension = inspect_image(path)
+        stored_name = move_to_storage(path, get_content_address(sha256, extension))
+        try:
+            with transaction.atomic():
+                return ScreenshotBlob.objects.create(
+                    sha256=sha256, file=stored_name, size=size, width=width, height=height)
+        except IntegrityError:
+            # the same content was stored concurrently, so this copy is dropped in favour of it
+            default_storage.delete(stored_name)
+            return ScreenshotBlob.acquire(sha256)
+
+    @staticmethod
+    def release(blob_id: int):
+        ScreenshotBlob.objects.filter(id=blob_id, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+
+    @staticmethod
+    @huey.periodic_task(crontab(minute='30', hour='3'))
+    def collect_unreferenced():
+        """
+        Recounts references (cascading deletes skip DeliveryScreenshot.delete) and removes blobs nobody uses.
+        Blobs referenced within SCREENSHOT_BLOB_GRACE_HOURS are skipped, their uploads may still be processed.
+        """
+        cutoff = timezone.now() - datetime.timedelta(hours=django_settings.SCREENSHOT_BLOB_GRACE_HOURS)
+        settled = ScreenshotBlob.objects.filter(referenced_at__lt=cutoff)
+        references = DeliveryScreenshot.objects.filter(blob=OuterRef("pk")).order_by().values("blob").annotate(
+            total=Count("id")).values("total")[:1]
+        settled.update(ref_count=Coalesce(Subquery(references), 0))
+        for blob in settled.filter(ref_count=0):
+            # an upload acquiring the blob meanwhile moves referenced_at, so the row is kept
+            if ScreenshotBlob.objects.filter(id=blob.id, ref_count=0, referenced_at__lt=cutoff).delete()[0]:
+                default_storage.delete(blob.file.name)
 
 
 class DeliveryScreenshot(models.Model):
+    STATUSES = (
+        ("Przetwarzany", "processing"),
+        ("Gotowy", "ready"),
+        ("Odrzucony", "rejected"),
+    )
+
     delivery = models.ForeignKey(Delivery, default=None, on_delete=models.CASCADE)
-    screenshot = models.ImageField(upload_to="waybills/")
+    screenshot = models.ImageField(upload_to="waybills/", blank=True)
+    blob = models.ForeignKey(ScreenshotBlob, null=True, blank=True, on_delete=models.PROTECT, related_name="screenshots")
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    is_duplicate = models.BooleanField(default=False)
+    spool_path = models.CharField(max_length=255, blank=True)
+    original_name = models.CharField(max_length=255, blank=True)
+    size = models.PositiveIntegerField(default=0)
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUSES, default="Przetwarzany")
+    error = models.CharField(max_length=255, blank=True)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            if self.blob_id:
+                ScreenshotBlob.release(self.blob_id)
+            return super().delete(*args, **kwargs)
 
     @staticmethod
     def get_screenshots(delivery):
-        return DeliveryScreenshot.objects.filter(delivery=delivery)
+        return DeliveryScreenshot.objects.filter(delivery=delivery, status="Gotowy")
 
     @staticmethod
-    def process_screenshots(user, screenshots):
-        driver = Driver.get_driver_by_user_profile(user)
-        delivery = Delivery.objects.create(driver=driver)
-        if len(screenshots) == 1:
-            DeliveryScreenshot.objects.create(
-                delivery=delivery,
-                screenshot=screenshots.get("file[0]"),
-            )
-        elif len(screenshots) > 1:
-            for i in range(len(screenshots)):
-                DeliveryScreenshot.objects.create(
-                    delivery=delivery,
-                    screenshot=screenshots.get(f"file[{i}]")
-                )
-        return delivery.delivery_key
+    def get_deliveries_with_same_screenshots(delivery):
+        hashes = DeliveryScreenshot.objects.filter(delivery=delivery).exclude(sha256="").values("sha256")
+        return Delivery.objects.filter(deliveryscreenshot__sha256__in=hashes).exclude(id=delivery.id).distinct()
+
+    @staticmethod
+    def get_near_duplicates(delivery):
+        """
+        Returns other deliveries whose screenshots look like this delivery's ones (also after cropping
+        or recompression), closest first, as dicts with the delivery, its driver's company and the distance.
+        """
+        distances = {}
+        blobs = ScreenshotBlob.objects.filter(screenshots__delivery=delivery).distinct()
+        for blob in blobs:
+            similar = blob.find_similar()
+            similar[blob.id] = 0
+            for blob_id, distance in similar.items():
+                distances[blob_id] = min(distance, distances.get(blob_id, distance))
+        matches = {}
+        screenshots = DeliveryScreenshot.objects.filter(blob_id__in=distances).exclude(delivery=delivery).select_related(
+            "delivery__driver__employee__company")
+        for screenshot in screenshots:
+            distance = distances[screenshot.blob_id]
+            if screenshot.delivery_id not in matches or distance < matches[screenshot.delivery_id]["distance"]:
+                matches[screenshot.delivery_id] = {
+                    "delivery": screenshot.delivery,
+                    "company": screenshot.delivery.driver.company,
+                    "distance": distance,
+                }
+        return sorted(matches.values(), key=lambda match: match["distance"])
+
+    @staticmethod
+    def process_screenshots(driver: Driver, screenshots):
+        """
+        Spools the uploaded screenshots and registers them with a single INSERT.
+        Content already stored (or repeated within the upload) is flagged as a duplicate right away.
+        Validation and moving them to the media storage happen later in a huey task.
+        """
+        uploads = [upload for key in sorted(screenshots) for upload in screenshots.getlist(key)]
+        if not uploads:
+            return {"error": "Nie przesłano żadnych zrzutów ekranu."}
+        spooled = []
+        try:
+            for upload in uploads:
+                spooled.append((upload.name, *spool_upload(upload)))
+        except ScreenshotRejected as exception:
+            for _, path, _, _ in spooled:
+                discard_spooled(path)
+            return {"error": str(exception)}
+
+        seen = ScreenshotBlob.get_known_hashes([sha256 for _, _, _, sha256 in spooled])
+        screenshots_list = []
+        for name, path, size, sha256 in spooled:
+            screenshots_list.append(DeliveryScreenshot(
+                spool_path=path, original_name=name[:255], size=size, sha256=sha256, is_duplicate=sha256 in seen))
+            seen.add(sha256)
+
+        with transaction.atomic():
+            delivery = Delivery.objects.create(driver=driver)
+            for screenshot in screenshots_list:
+                screenshot.delivery = delivery
+            DeliveryScreenshot.objects.bulk_create(screenshots_list)
+            transaction.on_commit(lambda: DeliveryScreenshot.process_spooled_screenshots(delivery.id))
+        duplicates = sum(screenshot.is_duplicate for screenshot in screenshots_list)
+        return {"delivery_key": delivery.delivery_key, "duplicates": duplicates}
+
+    @staticmethod
+    @huey.db_task()
+    def process_spooled_screenshots(delivery_id: int):
+        for screenshot in DeliveryScreenshot.objects.filter(delivery_id=delivery_id, status="Przetwarzany"):
+            screenshot.process_spooled()
+        if ocr.is_enabled():
+            Delivery.extract_waybill_fields(delivery_id)
+
+    def process_spooled(self):
+        is_new_blob = False
+        try:
+            blob = ScreenshotBlob.acquire(self.sha256)
+            if blob:
+                discard_spooled(self.spool_path)
+            else:
+                blob = ScreenshotBlob.store(self.spool_path, self.sha256, self.size)
+                is_new_blob = True
+            self.blob = blob
+            self.screenshot.name = blob.file.name
+            self.width, self.height = blob.width, blob.height
+            self.status = "Gotowy"
+        except (ScreenshotRejected, OSError) as exception:
+            discard_spooled(self.spool_path)
+            self.status = "Odrzucony"
+            self.error = str(exception)[:255]
+        self.spool_path = ""
+        self.save(update_fields=["screenshot", "blob", "width", "height", "status", "error", "spool_path"])
+        if is_new_blob:
+            # already inside the worker, so the variants and the perceptual hash are computed right away
+            generate_derivatives.call_local(self.screenshot.name, content_hash=self.blob.sha256)
+            self.blob.set_perceptual_hash()
+
+
+def get_offer_expiry():
+    return timezone.now() + datetime.timedelta(hours=django_settings.OFFER_TTL_HOURS)
 
 
 class Offer(models.Model):
@@ -565,22 +1141,37 @@ class Offer(models.Model):
     cargo = models.CharField(max_length=64)
     tonnage = models.PositiveSmallIntegerField(default=0)
     income = models.PositiveIntegerField(default=0)
+    distance = models.PositiveIntegerField(default=0)
     trailer = models.CharField(max_length=16, choices=TRAILERS, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=get_offer_expiry)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at"], name="offer_created_idx"),
+            models.Index(fields=["trailer", "-created_at"], name="offer_trailer_created_idx"),
+            models.Index(fields=["expires_at"], name="offer_expires_idx"),
+        ]
 
     def accept_offer(self, driver):
         if driver:
-            Disposition.objects.create(
-                loading_city=self.loading_city,
-                loading_spedition=self.loading_spedition,
-                unloading_city = self.unloading_city,
-                unloading_spedition = self.unloading_spedition,
-                cargo = self.cargo,
-                tonnage = self.tonnage,
-                deadline = timezone.now() + datetime.timedelta(days=14),
-                driver = driver,
-            )
-            self.delete()
+            with transaction.atomic():
+                # the conditional delete is the claim: only one caller can remove the live row
+                claimed, _ = Offer.get_live_offers().filter(id=self.id).delete()
+                if not claimed:
+                    return {"error": "Oferta została już przyjęta przez innego kierowcę.", "taken": True}
+                transaction.on_commit(invalidate_market)
+                Disposition.objects.create(
+                    loading_city=self.loading_city,
+                    loading_spedition=self.loading_spedition,
+                    unloading_city = self.unloading_city,
+                    unloading_spedition = self.unloading_spedition,
+                    cargo = self.cargo,
+                    tonnage = self.tonnage,
+                    distance = self.distance,
+                    deadline = timezone.now() + datetime.timedelta(days=14),
+                    driver = driver,
+                )
             return {"message": "Oferta została zaakceptowana poprawnie."}
         else:
             return {"error": "Kierowca nie został podany."}
@@ -588,107 +1179,131 @@ class Offer(models.Model):
     @staticmethod
     def get_offer_by_id(offer_id: int):
         try:
-            offer = Offer.objects.get(id=offer_id)
+            offer = Offer.get_live_offers().get(id=offer_id)
             return offer
         except Offer.DoesNotExist:
             return None
 
+    @staticmethod
+    def get_live_offers():
+        return Offer.objects.filter(expires_at__gt=timezone.now())
+
     @staticmethod
     def get_offers():
         try:
-            offers = Offer.objects.all().order_by("-created_at")
+            offers = Offer.get_live_offers().order_by("-created_at")
             return offers
         except Offer.DoesNotExist:
             return None
 
     @staticmethod
-    def get_ordered_offers(order: str):
+    def get_ordered_offers(order: str, driver: Driver = None, trailer: str = None):
         try:
             if order == "recommended":
-                return Offer.get_offers()
+                offer_ids = Offer.get_recommended_offer_ids(driver, trailer)
+                offers = Offer.objects.in_bulk(offer_ids)
+                return [offers[offer_id] for offer_id in offer_ids if offer_id in offers]
             elif order == "price-desc":
-                offers = Offer.objects.all().order_by("-income").order_by("-created_at")
+                offers = Offer.get_offers().order_by("-income", "-created_at")
                 return offers
             elif order == "price-asc":
-                offers = Offer.objects.all().order_by("income").order_by("-created_at")
+                offers = Offer.get_offers().order_by("income", "-created_at")
                 return offers
             else:
                 return None
         except Offer.DoesNotExist:
             return None
 
+    @staticmethod
+    def get_recommended_offer_ids(driver: Driver = None, trailer: str = None):
+        last_unloading_city = Delivery.get_driver_last_unloading_city(driver) if driver else None
+        if trailer not in dict(Offer.TRAILERS).keys():
+            trailer = None
+        return rank_offers(Offer.get_offers(), last_unloading_city, trailer)
+
     @staticmethod
     def get_filtered_offers(filter: str):
         try:
             if filter == "all":
                 return Offer.get_offers()
-            elif filter in Offer.TRAILERS:
-                return Offer.objects.filter(trailer=filter)
+            elif filter in dict(Offer.TRAILERS).keys():
+                return Offer.get_offers().filter(trailer=filter)
         except ValueError:
             return None
 
     @staticmethod
-    def generate_offer(promods: bool):
-        cities_file = open(os.path.join(django_settings.STATIC_ROOT, 'files/cities.json'), "r", encoding="UTF-8")
-        cities = json.loads(cities_file.read())
-        cities_file.close()
-
-        if promods:
-            loading_city_number = randrange(0, 564)
-            unloading_city_number = randrange(0, 564)
-        else:
-            loading_city_number = randrange(0, 279)
-            unloading_city_number = randrange(0, 279)
-
-        loading_city = cities["response"][loading_city_number]
-        unloading_city = cities["response"][unloading_city_number]
-
-        try:
-            loading_companies_count = len(loading_city.get("companies")) - 1
-            loading_spedition_number = randrange(0, loading_companies_count)
-            loading_spedition = loading_city["companies"][loading_spedition_number]
-
-        except TypeError:
-            print(f"{loading_city.get('realName')} has no companies. Refer to cities.json file.")
-            loading_spedition = "Dowolna"
-        except ValueError:
-            print(f"{loading_city.get('realName')} has no companies. Refer to cities.json file.")
-            loading_spedition = "Dowolna"
-
-        try:
-            unloading_companies_count = len(unloading_city.get("companies")) - 1
-            unloading_spedition_number = randrange(0, unloading_companies_count)
-            unloading_spedition = unloading_city["companies"][unloading_spedition_number]
-
-        except TypeError:
-            print(f"{unloading_city.get('realName')} has no companies. Refer to cities.json file.")
-            unloading_spedition = "Dowolna"
-        except ValueError:
-            print(f"{unloading_city.get('realName')} has no companies. Refer to cities.json file.")
-            unloading_spedition = "Dowolna"
-
-        income = randrange(5000, 65535)
-
-        Offer.objects.create(
-            loading_city=loading_city.get("realName"),
-            loading_spedition=loading_spedition,
-            unloading_city=unloading_city.get("realName"),
-            unloading_spedition=unloading_spedition,
-            cargo="test",
-            tonnage="22",
-            income=income,
-        )
-        return True
+    def build_offers(catalog: CityCatalog, count: int, promods: bool, rng):
+        cities = catalog.get_cities(promods=promods)
+        loading_cities = cities[rng.integers(0, len(cities), count)]
+        unloading_cities = cities[rng.integers(0, len(cities), count)]
+        loading_speditions = catalog.random_companies(rng, loading_cities)
+        unloading_speditions = catalog.random_companies(rng, unloading_cities)
+        incomes = rng.integers(5000, 65535, count)
+        distances = catalog.get_distances(loading_cities, unloading_cities)
+
+        offers = []
+        for loading, unloading, loading_spedition, unloading_spedition, income, distance in zip(
+                loading_cities.tolist(), unloading_cities.tolist(), loading_speditions,
+                unloading_speditions, incomes.tolist(), distances.tolist()):
+            offers.append(Offer(
+                loading_city=catalog.names[loading],
+                loading_spedition=loading_spedition,
+                unloading_city=catalog.names[unloading],
+                unloading_spedition=unloading_spedition,
+                cargo="test",
+                tonnage=22,
+                income=income,
+                distance=distance,
+            ))
+        return offers
 
+    @staticmethod
+    def generate_offers_batch(counts: Dict[str, int], seed=None):
+        capacity = max(django_settings.OFFERS_MARKET_LIMIT - Offer.get_live_offers().count(), 0)
+        requested = sum(counts.values())
+        if requested > capacity:
+            # every map keeps its share of a market that is already nearly full
+            counts = {map_name: count * capacity // requested for map_name, count in counts.items()}
+        catalog = get_catalog()
+        rng = np.random.default_rng(seed)
+        batch_size = django_settings.OFFERS_BATCH_SIZE
+        created = 0
+        with transaction.atomic():
+            for map_name, count in counts.items():
+                for chunk_start in range(0, count, batch_size):
+                    chunk_size = min(batch_size, count - chunk_start)
+                    offers = Offer.build_offers(catalog, chunk_size, map_name == "promods", rng)
+                    Offer.objects.bulk_create(offers, batch_size=batch_size)
+                    created += chunk_size
+            if created:
+                transaction.on_commit(invalidate_market)
+        return created
 
     @staticmethod
-    @huey.periodic_task(crontab(day='*/1'))
+    @huey.periodic_task(crontab(minute='0', hour='1'))
     def generate_offers():
-        for _ in range(350):
-            Offer.generate_offer(promods=False)
+        Offer.purge_expired_offers()
+        Offer.generate_offers_batch(django_settings.OFFERS_PER_MAP)
 
-        for _ in range(100):
-            Offer.generate_offer(promods=True)
+    @staticmethod
+    def purge_expired_offers():
+        """
+        Deletes expired offers in small batches, so no single statement locks the table for long.
+        """
+        batch_size = django_settings.OFFERS_PURGE_BATCH_SIZE
+        purged = 0
+        while True:
+            expired = list(Offer.objects.filter(expires_at__lte=timezone.now()).values_list("id", flat=True)[:batch_size])
+            if not expired:
+                if purged:
+                    invalidate_market()
+                return purged
+            purged += Offer.objects.filter(id__in=expired).delete()[0]
+
+    @staticmethod
+    @huey.periodic_task(crontab(minute='0'))
+    def purge_offers():
+        Offer.purge_expired_offers()
 
 
 class Disposition(models.Model):
@@ -699,10 +1314,16 @@ class Disposition(models.Model):
     unloading_spedition = models.CharField(max_length=128, blank=True)
     cargo = models.CharField(max_length=64)
     tonnage = models.PositiveSmallIntegerField(default=0)
+    distance = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     deadline = models.DateTimeField()
     is_accepted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["driver", "is_accepted"], name="disposition_driver_idx"),
+        ]
+
     @staticmethod
     def accept_disposition(driver, id):
         try:
@@ -734,103 +1355,58 @@ class Disposition(models.Model):
             return "Nie znaleziono dyspozycji o danym id."
 
     @staticmethod
-    def generate_disposition(driver: str, data: Dict):
-        cities_file = open(os.path.join(django_settings.STATIC_ROOT, 'files/cities.json'), "r", encoding="UTF-8")
-        cities = json.loads(cities_file.read())
-        cities_file.close()
-
-        try:
-            if data.get("auto-loading-city"):
-                last_accepted_waybill = Delivery.objects.order_by("-accepted_at").first()
-                for json_city in cities["response"]:
-                    if json_city.get("realName") == last_accepted_waybill.unloading_city:
-                        loading_city = json_city
-                        if not loading_city:
-                            print(f"Error: {loading_city} not found in cities list.")
-                            return None
-                        break
-
-            else:
-                loading_country = data.get("loading_country")
-                if loading_country != "random":
-                    loading_cities = []
-                    for json_city in cities["response"]:
-                        if json_city.get("country") == loading_country:
-                            #If there isn't promods checked, we need only no-promods cities
-                            if data.get("modification"):
-                                if not "promods" in data.get("modification"):
-                                    if json_city.get("mod") != "promods":
-                                        loading_cities.append(json_city)
-                            #if not, all cities within country are ok
-                            else:
-                                loading_cities.append(json_city)
-                    loading_city_number = randrange(0, len(loading_cities))
-                    loading_city = loading_cities[loading_city_number]
-                else:
-                    if data.get("modification"):
-                        if "promods" in data.get("modification"):
-                            loading_city_number = randrange(0, 564)
-                    else:
-                        loading_city_number = randrange(0, 279)
-                    loading_city = cities["response"][loading_city_number]
-            unloading_country = data.get("unloading_country")
-            if unloading_country != "random":
-                unloading_cities = []
-                for json_city in cities["response"]:
-                    if json_city.get("country") == unloading_country:
-                        if data.get("modification"):
-                            if not "promods" in data.get("modification"):
-                                if json_city.get("mod") != "promods":
-                                    unloading_cities.append(json_city)
-                        # if not, all cities within country are ok
-                        else:
-                            unloading_cities.append(json_city)
-                unloading_city_number = randrange(0, len(unloading_cities))
-                unloading_city = unloading_cities[unloading_city_number]
-            else:
-                if data.get("modification"):
-                    if "promods" in data.get("modification"):
-                        unloading_city_number = randrange(0, 564)
+    def generate_dispositions(employees, data: Dict):
+        """
+        Generates one disposition for every given employee in a single transaction.
+        With auto-loading-city every driver starts where the driver's own last accepted delivery was unloaded.
+        """
+        catalog = get_catalog()
+        rng = np.random.default_rng()
+        promods = "promods" in (data.get("modification") or "")
+        employees = list(Employee.with_last_unloading_city(employees))
+        if not employees:
+            return {"error": "Nie wybrano kierowców."}
+
+        skipped = []
+        if data.get("auto-loading-city"):
+            resolved, loading_cities = [], []
+            for employee in employees:
+                loading_city = catalog.get_city_index(employee.last_unloading_city) if employee.last_unloading_city else None
+                if loading_city is None:
+                    skipped.append(employee.driver.nick)
                 else:
-                    unloading_city_number = randrange(0, 279)
-                unloading_city = cities["response"][unloading_city_number]
-
-            try:
-                loading_companies_count = len(loading_city.get("companies")) - 1
-                loading_spedition_number = randrange(0, loading_companies_count)
-                loading_spedition = loading_city["companies"][loading_spedition_number]
-
-            except TypeError:
-                print(f"{loading_city} has no companies. Refer to cities.json file.")
-                loading_spedition = "Dowolna"
-
-            try:
-                unloading_companies_count = len(unloading_city.get("companies")) - 1
-                unloading_spedition_number = randrange(0, unloading_companies_count)
-                unloading_spedition = unloading_city["companies"][unloading_spedition_number]
-
-            except TypeError:
-                print(f"{unloading_city} has no companies. Refer to cities.json file.")
-                unloading_spedition = "Dowolna"
-            except ValueError:
-                print(f"{unloading_city} has no companies. Refer to cities.json file.")
-                unloading_spedition = "Dowolna"
-        except IndexError:
-            return None
-
-        employee = Employee.get_employee_by_id(int(driver))
-
-        Disposition.objects.create(
-            driver = employee.driver,
-            loading_city = loading_city.get("realName"),
-            loading_spedition = loading_spedition,
-            unloading_city = unloading_city.get("realName"),
-            unloading_spedition = unloading_spedition,
-            cargo = "Dowolny",
-            tonnage = "12",
-            deadline = data.get("deadline")
-        )
-        return True
+                    resolved.append(employee)
+                    loading_cities.append(loading_city)
+            employees = resolved
+            loading_cities = np.array(loading_cities, dtype=int)
+        else:
+            loading_cities = catalog.random_cities(rng, len(employees), data.get("loading_country"), promods)
+        unloading_cities = catalog.random_cities(rng, len(employees), data.get("unloading_country"), promods)
+        if not employees or loading_cities is None or unloading_cities is None:
+            return {"error": "Błąd generowania dyspozycji.", "skipped": skipped}
+
+        loading_speditions = catalog.random_companies(rng, loading_cities)
+        unloading_speditions = catalog.random_companies(rng, unloading_cities)
+        distances = catalog.get_distances(loading_cities, unloading_cities)
+        dispositions = [
+            Disposition(
+                driver=employee.driver,
+                loading_city=catalog.names[loading],
+                loading_spedition=loading_spedition,
+                unloading_city=catalog.names[unloading],
+                unloading_spedition=unloading_spedition,
+                cargo="Dowolny",
+                tonnage=12,
+                distance=distance,
+                deadline=data.get("deadline"),
+            )
+            for employee, loading, unloading, loading_spedition, unloading_spedition, distance in zip(
+                employees, loading_cities.tolist(), unloading_cities.tolist(),
+                loading_speditions, unloading_speditions, distances.tolist())
+        ]
+        with transaction.atomic():
+            Disposition.objects.bulk_create(dispositions)
+        return {"message": f"Wygenerowano dyspozycje: {len(dispositions)}.", "skipped": skipped}
 
     @staticmethod
     def get_disposition_for_driver(driver: Driver):
@@ -844,10 +1420,7 @@ class Disposition(models.Model):
     @staticmethod
     def get_company_dispositions(company: Company):
         if company:
-            dispositions = []
-            employees = company.drivers_list
-            for employee in employees:
-                dispositions += Disposition.objects.filter(driver=employee.driver)
+            dispositions = Disposition.objects.filter(driver__employee__company=company).select_related("driver")
             return dispositions
         else:
             return None
@@ -946,3 +1519,439 @@ class EmployeeApplication(models.Model):
             return applications
         except EmployeeApplication.DoesNotExist:
             return None
+
+
+class TelemetryToken(models.Model):
+    driver = models.OneToOneField(Driver, on_delete=models.CASCADE, related_name="telemetry_token")
+    key_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    @staticmethod
+    def issue(driver: Driver):
+        """
+        Creates a new token for JustDeliver Desktop, replacing the previous one. The token is shown only once.
+        """
+        token = secrets.token_urlsafe(32)
+        TelemetryToken.objects.update_or_create(driver=driver, defaults={
+            "key_hash": telemetry.hash_token(token),
+            "last_used_at": None,
+        })
+        return token
+
+    @staticmethod
+    def authenticate(token: str):
+        if not token:
+            return None
+        telemetry_token = TelemetryToken.objects.filter(key_hash=telemetry.hash_token(token)).select_related(
+            "driver__employee").first()
+        if not telemetry_token:
+            return None
+        if telemetry.is_stale(telemetry_token.last_used_at):
+            TelemetryToken.objects.filter(id=telemetry_token.id).update(last_used_at=timezone.now())
+        return telemetry_token.driver
+
+
+class TelemetrySession(models.Model):
+    """
+    One run of JustDeliver Desktop, named by the X-Telemetry-Session header it sends with every batch.
+    The client numbers its samples from 0 in every run; they are stored with seq_offset added,
+    so the seqs of a driver keep growing across restarts.
+    """
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    seq_offset = models.BigIntegerField()
+    # the last stored seq belonging to this run, set once a newer run of the driver starts
+    end_seq = models.BigIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["driver", "key"], name="telemetry_session_unique"),
+        ]
+
+    @staticmethod
+    def resolve(driver: Driver, key: str, last_seq: int):
+        """
+        Returns the run named by key, starting it after last_seq if it is new.
+        Called with the driver's TelemetryJobState locked.
+        """
+        session = TelemetrySession.objects.filter(driver=driver, key=key).first()
+        if session is None:
+            TelemetrySession.objects.filter(driver=driver, end_seq__isnull=True).update(end_seq=last_seq)
+            session = TelemetrySession.objects.create(driver=driver, key=key, seq_offset=last_seq + 1)
+        return session
+
+
+class TelemetrySample(models.Model):
+    """
+    Append-only telemetry from JustDeliver Desktop. The only index is the (driver, seq) key,
+    which keeps inserts cheap and makes client retries idempotent.
+    """
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, db_index=False)
+    seq = models.BigIntegerField()
+    recorded_at = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    x = models.FloatField()
+    y = models.FloatField()
+    z = models.FloatField()
+    speed = models.FloatField()
+    rpm = models.IntegerField(default=0)
+    gear = models.SmallIntegerField(default=0)
+    fuel = models.FloatField(default=0)
+    odometer = models.FloatField(default=0)
+    cargo_damage = models.FloatField(default=0)
+    event = models.CharField(max_length=32, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["driver", "seq"], name="telemetry_driver_seq_unique"),
+        ]
+
+    @staticmethod
+    def get_stored_seqs(driver: Driver, seqs):
+        """
+        Those of the given seqs the driver has samples stored under, still raw or already packed.
+        """
+        seqs = set(seqs)
+        if not seqs:
+            return set()
+        low, high = min(seqs), max(seqs)
+        stored = seqs.intersection(TelemetrySample.objects.filter(
+            driver=driver, seq__gte=low, seq__lte=high).values_list("seq", flat=True))
+        wanted = np.array(sorted(seqs - stored), dtype=np.int64)
+        for name in TelemetrySegment.objects.filter(
+                driver=driver, start_seq__lte=high, end_seq__gte=low).values_list("file", flat=True):
+            stored.update(wanted[np.isin(wanted, segments.load_columns(name, ["seq"])["seq"])].tolist())
+        return stored
+
+    @staticmethod
+    def store_batch(driver: Driver, samples, session_key: str = ""):
+        """
+        Inserts the samples above the driver's high-water mark and feeds them to the job detector.
+        The mark (TelemetryJobState.last_seq) outlives packing, so a resent batch is not stored again
+        after its samples were moved to segment files. Samples at or below the mark that were never
+        stored arrived out of order and are refused, as are samples of a run that has already ended.
+        Returns the numbers of inserted, duplicate and out of order samples and the run's last seq.
+        """
+        with transaction.atomic():
+            state = TelemetryJobState.lock(driver)
+            session = TelemetrySession.resolve(driver, session_key, state.last_seq) if session_key else None
+            offset = session.seq_offset if session else 0
+            end_seq = session.end_seq if session else None
+            new, seen = {}, set()
+            for sample in samples:
+                sample.seq += offset
+                if end_seq is None and sample.seq > state.last_seq:
+                    new.setdefault(sample.seq, sample)
+                else:
+                    seen.add(sample.seq)
+            stored = TelemetrySample.get_stored_seqs(driver, seen)
+            refused = {seq for seq in seen if seq not in stored or (end_seq is not None and seq > end_seq)}
+            new = sorted(new.values(), key=lambda sample: sample.seq)
+            TelemetrySample.objects.bulk_create(new, ignore_conflicts=True)
+            state.consume(new)
+        out_of_order = sum(1 for sample in samples if sample.seq in refused)
+        last_seq = (state.last_seq if end_seq is None else end_seq) - offset
+        return len(new), len(samples) - len(new) - out_of_order, out_of_order, last_seq
+
+    @staticmethod
+    def ingest(driver: Driver, lines, session_key: str = ""):
+        """
+        Validates NDJSON samples one line at a time and appends them in multi-row INSERTs.
+
+        JustDeliver Desktop sends the batches of a run one at a time, in seq order, and retries a failed
+        batch before sending the next one. Samples already received (same seq) are skipped and reported
+        as duplicates, so a client may safely resend a batch. Samples sent after later ones were already
+        received are reported as out_of_order and not stored. last_seq is the highest seq of the run
+        the server has, in the numbering of the client.
+        """
+        batch_size = django_settings.TELEMETRY_INSERT_BATCH_SIZE
+        accepted, duplicates, out_of_order, rejected, last_seq = 0, 0, 0, 0, None
+        received = 0
+        pending = []
+        latest = None
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                values = telemetry.parse_sample(line)
+            except ValueError:
+                rejected += 1
+                continue
+            if received >= django_settings.TELEMETRY_MAX_SAMPLES:
+                rejected += 1
+                continue
+            sample = TelemetrySample(driver=driver, **values)
+            pending.append(sample)
+            received += 1
+            if latest is None or sample.seq > latest.seq:
+                latest = sample
+            if len(pending) >= batch_size:
+                inserted, skipped, refused, last_seq = TelemetrySample.store_batch(driver, pending, session_key)
+                accepted, duplicates, out_of_order = accepted + inserted, duplicates + skipped, out_of_order + refused
+                pending = []
+        if pending:
+            inserted, skipped, refused, last_seq = TelemetrySample.store_batch(driver, pending, session_key)
+            accepted, duplicates, out_of_order = accepted + inserted, duplicates + skipped, out_of_order + refused
+        if latest:
+            employment = driver.employment
+            fleet.get_fleet_store().update(fleet.build_position(
+                driver.id, driver.nick, employment.company_id if employment else None, latest))
+        return {
+            "accepted": accepted,
+            "duplicates": duplicates,
+            "out_of_order": out_of_order,
+            "rejected": rejected,
+            "last_seq": last_seq,
+        }
+
+
+class TelemetryJobState(models.Model):
+    """
+    Per-driver state of the job detector fed by the telemetry stream.
+    Samples are applied in seq order and at most once: everything at or below last_seq was already seen.
+    Seqs are the stored ones, which keep growing across restarts of JustDeliver Desktop (see TelemetrySession).
+
+    Job events sent by JustDeliver Desktop (the "event" field of a sample, details in "payload"):
+    - job_started: cargo, cargo_mass (kg), source_city, source_company, destination_city,
+      destination_company, income
+    - job_delivered: revenue, optionally distance (km) when the game reports it
+    - job_cancelled
+    """
+    STATES = (
+        ("Wolny", "idle"),
+        ("W trasie", "on_job"),
+    )
+
+    driver = models.OneToOneField(Driver, on_delete=models.CASCADE, related_name="telemetry_state")
+    state = models.CharField(max_length=16, choices=STATES, default="Wolny")
+    last_seq = models.BigIntegerField(default=-1)
+    delivery = models.ForeignKey(Delivery, null=True, blank=True, on_delete=models.SET_NULL)
+    start_odometer = models.FloatField(default=0)
+    last_odometer = models.FloatField(default=0)
+    last_fuel = models.FloatField(null=True, blank=True)
+    fuel_used = models.FloatField(default=0)
+    max_damage = models.FloatField(default=0)
+
+    @staticmethod
+    def lock(driver: Driver):
+        """
+        Locks the driver's state for the rest of the transaction, which serializes their telemetry batches.
+        """
+        state, created = TelemetryJobState.objects.select_for_update().get_or_create(driver=driver)
+        if created:
+            # samples stored before the state existed are not replayed, nor stored again
+            stored = TelemetrySample.objects.filter(driver=driver).aggregate(Max("seq"))["seq__max"]
+            packed = TelemetrySegment.objects.filter(driver=driver).aggregate(Max("end_seq"))["end_seq__max"]
+            state.last_seq = max(-1, stored if stored is not None else -1, packed if packed is not None else -1)
+        return state
+
+    def consume(self, samples):
+        for sample in sorted(samples, key=lambda sample: sample.seq):
+            if sample.seq > self.last_seq:
+                self.apply(sample)
+        self.save()
+
+    def apply(self, sample):
+        self.last_seq = sample.seq
+        if self.state == "W trasie":
+            self.last_odometer = sample.odometer or self.last_odometer
+            # refuelling raises the level, only drops count as burnt fuel
+            if self.last_fuel is not None and sample.fuel < self.last_fuel:
+                self.fuel_used += self.last_fuel - sample.fuel
+            self.last_fuel = sample.fuel
+            self.max_damage = max(self.max_damage, sample.cargo_damage)
+        if sample.event == "job_started":
+            self.start_job(sample)
+        elif sample.event == "job_delivered" and self.state == "W trasie":
+            self.finish_job(sample)
+        elif sample.event == "job_cancelled" and self.state == "W trasie":
+            self.cancel_job()
+
+    def start_job(self, sample):
+        if self.state == "W trasie":
+            # a new job without the previous one finishing means it was abandoned
+            self.cancel_job()
+        payload = sample.payload
+        loading_city, unloading_city = str(payload.get("source_city", "")), str(payload.get("destination_city", ""))
+        disposition = Disposition.objects.filter(
+            driver=self.driver, is_accepted=True, loading_city=loading_city, unloading_city=unloading_city).first()
+        self.delivery = Delivery.objects.create(
+            driver=self.driver,
+            disposition=disposition,
+            loading_city=loading_city[:128],
+            loading_spedition=str(payload.get("source_company", ""))[:128],
+            unloading_city=unloading_city[:128],
+            unloading_spedition=str(payload.get("destination_company", ""))[:128],
+            cargo=str(payload.get("cargo", ""))[:64],
+            tonnage=min(max(round(telemetry.to_number(payload.get("cargo_mass")) / 1000), 0), 32767),
+            income=max(round(telemetry.to_number(payload.get("income"))), 0),
+            telemetry_start_seq=sample.seq,
+        )
+        self.state = "W trasie"
+        self.start_odometer = self.last_odometer = sample.odometer
+        self.last_fuel = sample.fuel
+        self.fuel_used = 0
+        self.max_damage = sample.cargo_damage
+
+    def finish_job(self, sample):
+        payload = sample.payload
+        distance = telemetry.to_number(payload.get("distance")) or self.last_odometer - self.start_odometer
+        delivery = self.delivery
+        if delivery:
+            delivery.distance = min(round(max(distance, 0)), 32767)
+            delivery.fuel = min(round(self.fuel_used), 32767)
+            delivery.damage = min(round(self.max_damage * 100), 100)
+            delivery.income = max(round(telemetry.to_number(payload.get("revenue"))), 0) or delivery.income
+            delivery.telemetry_end_seq = sample.seq
+            # the delivery goes to the speditor like one submitted with the form
+            delivery.is_edited = False
+            delivery.save()
+        self.reset()
+
+    def cancel_job(self):
+        if self.delivery and self.delivery.is_edited:
+            self.delivery.delete()
+        self.reset()
+
+    def reset(self):
+        self.state = "Wolny"
+        self.delivery = None
+        self.fuel_used = 0
+        self.max_damage = 0
+        self.last_fuel = None
+
+
+class TelemetrySegment(models.Model):
+    """
+    A run of consecutive telemetry samples of one driver, packed into a NumPy file by segments.write_segment.
+    """
+    # TelemetrySample fields stored in the segment columns, in segments.SEGMENT_COLUMNS order
+    PACKED_FIELDS = ("seq", "recorded_at", "x", "y", "z", "speed", "fuel", "odometer", "cargo_damage")
+
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE)
+    delivery = models.ForeignKey(Delivery, null=True, blank=True, on_delete=models.SET_NULL)
+    start_seq = models.BigIntegerField()
+    end_seq = models.BigIntegerField()
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    samples = models.PositiveIntegerField()
+    file = models.CharField(max_length=255)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["driver", "started_at"], name="segment_driver_started_idx"),
+        ]
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        if os.path.exists(segments.get_segment_path(self.file)):
+            os.remove(segments.get_segment_path(self.file))
+        return result
+
+    @staticmethod
+    def to_segment_rows(rows):
+        return [(seq, int(recorded_at.timestamp() * 1000), *values) for seq, recorded_at, *values in rows]
+
+    @staticmethod
+    def pack_driver_samples(driver_id: int, cutoff):
+        """
+        Moves the driver's samples received before the cutoff from TelemetrySample into segment files.
+        """
+        packed = 0
+        while True:
+            rows = list(TelemetrySample.objects.filter(driver_id=driver_id, received_at__lt=cutoff).order_by("seq").values_list(
+                *TelemetrySegment.PACKED_FIELDS)[:django_settings.TELEMETRY_SEGMENT_MAX_SAMPLES])
+            if not rows:
+                return packed
+            start_seq, end_seq = rows[0][0], rows[-1][0]
+            name = f"{driver_id}/{start_seq}-{end_seq}-{uuid4().hex[:8]}.npz"
+            segments.write_segment(name, TelemetrySegment.to_segment_rows(rows))
+            with transaction.atomic():
+                TelemetrySegment.objects.create(
+                    driver_id=driver_id,
+                    start_seq=start_seq,
+                    end_seq=end_seq,
+                    started_at=min(row[1] for row in rows),
+                    ended_at=max(row[1] for row in rows),
+                    samples=len(rows),
+                    file=name,
+                )
+                TelemetrySample.objects.filter(
+                    driver_id=driver_id, seq__gte=start_seq, seq__lte=end_seq, received_at__lt=cutoff).delete()
+            packed += len(rows)
+
+    @staticmethod
+    @huey.periodic_task(crontab(minute='*/5'))
+    def pack_samples():
+        cutoff = timezone.now() - datetime.timedelta(seconds=django_settings.TELEMETRY_PACK_AFTER_SECONDS)
+        driver_ids = TelemetrySample.objects.order_by("driver_id").values_list("driver_id", flat=True).distinct()
+        for driver_id in list(driver_ids):
+            TelemetrySegment.pack_driver_samples(driver_id, cutoff)
+
+    @staticmethod
+    def get_previous_delivery_date(delivery: Delivery):
+        return Delivery.objects.filter(driver_id=delivery.driver_id, created_at__lt=delivery.created_at).aggregate(
+            Max("created_at")).get("created_at__max")
+
+    @staticmethod
+    def get_segments_for_delivery(delivery: Delivery):
+        """
+        Segments linked to the delivery, those covering the seq range of a delivery detected from telemetry,
+        or otherwise those recorded by its driver between the previous delivery and this one.
+        """
+        linked = TelemetrySegment.objects.filter(delivery=delivery).order_by("started_at")
+        if linked.exists():
+            return linked
+        if delivery.telemetry_start_seq is not None:
+            recorded = TelemetrySegment.objects.filter(driver_id=delivery.driver_id,
+                                                       end_seq__gte=delivery.telemetry_start_seq)
+            if delivery.telemetry_end_seq is not None:
+                recorded = recorded.filter(start_seq__lte=delivery.telemetry_end_seq)
+            return recorded.order_by("start_seq")
+        previous = TelemetrySegment.get_previous_delivery_date(delivery)
+        window = TelemetrySegment.objects.filter(driver_id=delivery.driver_id, delivery__isnull=True,
+                                                 started_at__lte=delivery.created_at)
+        if previous:
+            window = window.filter(ended_at__gte=previous)
+        return window.order_by("started_at")
+
+    @staticmethod
+    def get_unpacked_samples(delivery: Delivery):
+        """
+        Samples of the delivery's telemetry not packed into segments yet, picked like get_segments_for_delivery,
+        so a chart of a delivery that has just finished ends with its last sample.
+        """
+        if delivery.telemetry_start_seq is not None:
+            samples = TelemetrySample.objects.filter(driver_id=delivery.driver_id, seq__gte=delivery.telemetry_start_seq)
+            if delivery.telemetry_end_seq is not None:
+                samples = samples.filter(seq__lte=delivery.telemetry_end_seq)
+            return samples
+        if TelemetrySegment.objects.filter(delivery=delivery).exists():
+            return TelemetrySample.objects.none()
+        previous = TelemetrySegment.get_previous_delivery_date(delivery)
+        samples = TelemetrySample.objects.filter(driver_id=delivery.driver_id, recorded_at__lte=delivery.created_at)
+        if previous:
+            samples = samples.filter(recorded_at__gte=previous)
+        return samples
+
+    @staticmethod
+    def get_chart(delivery: Delivery, series, points: int, method: str = "lttb"):
+        columns = ["seq", "t", *series]
+        parts = [
+            segments.load_columns(name, columns)
+            for name in TelemetrySegment.get_segments_for_delivery(delivery).values_list("file", flat=True)
+        ]
+        unpacked = TelemetrySegment.get_unpacked_samples(delivery).order_by("seq").values_list(
+            *TelemetrySegment.PACKED_FIELDS)
+        parts.append(segments.build_columns(TelemetrySegment.to_segment_rows(unpacked)))
+        downsample = segments.DOWNSAMPLING[method]
+        chart = {}
+        for name in series:
+            timestamps, values = segments.load_series(
+                parts, name, delivery.telemetry_start_seq, delivery.telemetry_end_seq)
+            timestamps, values = downsample(timestamps, values, points)
+            chart[name] = {"t": timestamps.tolist(), "values": np.round(values, 2).tolist()}
+        return chart
@@ -0,0 +1,130 @@
+import re
+import threading
+
+from django.conf import settings as django_settings
+
+NUMERIC_FIELDS = ("tonnage", "distance", "income", "damage")
+TEXT_FIELDS = ("loading_city", "unloading_city", "cargo")
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def is_enabled():
+    return bool(django_settings.OCR_MODEL_PATH)
+
+
+def get_model():
+    """
+    Loads the TorchScript recogniser once per worker process and keeps it on the CPU.
+    torch is imported here, so web processes that never run OCR do not pay for it.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import torch
+
+                torch.set_num_threads(django_settings.OCR_TORCH_THREADS)
+                model = torch.jit.load(django_settings.OCR_MODEL_PATH, map_location="cpu")
+                model.eval()
+                _model = model
+    return _model
+
+
+def crop_fields(path: str):
+    """
+    Cuts the configured field regions out of a screenshot and scales them to the recogniser's input height.
+    Returns (field, crop) pairs; crops are float32 arrays in the 0-1 range.
+    """
+    import cv2
+    import numpy as np
+
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return []
+    image_height, image_width = image.shape
+    height = django_settings.OCR_INPUT_HEIGHT
+    crops = []
+    for field, (left, top, right, bottom) in django_settings.OCR_FIELD_REGIONS.items():
+        region = image[int(top * image_height):int(bottom * image_height), int(left * image_width):int(right * image_width)]
+        if not region.size:
+            continue
+        width = min(max(round(region.shape[1] * height / region.shape[0]), 1), django_settings.OCR_MAX_WIDTH)
+        region = cv2.resize(region, (width, height), interpolation=cv2.INTER_AREA)
+        # the game renders light text on dark panels, the recogniser expects dark text on white
+        if region.mean() < 127:
+            region = 255 - region
+        crops.append((field, region.astype(np.float32) / 255.0))
+    return crops
+
+
+def decode(logits):
+    """
+    Greedy CTC decoding of (batch, time, classes) logits, class 0 being the blank.
+    Returns the text and the mean confidence of the emitted characters for every row.
+    """
+    probabilities = logits.softmax(dim=-1)
+    confidences, indices = probabilities.max(dim=-1)
+    alphabet = django_settings.OCR_ALPHABET
+    results = []
+    for row_indices, row_confidences in zip(indices.tolist(), confidences.tolist()):
+        characters, scores, previous = [], [], 0
+        for index, confidence in zip(row_indices, row_confidences):
+            if index != previous and index != 0:
+                characters.append(alphabet[index - 1])
+                scores.append(confidence)
+            previous = index
+        results.append(("".join(characters), sum(scores) / len(scores) if scores else 0.0))
+    return results
+
+
+def recognise(crops):
+    import numpy as np
+    import torch
+
+    model = get_model()
+    batch_size = django_settings.OCR_BATCH_SIZE
+    results = []
+    for start in range(0, len(crops), batch_size):
+        batch = crops[start:start + batch_size]
+        width = max(crop.shape[1] for crop in batch)
+        # crops are padded with white to the widest one in the batch
+        tensor = np.ones((len(batch), 1, django_settings.OCR_INPUT_HEIGHT, width), dtype=np.float32)
+        for row, crop in enumerate(batch):
+            tensor[row, 0, :, :crop.shape[1]] = crop
+        with torch.inference_mode():
+            results.extend(decode(model(torch.from_numpy(tensor))))
+    return results
+
+
+def parse_value(field: str, text: str):
+    text = text.strip()
+    if field in NUMERIC_FIELDS:
+        digits = re.sub(r"\D", "", text)
+        return int(digits) if digits else None
+    return text or None
+
+
+def extract_fields(paths):
+    """
+    Runs every screenshot of a waybill through the recogniser in batches.
+    For every field the most confident reading across the screenshots wins.
+    Returns {field: {"value": ..., "confidence": ...}}.
+    """
+    fields, crops = [], []
+    for path in paths:
+        for field, crop in crop_fields(path):
+            fields.append(field)
+            crops.append(crop)
+    if not crops:
+        return {}
+
+    extracted = {}
+    for field, (text, confidence) in zip(fields, recognise(crops)):
+        value = parse_value(field, text)
+        if value is None:
+            continue
+        if field not in extracted or confidence > extracted[field]["confidence"]:
+            extracted[field] = {"value": value, "confidence": round(confidence, 3)}
+    return extracted
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import datetime
+import json
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None, count_is_estimate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_is_estimate = count_is_estimate
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over a queryset. Pages are addressed with opaque cursors holding
+    the ordering values of the row they start after, so no page needs COUNT(*) or OFFSET.
+    The last ordering field has to be unique (id by default) to keep the order stable.
+    With count_limit set, the page carries the number of rows counted up to that limit.
+    """
+    def __init__(self, queryset, per_page: int, ordering=("-created_at", "-id"), count_limit: int = None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.count_limit = count_limit
+        self.fields = [queryset.model._meta.get_field(field.lstrip("-")) for field in ordering]
+
+    def page(self, cursor: str = None):
+        values, direction = self.decode_cursor(cursor)
+        backwards = direction == "previous"
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self.get_keyset_filter(values, backwards))
+        ordering = [self.reverse_ordering(field) for field in self.ordering] if backwards else self.ordering
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = self.encode_cursor(rows[-1], "next")
+            if (has_more and backwards) or (values is not None and not backwards):
+                previous_cursor = self.encode_cursor(rows[0], "previous")
+
+        count = None
+        count_is_estimate = False
+        if self.count_limit:
+            count = self.queryset[:self.count_limit + 1].count()
+            count_is_estimate = count > self.count_limit
+            count = min(count, self.count_limit)
+        return CursorPage(rows, next_cursor, previous_cursor, count, count_is_estimate)
+
+    def get_keyset_filter(self, values, backwards: bool):
+        keyset_filter = Q()
+        equal = {}
+        for ordering, field, value in zip(self.ordering, self.fields, values):
+            descending = ordering.startswith("-") != backwards
+            lookup = "lt" if descending else "gt"
+            keyset_filter |= Q(**equal, **{f"{field.attname}__{lookup}": value})
+            equal[field.attname] = value
+        return keyset_filter
+
+    @staticmethod
+    def reverse_ordering(field: str):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def encode_cursor(self, row, direction: str):
+        values = []
+        for field in self.fields:
+            value = getattr(row, field.attname)
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            elif isinstance(value, UUID):
+                value = str(value)
+            values.append(value)
+        payload = json.dumps({"v": values, "d": direction}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str):
+        if not cursor:
+            return None, "next"
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            values = [field.to_python(value) for field, value in zip(self.fields, payload["v"])]
+            if len(values) != len(self.fields) or payload["d"] not in ("next", "previous"):
+                return None, "next"
+            return values, payload["d"]
+        except (binascii.Error, ValidationError, ValueError, KeyError, TypeError):
+            # invalid cursor falls back to the first page, same as Paginator's PageNotAnInteger
+            return None, "next"
+
+
+class RankedPaginator:
+    """
+    Pages a precomputed ranking of ids, such as the recommended offers. Cursors are
+    positions in the ranking, and only the ids of the requested page are fetched.
+    """
+    def __init__(self, queryset, ranked_ids, per_page: int):
+        self.queryset = queryset
+        self.ranked_ids = ranked_ids
+        self.per_page = per_page
+
+    def page(self, cursor: str = None):
+        start = int(cursor) if cursor and cursor.isdigit() else 0
+        page_ids = self.ranked_ids[start:start + self.per_page]
+        objects = self.queryset.in_bulk(page_ids)
+        rows = [objects[object_id] for object_id in page_ids if object_id in objects]
+        end = start + self.per_page
+        next_cursor = str(end) if end < len(self.ranked_ids) else None
+        previous_cursor = str(max(start - self.per_page, 0)) if start > 0 else None
+        return CursorPage(rows, next_cursor, previous_cursor, count=len(self.ranked_ids))
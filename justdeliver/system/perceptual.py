@@ -0,0 +1,56 @@
+from itertools import combinations
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+def dhash(path: str):
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of an 9x8 grayscale thumbnail.
+    Survives recompression, rescaling and small edits, unlike a content hash.
+    """
+    with Image.open(path) as image:
+        pixels = np.asarray(image.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def to_signed(value: int):
+    # BigIntegerField is signed, the hash is stored in its two's complement form
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int):
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def split_chunks(value: int):
+    return [(value >> (CHUNK_BITS * index)) & CHUNK_MASK for index in range(CHUNKS)]
+
+
+def probe_values(chunk: int, radius: int):
+    """
+    Every chunk value within the given Hamming radius of a chunk.
+    """
+    values = [chunk]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), distance):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+def get_probe_radius(max_distance: int):
+    # by pigeonhole two hashes within max_distance share at least one chunk within this radius
+    return max_distance // CHUNKS
+
+
+def hamming(first: int, second: int):
+    return bin(to_unsigned(first) ^ to_unsigned(second)).count("1")
@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+from django.conf import settings as django_settings
+from django.core.cache import cache
+
+from .cities import get_catalog
+
+INCOME_PER_KM_WEIGHT = 1.0
+EMPTY_RUN_WEIGHT = 0.6
+TRAILER_MATCH_WEIGHT = 0.3
+MARKET_VERSION_KEY = "offers-market-version"
+
+
+def get_market_version():
+    version = cache.get(MARKET_VERSION_KEY)
+    if version is None:
+        # a fresh value, so entries cached before the version key was evicted are never read again
+        cache.add(MARKET_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(MARKET_VERSION_KEY)
+    return version
+
+
+def invalidate_market():
+    """
+    Called whenever offers are added or removed. Arrays and rankings cached for the previous
+    version are not read anymore and expire on their own.
+    """
+    try:
+        cache.incr(MARKET_VERSION_KEY)
+    except ValueError:
+        cache.add(MARKET_VERSION_KEY, time.time_ns(), None)
+
+
+def get_market_arrays(offers, version):
+    """
+    Packs the open offers into arrays once per market version and cache period, so ranking them
+    for another origin city is only a few NumPy operations.
+    """
+    cache_key = f"offers-market-arrays:{version}"
+    market = cache.get(cache_key)
+    if market is None:
+        catalog = get_catalog()
+        rows = list(offers.values_list("id", "loading_city", "income", "distance", "trailer"))
+        ids, loading_cities, incomes, distances, trailers = zip(*rows) if rows else ((), (), (), (), ())
+        market = {
+            "ids": np.array(ids, dtype=np.int64),
+            "loading_cities": np.array(
+                [catalog.get_city_index(city) if city in catalog.by_name else -1 for city in loading_cities],
+                dtype=np.int64,
+            ),
+            "incomes": np.array(incomes, dtype=np.float64),
+            "distances": np.array(distances, dtype=np.float64),
+            "trailers": np.array(trailers, dtype=object),
+        }
+        cache.set(cache_key, market, django_settings.OFFER_RECOMMENDATIONS_TTL)
+    return market
+
+
+def score_offers(market, origin_city: int = None, trailer: str = None):
+    catalog = get_catalog()
+    distances = market["distances"]
+    known_distances = distances[distances > 0]
+    # offers without a known distance are compared as if they had a typical one
+    typical_distance = np.median(known_distances) if len(known_distances) else 1.0
+    income_per_km = market["incomes"] / np.where(distances > 0, distances, typical_distance)
+
+    empty_run = np.zeros(len(market["ids"]))
+    if origin_city is not None and catalog.distances is not None:
+        located = market["loading_cities"] >= 0
+        empty_run[located] = catalog.distances[origin_city][market["loading_cities"][located]]
+
+    trailer_match = (market["trailers"] == trailer).astype(np.float64) if trailer else np.zeros(len(market["ids"]))
+
+    return (
+        INCOME_PER_KM_WEIGHT * income_per_km / max(income_per_km.max(initial=0), 1e-9)
+        - EMPTY_RUN_WEIGHT * empty_run / max(empty_run.max(initial=0), 1e-9)
+        + TRAILER_MATCH_WEIGHT * trailer_match
+    )
+
+
+def rank_offers(offers, origin_city_name: str = None, trailer: str = None):
+    """
+    Returns ids of the open offers, best first for a driver standing in origin_city_name.
+    Rankings are cached per market version, origin city and trailer, so trailer must be
+    one of Offer.TRAILERS or None.
+    """
+    version = get_market_version()
+    origin_city = get_catalog().get_city_index(origin_city_name) if origin_city_name else None
+    cache_key = f"offers-recommended:{version}:{origin_city}:{trailer}"
+    ranked_ids = cache.get(cache_key)
+    if ranked_ids is None:
+        market = get_market_arrays(offers, version)
+        scores = score_offers(market, origin_city, trailer)
+        ranked_ids = market["ids"][np.argsort(-scores, kind="stable")].tolist()
+        cache.set(cache_key, ranked_ids, django_settings.OFFER_RECOMMENDATIONS_TTL)
+    return ranked_ids
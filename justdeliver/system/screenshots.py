@@ -0,0 +1,95 @@
+import hashlib
+import os
+from uuid import uuid4
+
+from django.conf import settings as django_settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image, UnidentifiedImageError
+
+ALLOWED_FORMATS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp", "BMP": "bmp"}
+
+
+class ScreenshotRejected(Exception):
+    pass
+
+
+def get_spool_dir():
+    spool_dir = django_settings.SCREENSHOTS_SPOOL_DIR
+    os.makedirs(spool_dir, exist_ok=True)
+    return spool_dir
+
+
+def spool_upload(upload):
+    """
+    Puts an uploaded file into the spool directory and hashes its content.
+    Uploads Django has already written to a temporary file are renamed into the spool, smaller ones
+    are streamed there in SCREENSHOT_CHUNK_SIZE chunks, so a request never writes a screenshot twice
+    or holds a whole one in memory.
+    Returns the spool path, the number of bytes written and the SHA-256 of the content.
+    """
+    if upload.size > django_settings.SCREENSHOT_MAX_SIZE:
+        raise ScreenshotRejected(f"Plik {upload.name} przekracza dopuszczalny rozmiar.")
+    path = os.path.join(get_spool_dir(), uuid4().hex)
+    if hasattr(upload, "temporary_file_path"):
+        digest = hashlib.sha256()
+        for chunk in upload.chunks(django_settings.SCREENSHOT_CHUNK_SIZE):
+            digest.update(chunk)
+        try:
+            os.replace(upload.temporary_file_path(), path)
+            return path, upload.size, digest.hexdigest()
+        except OSError:
+            # FILE_UPLOAD_TEMP_DIR is on another file system than the spool, so the file is copied
+            pass
+
+    size = 0
+    digest = hashlib.sha256()
+    with open(path, "wb") as spool_file:
+        for chunk in upload.chunks(django_settings.SCREENSHOT_CHUNK_SIZE):
+            size += len(chunk)
+            if size > django_settings.SCREENSHOT_MAX_SIZE:
+                break
+            digest.update(chunk)
+            spool_file.write(chunk)
+    if size > django_settings.SCREENSHOT_MAX_SIZE:
+        os.remove(path)
+        raise ScreenshotRejected(f"Plik {upload.name} przekracza dopuszczalny rozmiar.")
+    return path, size, digest.hexdigest()
+
+
+def inspect_image(path: str):
+    """
+    Checks that a spooled file is a complete image of an allowed format.
+    Returns its width, height and file extension.
+    """
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        # verify() leaves the image unusable, so the size is read from a fresh handle
+        with Image.open(path) as image:
+            width, height = image.size
+            image_format = image.format
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise ScreenshotRejected("Plik nie jest poprawnym obrazem.")
+    if image_format not in ALLOWED_FORMATS:
+        raise ScreenshotRejected(f"Format {image_format} nie jest obsługiwany.")
+    return width, height, ALLOWED_FORMATS[image_format]
+
+
+def move_to_storage(path: str, name: str):
+    """
+    Moves a spooled file into the default storage and returns its storage name.
+    """
+    with open(path, "rb") as spool_file:
+        stored_name = default_storage.save(name, File(spool_file))
+    os.remove(path)
+    return stored_name
+
+
+def get_content_address(sha256: str, extension: str):
+    return f"waybills/{sha256[:2]}/{sha256}.{extension}"
+
+
+def discard_spooled(path: str):
+    if path and os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,123 @@
+import os
+from uuid import uuid4
+
+import numpy as np
+from django.conf import settings as django_settings
+
+# columns of a packed telemetry segment; timestamps are unix milliseconds
+SEGMENT_COLUMNS = {
+    "seq": "<i8",
+    "t": "<i8",
+    "x": "<f4",
+    "y": "<f4",
+    "z": "<f4",
+    "speed": "<f4",
+    "fuel": "<f4",
+    "odometer": "<f8",
+    "damage": "<f4",
+}
+CHART_SERIES = ("speed", "fuel", "odometer", "damage")
+
+
+def get_segment_path(name: str):
+    return os.path.join(django_settings.TELEMETRY_SEGMENTS_DIR, name)
+
+
+def build_columns(rows):
+    """
+    Turns (seq, t, x, y, z, speed, fuel, odometer, damage) rows into a dict of column arrays.
+    """
+    values = list(zip(*rows)) if rows else [()] * len(SEGMENT_COLUMNS)
+    return {
+        column: np.array(column_values, dtype=dtype)
+        for (column, dtype), column_values in zip(SEGMENT_COLUMNS.items(), values)
+    }
+
+
+def write_segment(name: str, rows):
+    """
+    Packs rows (see build_columns) into an uncompressed .npz file under TELEMETRY_SEGMENTS_DIR,
+    one array per column, so a reader loads only the columns it asks for.
+    """
+    path = get_segment_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    columns = build_columns(rows)
+    partial = f"{path}.{uuid4().hex}.part"
+    with open(partial, "wb") as segment_file:
+        np.savez(segment_file, **columns)
+    os.replace(partial, path)
+    return columns
+
+
+def load_columns(name: str, columns):
+    with np.load(get_segment_path(name)) as segment:
+        return {column: segment[column] for column in columns}
+
+
+def load_series(parts, series: str, start_seq: int = None, end_seq: int = None):
+    """
+    Returns timestamps and values of one column across consecutive parts, the column dicts
+    of packed segments (load_columns) and of samples not packed yet (build_columns),
+    optionally limited to the samples between start_seq and end_seq.
+    """
+    parts = [part for part in parts if len(part["seq"])]
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    seqs = np.concatenate([part["seq"] for part in parts])
+    # every seq counts once, even if a resent batch was packed into two segments
+    seqs, first = np.unique(seqs, return_index=True)
+    timestamps = np.concatenate([part["t"] for part in parts])[first]
+    values = np.concatenate([part[series] for part in parts])[first].astype(np.float64)
+    if start_seq is not None or end_seq is not None:
+        mask = np.ones(len(seqs), dtype=bool)
+        if start_seq is not None:
+            mask &= seqs >= start_seq
+        if end_seq is not None:
+            mask &= seqs <= end_seq
+        timestamps, values = timestamps[mask], values[mask]
+    return timestamps, values
+
+
+def minmax(x: np.ndarray, y: np.ndarray, points: int):
+    """
+    Keeps the lowest and the highest value of every bucket, which preserves spikes.
+    """
+    if len(x) <= points:
+        return x, y
+    buckets = max(points // 2, 1)
+    bucket_size = len(x) // buckets
+    trimmed = y[:buckets * bucket_size].reshape(buckets, bucket_size)
+    offsets = np.arange(buckets) * bucket_size
+    indices = np.sort(np.concatenate([offsets + trimmed.argmin(axis=1), offsets + trimmed.argmax(axis=1)]))
+    indices = np.unique(indices)
+    return x[indices], y[indices]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int):
+    """
+    Largest-Triangle-Three-Buckets: picks in every bucket the sample forming the largest triangle
+    with the previously picked sample and the average of the next bucket, keeping the visual shape.
+    """
+    length = len(x)
+    if length <= points or points < 3:
+        return x, y
+    xf = x.astype(np.float64)
+    edges = np.linspace(1, length - 1, points - 1).astype(np.int64)
+    indices = np.empty(points, dtype=np.int64)
+    indices[0], indices[-1] = 0, length - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        average_x = xf[end:next_end].mean() if next_end > end else xf[-1]
+        average_y = y[end:next_end].mean() if next_end > end else y[-1]
+        areas = np.abs(
+            (xf[previous] - average_x) * (y[start:end] - y[previous])
+            - (xf[previous] - xf[start:end]) * (average_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        indices[bucket + 1] = previous
+    return x[indices], y[indices]
+
+
+DOWNSAMPLING = {"lttb": lttb, "minmax": minmax}
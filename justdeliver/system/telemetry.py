@@ -0,0 +1,107 @@
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import zlib
+
+from django.utils import timezone
+
+# field name in the NDJSON sample -> (model field, type, required)
+SAMPLE_FIELDS = {
+    "seq": ("seq", int, True),
+    "t": ("recorded_at", int, True),
+    "x": ("x", float, True),
+    "y": ("y", float, True),
+    "z": ("z", float, True),
+    "speed": ("speed", float, True),
+    "rpm": ("rpm", int, False),
+    "gear": ("gear", int, False),
+    "fuel": ("fuel", float, False),
+    "odometer": ("odometer", float, False),
+    "damage": ("cargo_damage", float, False),
+}
+
+
+class BatchTooLarge(Exception):
+    pass
+
+
+def hash_token(token: str):
+    # only digests are stored, a leaked database does not leak working tokens
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def read_lines(stream, compressed: bool, max_bytes: int, chunk_size: int = 64 * 1024):
+    """
+    Yields the lines of a (optionally gzip-compressed) NDJSON body without reading it whole.
+    Raises BatchTooLarge once the decompressed body exceeds max_bytes, which also stops gzip bombs.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compressed else None
+    total = 0
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if decompressor:
+            chunk = decompressor.decompress(chunk, max_bytes - total + 1)
+            if decompressor.unconsumed_tail:
+                raise BatchTooLarge()
+        total += len(chunk)
+        if total > max_bytes:
+            raise BatchTooLarge()
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if decompressor:
+        pending += decompressor.flush()
+    if pending:
+        yield pending
+
+
+def parse_sample(line: bytes):
+    """
+    Validates one NDJSON line and returns the model field values, or raises ValueError.
+    """
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError("sample is not an object")
+    values = {}
+    for name, (field, field_type, required) in SAMPLE_FIELDS.items():
+        value = data.get(name)
+        if value is None:
+            if required:
+                raise ValueError(f"missing {name}")
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"{name} is not a number")
+        values[field] = field_type(value)
+    if values["seq"] < 0:
+        raise ValueError("seq is negative")
+    try:
+        values["recorded_at"] = datetime.datetime.fromtimestamp(values["recorded_at"] / 1000, tz=datetime.timezone.utc)
+    except (OverflowError, OSError):
+        raise ValueError("t is out of range")
+    if data.get("event"):
+        values["event"] = str(data["event"])[:32]
+        values["payload"] = data.get("payload") if isinstance(data.get("payload"), dict) else {}
+    return values
+
+
+def to_number(value):
+    # job event payloads come from the game as they are, missing or malformed numbers count as 0
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return 0
+    return value
+
+
+def encode_batch(samples):
+    """
+    Used by the load-testing client: gzip-compressed NDJSON as sent by JustDeliver Desktop.
+    """
+    return gzip.compress(b"\n".join(json.dumps(sample).encode() for sample in samples), compresslevel=5)
+
+
+def is_stale(last_used_at, seconds: int = 60):
+    return last_used_at is None or timezone.now() - last_used_at > datetime.timedelta(seconds=seconds)
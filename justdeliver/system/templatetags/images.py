@@ -0,0 +1,24 @@
+import logging
+
+from django import template
+
+from system.derivatives import get_derivative_url
+
+register = template.Library()
+logger = logging.getLogger(__name__)
+
+
+@register.filter
+def thumbnail(image_field, options=""):
+    """
+    Usage: {{ vehicle.photo|thumbnail:"320" }} or {{ screenshot.screenshot|thumbnail:"1280,jpg" }}
+    Falls back to the original upload when the variant cannot be rendered.
+    """
+    if not image_field:
+        return ""
+    width, _, extension = str(options).partition(",")
+    try:
+        return get_derivative_url(image_field, int(width) if width else None, extension or None)
+    except (OSError, ValueError):
+        logger.exception("Could not render a derivative of %s", image_field.name)
+        return image_field.url
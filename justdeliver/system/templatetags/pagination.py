@@ -0,0 +1,12 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def cursor_url(context, cursor):
+    # keeps filters and sorting from the current query string
+    query = context["request"].GET.copy()
+    query["cursor"] = cursor
+    query.pop("page", None)
+    return f"?{query.urlencode()}"
@@ -1,3 +1,613 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import random
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import ocr, perceptual, telemetry
+from .models import (
+    Company,
+    Delivery,
+    Driver,
+    DriverStats,
+    Employee,
+    ScreenshotBlob,
+    TelemetryJobState,
+    TelemetrySample,
+    TelemetrySegment,
+    TelemetrySession,
+    TelemetryToken,
+)
+from .pagination import CursorPaginator
+
+
+def create_driver(nick: str):
+    user = User.objects.create_user(username=nick, password="password")
+    return Driver.objects.create(user=user, nick=nick)
+
+
+def create_delivery(driver: Driver, **fields):
+    values = {
+        "loading_city": "Berlin",
+        "unloading_city": "Praha",
+        "cargo": "Cement",
+        "distance": 350,
+        "tonnage": 20,
+        "income": 10000,
+        "is_edited": False,
+    }
+    values.update(fields)
+    return Delivery.objects.create(driver=driver, **values)
+
+
+class DriverStatsTests(TestCase):
+    def setUp(self):
+        self.driver = create_driver("driver")
+        self.other_driver = create_driver("other")
+        DriverStats.rebuild_all()
+
+    def assertLedger(self, driver, distance, tonnage, deliveries_count, income):
+        stats = DriverStats.objects.get(driver=driver)
+        self.assertEqual(
+            (stats.distance, stats.tonnage, stats.deliveries_count, stats.income),
+            (distance, tonnage, deliveries_count, income),
+        )
+
+    def test_sent_delivery_is_not_counted(self):
+        create_delivery(self.driver)
+        self.assertLedger(self.driver, 0, 0, 0, 0)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_accepting_counts_delivery(self):
+        delivery = create_delivery(self.driver)
+        delivery.update_status("Zaakceptowana", "")
+        self.assertLedger(self.driver, 350, 20, 1, 10000)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_editing_accepted_delivery_moves_the_difference(self):
+        delivery = create_delivery(self.driver, status="Zaakceptowana")
+        delivery.distance = 500
+        delivery.income = 12000
+        delivery.save()
+        self.assertLedger(self.driver, 500, 20, 1, 12000)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_sending_back_for_corrections_uncounts_delivery(self):
+        delivery = create_delivery(self.driver, status="Zaakceptowana")
+        delivery.update_status("Do poprawy", "Zły ładunek")
+        self.assertLedger(self.driver, 0, 0, 0, 0)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_reassigning_driver_moves_delivery_between_ledgers(self):
+        delivery = create_delivery(self.driver, status="Zaakceptowana")
+        delivery.driver = self.other_driver
+        delivery.save()
+        self.assertLedger(self.driver, 0, 0, 0, 0)
+        self.assertLedger(self.other_driver, 350, 20, 1, 10000)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_change_of_instance_loaded_without_ledger_fields(self):
+        create_delivery(self.driver, status="Zaakceptowana")
+        delivery = Delivery.objects.only("id", "distance").get()
+        delivery.distance = 100
+        delivery.save()
+        self.assertLedger(self.driver, 100, 20, 1, 10000)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_deleting_delivery_uncounts_it(self):
+        delivery = create_delivery(self.driver, status="Zaakceptowana")
+        create_delivery(self.driver, status="Zaakceptowana", distance=100)
+        delivery.delete()
+        self.assertLedger(self.driver, 100, 20, 1, 10000)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_full_lifecycle_leaves_no_mismatches(self):
+        delivery = create_delivery(self.driver)
+        delivery.update_status("Zaakceptowana", "")
+        delivery.tonnage = 25
+        delivery.save()
+        delivery.driver = self.other_driver
+        delivery.save()
+        create_delivery(self.driver, status="Zaakceptowana", income=500)
+        delivery.delete()
+        self.assertLedger(self.driver, 350, 20, 1, 500)
+        self.assertLedger(self.other_driver, 0, 0, 0, 0)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_missing_ledger_row_is_rebuilt_on_change(self):
+        DriverStats.objects.filter(driver=self.driver).delete()
+        create_delivery(self.driver, status="Zaakceptowana")
+        self.assertLedger(self.driver, 350, 20, 1, 10000)
+        self.assertEqual(DriverStats.find_mismatches(), [])
+
+    def test_find_mismatches_reports_drifted_ledger(self):
+        create_delivery(self.driver, status="Zaakceptowana")
+        DriverStats.objects.filter(driver=self.driver).update(income=1)
+        self.assertEqual(DriverStats.find_mismatches(), [(self.driver.id, "income", 1, 10000)])
+
+
+class RecentDeliveriesTests(TestCase):
+    def setUp(self):
+        self.driver = create_driver("driver")
+
+    def test_orders_by_status_priority_then_newest(self):
+        accepted = create_delivery(self.driver, status="Zaakceptowana")
+        sent = create_delivery(self.driver)
+        rejected = create_delivery(self.driver, status="Odrzucona")
+        newer_sent = create_delivery(self.driver)
+        create_delivery(self.driver, is_edited=True)
+        self.assertEqual(
+            Delivery.get_last_deliveries_for_driver(self.driver),
+            [rejected, newer_sent, sent, accepted],
+        )
+
+    def test_status_change_moves_delivery(self):
+        first = create_delivery(self.driver)
+        second = create_delivery(self.driver)
+        first.update_status("Do poprawy", "Zły ładunek")
+        second.status = "Zaakceptowana"
+        second.save(update_fields=["status"])
+        self.assertEqual(Delivery.get_last_deliveries_for_driver(self.driver, limit=1), [first])
+        self.assertEqual(
+            list(Delivery.objects.order_by("id").values_list("status_priority", flat=True)),
+            [Delivery.STATUS_PRIORITY.index("Do poprawy"), Delivery.STATUS_PRIORITY.index("Zaakceptowana")],
+        )
+
+
+class WaybillExtractionTests(TestCase):
+    def setUp(self):
+        self.driver = create_driver("driver")
+        self.delivery = create_delivery(self.driver, cargo="", tonnage=0, is_edited=True)
+        self.readings = {
+            "cargo": {"value": "Cement", "confidence": 0.95},
+            "tonnage": {"value": 22, "confidence": 0.95},
+        }
+
+    def extract(self, extract_fields):
+        with mock.patch.object(ocr, "is_enabled", return_value=True), \
+                mock.patch.object(ocr, "extract_fields", side_effect=extract_fields):
+            Delivery.extract_waybill_fields.call_local(self.delivery.id)
+        return Delivery.objects.get(id=self.delivery.id)
+
+    def test_fills_empty_fields_of_a_draft(self):
+        delivery = self.extract(lambda paths: self.readings)
+        self.assertEqual((delivery.cargo, delivery.tonnage), ("Cement", 22))
+        self.assertEqual(delivery.ocr_fields, self.readings)
+
+    def test_delivery_submitted_during_ocr_is_not_overwritten(self):
+        def submit_while_reading(paths):
+            Delivery.objects.filter(id=self.delivery.id).update(is_edited=False, cargo="Stal", tonnage=0)
+            return self.readings
+
+        delivery = self.extract(submit_while_reading)
+        self.assertEqual((delivery.cargo, delivery.tonnage, delivery.ocr_fields), ("Stal", 0, {}))
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self):
+        driver = create_driver("driver")
+        deliveries = [create_delivery(driver) for _ in range(25)]
+        # groups of four deliveries share created_at, so page boundaries fall inside the ties
+        now = timezone.now()
+        for index, delivery in enumerate(deliveries):
+            Delivery.objects.filter(id=delivery.id).update(created_at=now - datetime.timedelta(minutes=index // 4))
+        self.queryset = Delivery.objects.all()
+        self.expected_ids = list(self.queryset.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def walk_forward(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append(page)
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_forward_walk_visits_every_row_once_in_order(self):
+        pages = self.walk_forward(CursorPaginator(self.queryset, 10))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([delivery.id for page in pages for delivery in page], self.expected_ids)
+
+    def test_first_and_last_page_boundaries(self):
+        pages = self.walk_forward(CursorPaginator(self.queryset, 10))
+        self.assertFalse(pages[0].has_previous)
+        self.assertTrue(pages[0].has_next)
+        self.assertTrue(pages[-1].has_previous)
+        self.assertFalse(pages[-1].has_next)
+
+    def test_backward_walk_returns_the_same_pages(self):
+        paginator = CursorPaginator(self.queryset, 10)
+        forward = self.walk_forward(paginator)
+        backward, page = [forward[-1]], forward[-1]
+        while page.has_previous:
+            page = paginator.page(page.previous_cursor)
+            backward.insert(0, page)
+        self.assertEqual(
+            [[delivery.id for delivery in page] for page in backward],
+            [[delivery.id for delivery in page] for page in forward],
+        )
+        self.assertFalse(backward[0].has_previous)
+
+    def test_going_back_and_forth_across_a_tie(self):
+        paginator = CursorPaginator(self.queryset, 3)
+        second = paginator.page(paginator.page().next_cursor)
+        # the second page ends inside a group of equal created_at values
+        self.assertEqual([delivery.id for delivery in second], self.expected_ids[3:6])
+        previous = paginator.page(second.previous_cursor)
+        self.assertEqual([delivery.id for delivery in previous], self.expected_ids[:3])
+        following = paginator.page(previous.next_cursor)
+        self.assertEqual([delivery.id for delivery in following], self.expected_ids[3:6])
+
+    def test_exact_multiple_of_page_size_has_no_empty_last_page(self):
+        pages = self.walk_forward(CursorPaginator(self.queryset.filter(id__in=self.expected_ids[:20]), 10))
+        self.assertEqual([len(page) for page in pages], [10, 10])
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        page = CursorPaginator(self.queryset, 10).page("not-a-cursor")
+        self.assertEqual([delivery.id for delivery in page], self.expected_ids[:10])
+
+    def test_count_is_capped_at_count_limit(self):
+        page = CursorPaginator(self.queryset, 10, count_limit=20).page()
+        self.assertEqual(page.count, 20)
+        self.assertTrue(page.count_is_estimate)
+
+
+class PerceptualHashSearchTests(TestCase):
+    # the top bit is set, so the stored value is negative
+    BASE_HASH = 0xF0E1_D2C3_B4A5_9687
+
+    def create_blob(self, value: int, sha256: str = None):
+        chunks = perceptual.split_chunks(value)
+        return ScreenshotBlob.objects.create(
+            sha256=sha256 or f"{value:064x}",
+            file=f"waybills/{value:016x}.png",
+            dhash=perceptual.to_signed(value),
+            dhash_0=chunks[0], dhash_1=chunks[1], dhash_2=chunks[2], dhash_3=chunks[3],
+        )
+
+    @staticmethod
+    def flip_spread(value: int, distance: int):
+        # the bits are spread over the chunks round robin, the hardest case for the chunk probes
+        for index in range(distance):
+            chunk, bit = index % perceptual.CHUNKS, index // perceptual.CHUNKS
+            value ^= 1 << (chunk * perceptual.CHUNK_BITS + bit)
+        return value
+
+    def test_spread_differences_up_to_max_distance_are_found(self):
+        max_distance = django_settings.PERCEPTUAL_HASH_MAX_DISTANCE
+        base = self.create_blob(self.BASE_HASH)
+        expected = {}
+        for distance in range(0, max_distance + 4):
+            # distance 0 is the same picture stored under another content hash
+            blob = self.create_blob(self.flip_spread(self.BASE_HASH, distance), sha256=f"{distance:064x}")
+            if distance <= max_distance:
+                expected[blob.id] = distance
+        self.assertEqual(base.find_similar(), expected)
+
+    def test_random_differences_match_a_full_scan(self):
+        max_distance = django_settings.PERCEPTUAL_HASH_MAX_DISTANCE
+        rng = random.Random(20)
+        base = self.create_blob(self.BASE_HASH)
+        values = set()
+        while len(values) < 300:
+            bits = rng.sample(range(perceptual.HASH_BITS), rng.randint(1, max_distance + 3))
+            values.add(self.BASE_HASH ^ sum(1 << bit for bit in bits))
+        blobs = [self.create_blob(value) for value in values]
+        expected = {
+            blob.id: perceptual.hamming(base.dhash, blob.dhash)
+            for blob in blobs
+            if perceptual.hamming(base.dhash, blob.dhash) <= max_distance
+        }
+        self.assertEqual(base.find_similar(), expected)
+
+    def test_every_radius_has_no_misses(self):
+        rng = random.Random(7)
+        base = self.create_blob(self.BASE_HASH)
+        blobs = [
+            self.create_blob(self.BASE_HASH ^ sum(1 << bit for bit in rng.sample(range(perceptual.HASH_BITS), distance)))
+            for distance in range(1, 13) for _ in range(5)
+        ]
+        for max_distance in range(0, 12):
+            expected = {
+                blob.id: perceptual.hamming(base.dhash, blob.dhash)
+                for blob in blobs
+                if perceptual.hamming(base.dhash, blob.dhash) <= max_distance
+            }
+            self.assertEqual(base.find_similar(max_distance), expected, f"max_distance={max_distance}")
+
+    def test_blob_without_hash_has_no_similar(self):
+        self.create_blob(self.BASE_HASH)
+        blob = ScreenshotBlob.objects.create(sha256="f" * 64, file="waybills/unhashed.png")
+        self.assertEqual(blob.find_similar(), {})
+
+
+def build_sample(seq: int, **fields):
+    sample = {"seq": seq, "t": 1_700_000_000_000 + seq * 1000, "x": 100.0, "y": 0.0, "z": -200.0, "speed": 20.0}
+    sample.update(fields)
+    return sample
+
+
+def use_temporary_segments_dir(test_case: TestCase):
+    segments_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, segments_dir)
+    segments_settings = override_settings(TELEMETRY_SEGMENTS_DIR=segments_dir)
+    segments_settings.enable()
+    test_case.addCleanup(segments_settings.disable)
+
+
+def pack_all(driver: Driver):
+    return TelemetrySegment.pack_driver_samples(driver.id, timezone.now() + datetime.timedelta(seconds=1))
+
+
+class TelemetryIngestionTests(TestCase):
+    def setUp(self):
+        self.driver = create_driver("driver")
+        self.token = TelemetryToken.issue(self.driver)
+        use_temporary_segments_dir(self)
+
+    def post(self, samples, session: str = None, compressed: bool = True, body: bytes = None):
+        if body is None:
+            body = b"\n".join(json.dumps(sample).encode() for sample in samples)
+        headers = {"HTTP_AUTHORIZATION": f"Token {self.token}"}
+        if compressed:
+            body = gzip.compress(body)
+            headers["HTTP_CONTENT_ENCODING"] = "gzip"
+        if session:
+            headers["HTTP_X_TELEMETRY_SESSION"] = session
+        return self.client.post(reverse("ingest_telemetry"), data=body, content_type="application/x-ndjson", **headers)
+
+    def assertCounts(self, response, status, accepted, duplicates, out_of_order, last_seq):
+        self.assertEqual(response.status_code, status)
+        result = response.json()
+        self.assertEqual(
+            (result["accepted"], result["duplicates"], result["out_of_order"], result["last_seq"]),
+            (accepted, duplicates, out_of_order, last_seq),
+        )
+
+    def stored_seqs(self):
+        return sorted(TelemetrySample.objects.filter(driver=self.driver).values_list("seq", flat=True))
+
+    def test_gzip_and_plain_batches_are_stored(self):
+        self.assertCounts(self.post([build_sample(seq) for seq in range(10)]), 202, 10, 0, 0, 9)
+        self.assertCounts(self.post([build_sample(seq) for seq in range(10, 20)], compressed=False), 202, 10, 0, 0, 19)
+        self.assertEqual(self.stored_seqs(), list(range(20)))
+
+    def test_unknown_token_is_refused(self):
+        self.token = "not-a-token"
+        self.assertEqual(self.post([build_sample(0)]).status_code, 401)
+        self.assertEqual(self.stored_seqs(), [])
+
+    def test_invalid_lines_are_rejected_one_by_one(self):
+        lines = [
+            json.dumps(build_sample(0)).encode(),
+            b"not json",
+            json.dumps({"seq": 1, "t": 0}).encode(),
+            json.dumps(build_sample(-1)).encode(),
+            json.dumps(build_sample(2, speed="fast")).encode(),
+            json.dumps(build_sample(3)).encode(),
+        ]
+        response = self.post(None, body=b"\n".join(lines))
+        self.assertCounts(response, 202, 2, 0, 0, 3)
+        self.assertEqual(response.json()["rejected"], 4)
+        self.assertEqual(self.stored_seqs(), [0, 3])
+
+    def test_batch_over_the_size_limit_is_refused(self):
+        with override_settings(TELEMETRY_MAX_BATCH_BYTES=1000):
+            self.assertEqual(self.post([build_sample(seq) for seq in range(100)]).status_code, 413)
+            self.assertEqual(self.post([build_sample(seq) for seq in range(100)], compressed=False).status_code, 413)
+        self.assertEqual(self.stored_seqs(), [])
+
+    def test_corrupted_gzip_is_refused(self):
+        body = gzip.compress(json.dumps(build_sample(0)).encode())[:-8] + b"garbage!"
+        response = self.client.post(
+            reverse("ingest_telemetry"), data=body, content_type="application/x-ndjson",
+            HTTP_AUTHORIZATION=f"Token {self.token}", HTTP_CONTENT_ENCODING="gzip",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_retried_batch_is_reported_as_duplicates(self):
+        batch = [build_sample(seq) for seq in range(10)]
+        self.assertCounts(self.post(batch), 202, 10, 0, 0, 9)
+        self.assertCounts(self.post(batch), 202, 0, 10, 0, 9)
+        self.assertCounts(self.post([build_sample(seq) for seq in range(5, 15)]), 202, 5, 5, 0, 14)
+        self.assertEqual(self.stored_seqs(), list(range(15)))
+
+    def test_retry_after_packing_is_not_stored_again(self):
+        batch = [build_sample(seq) for seq in range(10)]
+        self.post(batch)
+        self.assertEqual(pack_all(self.driver), 10)
+        self.assertCounts(self.post(batch), 202, 0, 10, 0, 9)
+        self.assertEqual(self.stored_seqs(), [])
+        self.assertEqual(pack_all(self.driver), 0)
+        self.assertEqual(TelemetrySegment.objects.get().samples, 10)
+
+    def test_samples_behind_later_ones_are_refused(self):
+        self.post([build_sample(seq) for seq in range(10)])
+        self.assertCounts(self.post([build_sample(seq) for seq in range(20, 30)]), 202, 10, 0, 0, 29)
+        response = self.post([build_sample(seq) for seq in range(8, 15)])
+        self.assertCounts(response, 409, 0, 2, 5, 29)
+        self.assertIn("error", response.json())
+        self.assertEqual(self.stored_seqs(), list(range(10)) + list(range(20, 30)))
+
+    def test_desktop_restart_continues_after_the_stored_samples(self):
+        self.assertCounts(self.post([build_sample(seq) for seq in range(10)], session="run-1"), 202, 10, 0, 0, 9)
+        pack_all(self.driver)
+        # the new run numbers its samples from 0 again
+        self.assertCounts(self.post([build_sample(seq) for seq in range(5)], session="run-2"), 202, 5, 0, 0, 4)
+        self.assertCounts(self.post([build_sample(seq) for seq in range(5)], session="run-2"), 202, 0, 5, 0, 4)
+        self.assertEqual(self.stored_seqs(), list(range(10, 15)))
+        # a retry of the first run is still recognised, a batch it never sent before is too late
+        self.assertCounts(self.post([build_sample(seq) for seq in range(5, 10)], session="run-1"), 202, 0, 5, 0, 9)
+        self.assertCounts(self.post([build_sample(seq) for seq in range(10, 13)], session="run-1"), 409, 0, 0, 3, 9)
+        self.assertEqual(self.stored_seqs(), list(range(10, 15)))
+
+
+class TelemetryChartTests(TestCase):
+    def setUp(self):
+        self.driver = create_driver("driver")
+        use_temporary_segments_dir(self)
+
+    def ingest(self, seqs):
+        lines = [json.dumps(build_sample(seq, speed=float(seq))).encode() for seq in seqs]
+        return TelemetrySample.ingest(self.driver, lines)
+
+    def test_chart_joins_packed_segments_and_the_unpacked_tail(self):
+        self.ingest(range(0, 30))
+        pack_all(self.driver)
+        self.ingest(range(30, 50))
+        pack_all(self.driver)
+        # received after the last packing, still in TelemetrySample
+        self.ingest(range(50, 60))
+        delivery = create_delivery(self.driver, telemetry_start_seq=10, telemetry_end_seq=59)
+        chart = TelemetrySegment.get_chart(delivery, ["speed", "odometer"], 1000)
+        self.assertEqual(chart["speed"]["values"], [float(seq) for seq in range(10, 60)])
+        self.assertEqual(chart["speed"]["t"], [build_sample(seq)["t"] for seq in range(10, 60)])
+        self.assertEqual(len(chart["odometer"]["t"]), 50)
+
+    def test_chart_is_downsampled_to_the_requested_points(self):
+        self.ingest(range(0, 500))
+        pack_all(self.driver)
+        delivery = create_delivery(self.driver, telemetry_start_seq=0, telemetry_end_seq=499)
+        chart = TelemetrySegment.get_chart(delivery, ["speed"], 100)
+        self.assertEqual(len(chart["speed"]["t"]), 100)
+        self.assertEqual((chart["speed"]["values"][0], chart["speed"]["values"][-1]), (0.0, 499.0))
+
+
+JOB_STARTED = {
+    "cargo": "Cement",
+    "cargo_mass": 20400,
+    "source_city": "Berlin",
+    "source_company": "Tree-ET",
+    "destination_city": "Praha",
+    "destination_company": "NBFC",
+    "income": 9000,
+}
+
+
+class TelemetryJobStateTests(TestCase):
+    def setUp(self):
+        self.driver = create_driver("driver")
+
+    def store(self, samples, session: str = ""):
+        return TelemetrySample.store_batch(self.driver, [
+            TelemetrySample(driver=self.driver, **telemetry.parse_sample(json.dumps(sample).encode()))
+            for sample in samples
+        ], session)
+
+    def build_job(self, first_seq: int, count: int, end_event: str = "job_delivered", end_payload=None):
+        """
+        A job driven over count samples: 2 km and 1 litre of fuel per sample, cargo damage growing to 3%.
+        """
+        samples = [
+            build_sample(seq, odometer=1000.0 + 2 * (seq - first_seq), fuel=400.0 - (seq - first_seq),
+                         damage=0.03 * (seq - first_seq) / (count - 1))
+            for seq in range(first_seq, first_seq + count)
+        ]
+        samples[0].update(event="job_started", payload=JOB_STARTED)
+        if end_event:
+            samples[-1].update(event=end_event, payload=end_payload or {})
+        return samples
+
+    def get_state(self):
+        return TelemetryJobState.objects.get(driver=self.driver)
+
+    def test_delivered_job_becomes_a_submitted_delivery(self):
+        self.assertEqual(self.store(self.build_job(0, 11, end_payload={"revenue": 9500})), (11, 0, 0, 10))
+        delivery = Delivery.objects.get(driver=self.driver)
+        self.assertEqual(
+            (delivery.loading_city, delivery.loading_spedition, delivery.unloading_city, delivery.unloading_spedition,
+             delivery.cargo, delivery.tonnage, delivery.distance, delivery.fuel, delivery.damage, delivery.income),
+            ("Berlin", "Tree-ET", "Praha", "NBFC", "Cement", 20, 20, 10, 3, 9500),
+        )
+        self.assertFalse(delivery.is_edited)
+        self.assertEqual((delivery.telemetry_start_seq, delivery.telemetry_end_seq), (0, 10))
+        state = self.get_state()
+        self.assertEqual((state.state, state.delivery, state.last_seq), ("Wolny", None, 10))
+
+    def test_job_split_across_batches(self):
+        samples = self.build_job(0, 11, end_payload={"distance": 25})
+        self.store(samples[:4])
+        state = self.get_state()
+        self.assertEqual((state.state, state.last_seq), ("W trasie", 3))
+        self.assertTrue(state.delivery.is_edited)
+        self.store(samples[4:])
+        delivery = Delivery.objects.get(driver=self.driver)
+        self.assertEqual((delivery.distance, delivery.fuel, delivery.income), (25, 10, 9000))
+        self.assertEqual((delivery.telemetry_start_seq, delivery.telemetry_end_seq), (0, 10))
+        self.assertFalse(delivery.is_edited)
+
+    def test_cancelled_job_deletes_its_draft(self):
+        self.store(self.build_job(0, 5, end_event="job_cancelled"))
+        self.assertFalse(Delivery.objects.filter(driver=self.driver).exists())
+        self.assertEqual(self.get_state().state, "Wolny")
+
+    def test_new_job_abandons_the_previous_one(self):
+        self.store(self.build_job(0, 5, end_event=None))
+        abandoned = self.get_state().delivery
+        self.store(self.build_job(5, 5))
+        self.assertFalse(Delivery.objects.filter(id=abandoned.id).exists())
+        delivery = Delivery.objects.get(driver=self.driver)
+        self.assertEqual((delivery.telemetry_start_seq, delivery.telemetry_end_seq, delivery.distance), (5, 9, 8))
+
+    def test_resent_batch_is_applied_once(self):
+        samples = self.build_job(0, 6)
+        self.store(samples[:3])
+        self.assertEqual(self.store(samples[:3]), (0, 3, 0, 2))
+        self.assertEqual(self.store(samples), (3, 3, 0, 5))
+        self.assertEqual(self.store(samples), (0, 6, 0, 5))
+        self.assertEqual(Delivery.objects.filter(driver=self.driver).count(), 1)
+        self.assertEqual(Delivery.objects.get(driver=self.driver).fuel, 5)
+
+    def test_sessions_continue_the_seqs_of_the_driver(self):
+        self.store(self.build_job(0, 5, end_event=None), session="run-1")
+        # the client restarted and numbers its samples from 0 again, finishing the job it was on
+        self.assertEqual(self.store([build_sample(0, event="job_delivered", payload={"distance": 40})], session="run-2"),
+                         (1, 0, 0, 0))
+        self.assertEqual(
+            list(TelemetrySession.objects.filter(driver=self.driver).order_by("seq_offset").values_list(
+                "key", "seq_offset", "end_seq")),
+            [("run-1", 0, 4), ("run-2", 5, None)],
+        )
+        delivery = Delivery.objects.get(driver=self.driver)
+        self.assertEqual((delivery.telemetry_start_seq, delivery.telemetry_end_seq, delivery.distance), (0, 5, 40))
+        self.assertEqual(self.get_state().last_seq, 5)
+
+    def test_samples_of_an_ended_session_are_refused(self):
+        self.store([build_sample(seq) for seq in range(3)], session="run-1")
+        self.store([build_sample(0)], session="run-2")
+        # run-1 is still sending: what it sent before is a duplicate, anything new is refused
+        self.assertEqual(self.store([build_sample(seq) for seq in range(2, 5)], session="run-1"), (0, 1, 2, 2))
+        self.assertEqual(list(TelemetrySample.objects.filter(driver=self.driver).order_by("seq").values_list(
+            "seq", flat=True)), [0, 1, 2, 3])
+        self.assertEqual(self.get_state().last_seq, 3)
+
+
+class FleetNearTests(TestCase):
+    def setUp(self):
+        owner = create_driver("owner")
+        Employee.objects.create(driver=owner, company=Company.objects.create(name="Company"), job_title="owner")
+        self.client.force_login(owner.user)
+        catalog = mock.Mock(coordinates={0: (0.0, 0.0)})
+        catalog.get_city_index.return_value = 0
+        catalog_patch = mock.patch("system.views.get_catalog", return_value=catalog)
+        catalog_patch.start()
+        self.addCleanup(catalog_patch.stop)
+
+    def get_near(self, radius):
+        return self.client.get("/Company/Fleet", {"near": "Berlin", "radius": radius})
+
+    def test_radius_up_to_the_limit_is_accepted(self):
+        self.assertEqual(self.get_near(django_settings.FLEET_NEAR_MAX_RADIUS_KM).status_code, 200)
+
+    def test_radius_above_the_limit_is_refused(self):
+        self.assertEqual(self.get_near(django_settings.FLEET_NEAR_MAX_RADIUS_KM + 1).status_code, 400)
+        self.assertEqual(self.get_near("1e308").status_code, 400)
+        self.assertEqual(self.get_near("inf").status_code, 400)
@@ -1,12 +1,23 @@
 import json
+import math
+import zlib
+from django.conf import settings as django_settings
 from django.shortcuts import render, redirect
 from django.core import serializers
 from django.contrib import messages
 from django.contrib.messages import get_messages
 from django.http import HttpResponse, JsonResponse
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from .models import Driver, Disposition, DeliveryScreenshot, Delivery, Vehicle, Offer, Company, Employee
+from django.views.decorators.csrf import csrf_exempt
+from .models import Driver, Disposition, DeliveryScreenshot, Delivery, Vehicle, Offer, Company, Employee, \
+    CompanyDirectorySnapshot, TelemetrySample, TelemetrySegment, TelemetryToken
 from .forms import *
+from .pagination import CursorPaginator, RankedPaginator
+from .derivatives import generate_derivatives
+from .cities import get_catalog
+from .concurrency import run_sync
+from .fleet import build_snapshot as build_fleet_snapshot, get_fleet_store, km_to_game_units
+from .segments import CHART_SERIES, DOWNSAMPLING
+from .telemetry import BatchTooLarge, read_lines as read_telemetry_lines
 from django.contrib.sites.shortcuts import get_current_site
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
@@ -68,46 +79,118 @@ def account_activation_sent(request):
     return render(request, "account_activation_sent.html")
 
 def dashboard(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     info = driver.get_driver_info()
     context = {
         "dashboard": "option--active",
         "info": info,
-        "is_employed": driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "dashboard.html", context)
 
 
+async def get_driver_async(request):
+    # request.driver_ctx (and request.user under it) query on first access, which must not happen in the event loop
+    return await run_sync(lambda: request.driver_ctx.driver)
+
+
+async def dashboard_async(request):
+    driver = await get_driver_async(request)
+    info = await driver.aget_driver_info()
+    context = {
+        "dashboard": "option--active",
+        "info": info,
+    }
+    return await run_sync(render, request, "dashboard.html", context)
+
+
 def select_delivery_adding_mode(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
     context = {
         "add_new_delivery": "option--active",
-        "is_employed": driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "choose_delivery_method.html", context)
 
 
 def upload_screenshots(request):
     if request.method == "POST":
-        delivery_key = DeliveryScreenshot.process_screenshots(
-            user=request.user,
+        result = DeliveryScreenshot.process_screenshots(
+            driver=request.driver_ctx.driver,
             screenshots=request.FILES,
         )
+        if result.get("error"):
+            return JsonResponse({"error": result.get("error")}, status=400)
 
         #uuid serialization error forces casting to string
-        request.session["delivery_key"] = str(delivery_key)
-        return HttpResponse(status=200, content="Poprawnie utworzono list przewozowy.")
+        request.session["delivery_key"] = str(result.get("delivery_key"))
+        return JsonResponse({
+            "delivery_key": str(result.get("delivery_key")),
+            "duplicates": result.get("duplicates"),
+        }, status=202)
     else:
         return HttpResponse(status=405, content="Błędna metoda HTTP. Upewnij się, "
                                                 "że korzystasz z formularza do screenshotów.")
 
 
+@csrf_exempt
+def ingest_telemetry(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Błędna metoda HTTP."}, status=405)
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    driver = TelemetryToken.authenticate(token) if scheme == "Token" else None
+    if not driver:
+        return JsonResponse({"error": "Nieprawidłowy token telemetrii."}, status=401)
+    compressed = request.headers.get("Content-Encoding", "") == "gzip"
+    session_key = request.headers.get("X-Telemetry-Session", "")[:64]
+    try:
+        lines = read_telemetry_lines(request, compressed, django_settings.TELEMETRY_MAX_BATCH_BYTES)
+        result = TelemetrySample.ingest(driver, lines, session_key)
+    except BatchTooLarge:
+        return JsonResponse({"error": "Paczka telemetrii jest zbyt duża."}, status=413)
+    except (OSError, zlib.error):
+        return JsonResponse({"error": "Niepoprawnie skompresowana paczka telemetrii."}, status=400)
+    if result["out_of_order"]:
+        result["error"] = "Część próbek telemetrii przyszła po późniejszych i nie została zapisana."
+        return JsonResponse(result, status=409)
+    return JsonResponse(result, status=202)
+
+
+def company_fleet(request):
+    driver = request.driver_ctx.driver
+    if not driver.is_employed or driver.job_title not in ("owner", "speditor"):
+        return JsonResponse({"error": "Nie masz uprawnień do podglądu floty."}, status=403)
+    store = get_fleet_store()
+    positions = store.get_company(driver.company.id)
+    if request.GET.get("near"):
+        catalog = get_catalog()
+        city = catalog.get_city_index(request.GET.get("near"))
+        if city is None or any(math.isnan(value) for value in catalog.coordinates[city]):
+            return JsonResponse({"error": "Nieznane miasto lub brak jego położenia."}, status=400)
+        try:
+            radius_km = float(request.GET.get("radius", django_settings.FLEET_NEAR_RADIUS_KM))
+        except ValueError:
+            return JsonResponse({"error": "Niepoprawny promień."}, status=400)
+        if not math.isfinite(radius_km) or radius_km < 0:
+            return JsonResponse({"error": "Niepoprawny promień."}, status=400)
+        if radius_km > django_settings.FLEET_NEAR_MAX_RADIUS_KM:
+            return JsonResponse(
+                {"error": f"Promień może wynosić najwyżej {django_settings.FLEET_NEAR_MAX_RADIUS_KM} km."}, status=400)
+        radius = km_to_game_units(radius_km)
+        x, z = catalog.coordinates[city]
+        company_drivers = {position["driver"] for position in positions}
+        positions = [position for position in store.get_near(x, z, radius) if position["driver"] in company_drivers]
+    return JsonResponse(build_fleet_snapshot(positions))
+
+
+def telemetry_token(request):
+    if request.method == "POST":
+        token = TelemetryToken.issue(request.driver_ctx.driver)
+        return JsonResponse({"token": token})
+    return JsonResponse({"error": "Błędna metoda HTTP."}, status=405)
+
+
 def add_delivery_details(request):
     if request.session.get("delivery_key"):
         delivery_key = request.session.get("delivery_key")
-        driver = Driver.get_driver_by_user_profile(request.user)
+        driver = request.driver_ctx.driver
         try:
             delivery = Delivery.objects.get(delivery_key=delivery_key)
             if request.method == "POST":
@@ -116,6 +199,7 @@ def add_delivery_details(request):
                     delivery.is_edited = False
                     delivery.driver = driver
                     form.save()
+                    delivery.record_ocr_mismatches()
                     del request.session["delivery_key"]
                     messages.success(request, "Dostawa została wysłana poprawnie i oczekuje na zatwierdzenie przez spedycję.")
                     return redirect("/dashboard")
@@ -130,8 +214,6 @@ def add_delivery_details(request):
                     'form': NewDeliveryForm(instance=delivery),
                     'disposition': disposition,
                     'add_new_delivery': 'option--active',
-                    "is_employed": driver.is_employed,
-                    "has_speditor_permissions": driver.has_speditor_permissions,
                 }
                 return render(request, "add_delivery_details.html", context)
         except Delivery.DoesNotExist:
@@ -141,47 +223,60 @@ def add_delivery_details(request):
 
 
 def drivers_card(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     info = driver.get_driver_info()
     context = {
         "info": info,
         "drivers_card": "option--active",
-        "is_employed": driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "drivers_card.html", context)
 
 
+async def drivers_card_async(request):
+    driver = await get_driver_async(request)
+    info = await driver.aget_driver_info()
+    context = {
+        "info": info,
+        "drivers_card": "option--active",
+    }
+    return await run_sync(render, request, "drivers_card.html", context)
+
+
 def show_dispositions(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     current_disposition = Disposition.get_disposition_for_driver(driver)
     dispositions = Disposition.get_unaccepted_dispositions(driver)
     context = {
         'current_disposition': current_disposition,
         'dispositions': dispositions,
         'dispositions_tag': "option--active",
-        'is_employed': driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "dispositions.html", context)
 
 
 def generate_disposition(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if driver.is_employed and driver.job_title == "owner" or driver.job_title == "speditor":
         if request.POST:
-            if Disposition.generate_disposition(request.POST.get("driver"), request.POST):
-                messages.success(request, "Dyspozycja została wygenerowana poprawnie.")
+            employees = Employee.get_company_employees(driver.company)
+            if not request.POST.get("all-drivers"):
+                employee_ids = request.POST.getlist("driver")
+                if not all(employee_id.isdigit() for employee_id in employee_ids):
+                    return HttpResponse(status=403, content="Niepoprawny identyfikator kierowcy.")
+                employees = employees.filter(id__in=employee_ids)
+            result = Disposition.generate_dispositions(employees, request.POST)
+            if result.get("skipped"):
+                messages.warning(request, f"Brak ostatniego miasta rozładunku dla: {', '.join(result.get('skipped'))}.")
+            if result.get("message"):
+                messages.success(request, result.get("message"))
                 return redirect("/Company/Dispositions")
             else:
-                return HttpResponse(status=403, content="Błąd generowania dyspozycji.")
+                return HttpResponse(status=403, content=result.get("error"))
         else:
             employees = Employee.get_all_company_employees(driver.company)
             context = {
                 'employees': employees,
                 'company_dispositions_tag': "option--active",
-                'is_employed': driver.is_employed,
-                "has_speditor_permissions": driver.has_speditor_permissions,
             }
             return render(request, "generate_disposition.html", context)
     else:
@@ -190,7 +285,7 @@ def generate_disposition(request):
 
 
 def accept_disposition(request, disposition_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     try:
         Disposition.accept_disposition(driver, disposition_id)
         messages.success(request, "Dyspozycja została przyjęta do realizacji. Wykonaj zlecenie o danych z dyspozycji, aby ją zrealizować.")
@@ -200,7 +295,7 @@ def accept_disposition(request, disposition_id):
 
 
 def delete_disposition(request, disposition_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if not driver.is_employed or (driver.is_employed and driver.job_title == "owner" or driver.job_title == "speditor"):
         try:
             Disposition.delete_disposition(driver, disposition_id)
@@ -213,7 +308,7 @@ def delete_disposition(request, disposition_id):
 
 
 def cancel_disposition(request, disposition_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     try:
         Disposition.cancel_disposition(driver, disposition_id)
         messages.success(request, "Dyspozycja została anulowana poprawnie.")
@@ -223,7 +318,7 @@ def cancel_disposition(request, disposition_id):
 
 
 def show_vehicles(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if driver.is_employed:
         employee = Employee.get_employee_by_driver_account(driver=driver)
         current_vehicle = Vehicle.get_vehicle_for_driver(employee=employee)
@@ -236,14 +331,12 @@ def show_vehicles(request):
         'current_vehicle': current_vehicle,
         'vehicles': vehicles,
         'vehicles_tag': "option--active",
-        'is_employed': driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "vehicles.html", context)
 
 
 def add_new_vehicle(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if driver.is_employed and driver.job_title == "owner" or driver.job_title == "speditor":
         if request.method == "POST":
             form = NewVehicleForm(request.POST)
@@ -252,6 +345,8 @@ def add_new_vehicle(request):
                 vehicle.company_owner = driver.company
                 vehicle.photo = request.FILES.get("photo")
                 vehicle.save()
+                if vehicle.photo:
+                    generate_derivatives(vehicle.photo.name)
                 messages.success(request, "Pojazd został dodany poprawnie.")
                 return redirect("/Company/Vehicles")
             else:
@@ -261,8 +356,6 @@ def add_new_vehicle(request):
             context = {
                 'form': NewVehicleForm(),
                 'vehicles_tag': "option--active",
-                'is_employed': driver.is_employed,
-                "has_speditor_permissions": driver.has_speditor_permissions,
             }
             return render(request, "add_new_vehicle.html", context)
     else:
@@ -270,7 +363,7 @@ def add_new_vehicle(request):
 
 
 def edit_vehicle(request, vehicle_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if driver.is_employed and driver.job_title == "owner" or driver.job_title == "speditor":
         vehicle = Vehicle.get_vehicle_from_id(vehicle_id)
         if vehicle:
@@ -284,6 +377,8 @@ def edit_vehicle(request, vehicle_id):
                         new_driver = Employee.get_employee_by_id(int(request.POST.get("owner")))
                         vehicle.driver_owner = new_driver
                     edited_vehicle.save()
+                    if request.FILES.get("photo"):
+                        generate_derivatives(edited_vehicle.photo.name)
                     messages.success(request, "Pojazd został edytowany poprawnie.")
                     return redirect("/Company/Vehicles")
                 else:
@@ -296,8 +391,6 @@ def edit_vehicle(request, vehicle_id):
                     'employees': employees,
                     'vehicle': vehicle,
                     'vehicles_tag': "option--active",
-                    'is_employed': driver.is_employed,
-                    "has_speditor_permissions": driver.has_speditor_permissions,
                 }
                 return render(request, "edit_vehicle.html", context)
         else:
@@ -307,7 +400,7 @@ def edit_vehicle(request, vehicle_id):
 
 
 def select_vehicle(request, vehicle_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if not driver.is_employed:
         messages = Vehicle.change_selected_vehicle(driver, vehicle_id)
         if messages.get("error"):
@@ -324,28 +417,44 @@ def select_vehicle(request, vehicle_id):
 
 
 def show_offers(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
+    order = request.GET.get('order')
     offers_list = Offer.get_offers()
-    paginator = Paginator(offers_list, 10)
-    page = request.GET.get('page')
-    try:
-        offers = paginator.page(page)
-    except PageNotAnInteger:
-        offers = paginator.page(1)
-    except EmptyPage:
-        offers = paginator.page(paginator.num_pages)
+    if order == "recommended":
+        offer_ids = Offer.get_recommended_offer_ids(driver, request.GET.get('trailer'))
+        offers = RankedPaginator(offers_list, offer_ids, 10).page(request.GET.get('cursor'))
+    else:
+        offers = CursorPaginator(offers_list, 10, count_limit=1000).page(request.GET.get('cursor'))
 
     context = {
         "offers": offers,
+        "order": order,
         "offers_market": "option--active",
-        'is_employed': driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "offers_market.html", context)
 
 
+async def show_offers_async(request):
+    order = request.GET.get('order')
+    offers_list = Offer.get_offers()
+    if order == "recommended":
+        driver = await get_driver_async(request)
+        offer_ids = await run_sync(Offer.get_recommended_offer_ids, driver, request.GET.get('trailer'))
+        offers = await run_sync(RankedPaginator(offers_list, offer_ids, 10).page, request.GET.get('cursor'))
+    else:
+        # the driver context is resolved by the context processor while rendering
+        offers = await run_sync(CursorPaginator(offers_list, 10, count_limit=1000).page, request.GET.get('cursor'))
+
+    context = {
+        "offers": offers,
+        "order": order,
+        "offers_market": "option--active",
+    }
+    return await run_sync(render, request, "offers_market.html", context)
+
+
 def accept_offer(request, offer_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if not driver.is_employed or (driver.is_employed and driver.job_title == "owner" or driver.job_title == "speditor"):
         offer = Offer.get_offer_by_id(offer_id)
         if offer:
@@ -353,6 +462,8 @@ def accept_offer(request, offer_id):
             if result.get("message"):
                 messages.success(request, "Oferta została zaakceptowana poprawnie.")
                 return redirect("/dispositions")
+            elif result.get("taken"):
+                return HttpResponse(status=409, content=result.get("error"))
             else:
                 return HttpResponse(status=403, content=result.get("error"))
         else:
@@ -362,7 +473,7 @@ def accept_offer(request, offer_id):
 
 
 def create_company(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if not driver.is_employed:
         if request.method == "POST":
             form = CreateCompanyForm(request.POST)
@@ -377,8 +488,6 @@ def create_company(request):
             context = {
                 'form': CreateCompanyForm(),
                 "create_company": "option--active",
-                'is_employed': driver.is_employed,
-                "has_speditor_permissions": driver.has_speditor_permissions,
             }
         return render(request, "create_company.html", context)
     else:
@@ -386,43 +495,32 @@ def create_company(request):
 
 
 def find_company(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
-    companies_list = Company.get_all_companies()
-    paginator = Paginator(companies_list, 10)
-    page = request.GET.get('page')
-
-    try:
-        companies = paginator.page(page)
-    except PageNotAnInteger:
-        companies = paginator.page(1)
-    except EmptyPage:
-        companies = paginator.page(paginator.num_pages)
+    sort = request.GET.get('sort', 'distance')
+    companies_list = CompanyDirectorySnapshot.get_directory(sort)
+    ordering = CompanyDirectorySnapshot.SORTING.get(sort, CompanyDirectorySnapshot.SORTING["distance"])
+    companies = CursorPaginator(companies_list, 10, ordering=ordering).page(request.GET.get('cursor'))
 
     context = {
         "companies": companies,
+        "sort": sort,
         "find_company": "option--active",
-        'is_employed': driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
 
     return render(request, "find_company.html", context)
 
 
 def show_company_details(request, company_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
     company = Company.get_company_by_id(company_id)
     info = company.get_company_info()
     context = {
         "info": info,
         "find_company": "option--active",
-        'is_employed': driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "company_details.html", context)
 
 
 def employee_application(request, company_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if not driver.is_employed:
         if request.method == "POST":
             form = NewApplicationForm(request.POST)
@@ -441,62 +539,38 @@ def employee_application(request, company_id):
             context = {
                 'form': NewApplicationForm(),
                 "find_company": "option--active",
-                'is_employed': driver.is_employed,
-                "has_speditor_permissions": driver.has_speditor_permissions,
             }
             return render(request, "new_application_form.html", context)
     else:
         return HttpResponse(status=403, content="Nie jesteś uprawniony do wysyłania podania o pracę.")
 
 def driver_deliveries(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     deliveries_list = Delivery.get_all_driver_deliveries(driver)
-    if deliveries_list:
-        paginator = Paginator(deliveries_list, 10)
-        page = request.GET.get('page')
-
-        try:
-            deliveries = paginator.page(page)
-        except PageNotAnInteger:
-            deliveries = paginator.page(1)
-        except EmptyPage:
-            deliveries = paginator.page(paginator.num_pages)
-
-    else:
-        deliveries = None
+    deliveries = CursorPaginator(deliveries_list, 10).page(request.GET.get('cursor'))
 
     context = {
         "deliveries": deliveries,
         "deliveries_tag": "option--active",
-        'is_employed': driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
 
     return render(request, "driver_deliveries.html", context)
 
 
 def delivery_office(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if driver.is_employed:
         if driver.company and (driver.job_title == "owner" or driver.job_title == "speditor"):
             company = driver.company
-            deliveries_list = Delivery.get_all_company_deliveries(driver, company)
-            if deliveries_list:
-                paginator = Paginator(deliveries_list, 10)
-                page = request.GET.get('page')
-
-                try:
-                    deliveries = paginator.page(page)
-                except PageNotAnInteger:
-                    deliveries = paginator.page(1)
-                except EmptyPage:
-                    deliveries = paginator.page(paginator.num_pages)
+            deliveries_list = Delivery.get_all_company_deliveries(driver, company, request.GET)
+            if deliveries_list is not None:
+                deliveries = CursorPaginator(deliveries_list, 10).page(request.GET.get('cursor'))
 
                 context = {
                     "deliveries": deliveries,
+                    "filters": request.GET,
+                    "employees": company.drivers_list.select_related("driver"),
                     "delivery_office": "option--active",
-                    'is_employed': driver.is_employed,
-                    "has_speditor_permissions": driver.has_speditor_permissions,
                 }
 
                 return render(request, "delivery_office.html", context)
@@ -508,7 +582,7 @@ def delivery_office(request):
         return redirect('driver_deliveries')
 
 def edit_delivery_details(request, delivery_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     try:
         delivery = Delivery.objects.get(id=delivery_id)
         if delivery.driver == driver:
@@ -530,8 +604,6 @@ def edit_delivery_details(request, delivery_id):
                     'form': EditDeliveryForm(instance=delivery),
                     'disposition': disposition,
                     'add_new_delivery': 'option--active',
-                    "is_employed": driver.is_employed,
-                    "has_speditor_permissions": driver.has_speditor_permissions,
                 }
                 return render(request, "add_delivery_details.html", context)
         else:
@@ -540,8 +612,34 @@ def edit_delivery_details(request, delivery_id):
         return HttpResponse(status=403, content="Dostawa nie istnieje.")
 
 
+def delivery_telemetry_chart(request, delivery_id):
+    driver = request.driver_ctx.driver
+    try:
+        delivery = Delivery.get_delivery_by_id(delivery_id)
+    except Delivery.DoesNotExist:
+        return JsonResponse({"error": "Dostawa nie istnieje."}, status=404)
+    if driver.is_employed:
+        allowed = delivery.driver == driver or (
+            delivery.driver.company == driver.company and driver.job_title in ("owner", "speditor"))
+    else:
+        allowed = delivery.driver == driver
+    if not allowed:
+        return JsonResponse({"error": "Nie masz uprawnień do podglądu tej dostawy."}, status=403)
+
+    series = [name for name in request.GET.get("series", "speed,fuel").split(",") if name in CHART_SERIES]
+    method = request.GET.get("method", "lttb")
+    if not series or method not in DOWNSAMPLING:
+        return JsonResponse({"error": "Niepoprawne parametry wykresu."}, status=400)
+    try:
+        points = min(int(request.GET.get("points", django_settings.TELEMETRY_CHART_POINTS)),
+                     django_settings.TELEMETRY_CHART_MAX_POINTS)
+    except ValueError:
+        points = django_settings.TELEMETRY_CHART_POINTS
+    return JsonResponse(TelemetrySegment.get_chart(delivery, series, max(points, 3), method))
+
+
 def show_delivery_details(request, delivery_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if driver.is_employed and (driver.company and (driver.job_title == "owner" or driver.job_title == "speditor")) or not driver.is_employed:
         try:
             delivery = Delivery.get_delivery_by_id(delivery_id)
@@ -558,13 +656,27 @@ def show_delivery_details(request, delivery_id):
                 else:
                     own_delivery = False
 
+                duplicate_deliveries = DeliveryScreenshot.get_deliveries_with_same_screenshots(delivery)
+                if driver.is_employed:
+                    duplicate_deliveries = duplicate_deliveries.filter(driver__employee__company=driver.company)
+                else:
+                    duplicate_deliveries = duplicate_deliveries.filter(driver=driver)
+                # matches from other companies are only counted, their deliveries stay private
+                near_duplicates = DeliveryScreenshot.get_near_duplicates(delivery)
+                own_near_duplicates = [
+                    match for match in near_duplicates
+                    if match["company"] == driver.company and (driver.is_employed or match["delivery"].driver == driver)
+                ]
+
                 context = {
                     'delivery': delivery,
                     'screenshots': screenshots,
                     'disposition': disposition,
-                    'is_employed': driver.is_employed,
-                    "has_speditor_permissions": driver.has_speditor_permissions,
                     'own_delivery': own_delivery,
+                    'duplicate_deliveries': duplicate_deliveries,
+                    'near_duplicates': own_near_duplicates,
+                    'foreign_near_duplicates_count': len(near_duplicates) - len(own_near_duplicates),
+                    'has_telemetry': TelemetrySegment.get_segments_for_delivery(delivery).exists(),
                 }
 
                 return render(request, "delivery_details.html", context)
@@ -578,7 +690,7 @@ def show_delivery_details(request, delivery_id):
 def edit_delivery_status(request):
     if request.method == "POST":
         body = json.loads(request.body.decode("utf-8"))
-        driver = Driver.get_driver_by_user_profile(request.user)
+        driver = request.driver_ctx.driver
         if (driver.is_employed and (driver.company and (driver.job_title == "owner" or driver.job_title == "speditor"))) or not driver.is_employed:
             try:
                 delivery_id = body.get("delivery_id")
@@ -604,32 +716,20 @@ def edit_delivery_status(request):
 
 
 def manage_drivers(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if driver.is_employed:
         if driver.company and driver.job_title == "owner":
             company = driver.company
-            company_drivers_list = Employee.get_all_company_employees(company)
-            if company_drivers_list:
-                paginator = Paginator(company_drivers_list, 10)
-                page = request.GET.get('page')
-
-                try:
-                    company_drivers = paginator.page(page)
-                except PageNotAnInteger:
-                    company_drivers = paginator.page(1)
-                except EmptyPage:
-                    company_drivers = paginator.page(paginator.num_pages)
+            company_drivers_list = Employee.get_company_employees(company)
+            company_drivers = CursorPaginator(company_drivers_list, 10, ordering=("id",)).page(request.GET.get('cursor'))
+            company_drivers.object_list = [employee.get_list_info() for employee in company_drivers]
 
-                context = {
-                    "company_drivers": company_drivers,
-                    "manage_drivers": "option--active",
-                    'is_employed': driver.is_employed,
-                    "has_speditor_permissions": driver.has_speditor_permissions,
-                }
+            context = {
+                "company_drivers": company_drivers,
+                "manage_drivers": "option--active",
+            }
 
-                return render(request, "manage_drivers.html", context)
-            else:
-                return HttpResponse(status=403, content="Nie jesteś uprawniony do wykonania tej operacji.")
+            return render(request, "manage_drivers.html", context)
         else:
             return HttpResponse(status=403, content="Nie jesteś uprawniony do wykonania tej operacji.")
     else:
@@ -637,7 +737,7 @@ def manage_drivers(request):
 
 
 def company_driver_details(request, employee_id):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     employee = Employee.get_employee_by_id(employee_id)
     if current_driver.is_employed and employee:
         if current_driver.company == employee.company:
@@ -645,8 +745,6 @@ def company_driver_details(request, employee_id):
             context = {
                 "info": info,
                 "manage_drivers": "option--active",
-                "is_employed": current_driver.is_employed,
-                "has_speditor_permissions": current_driver.has_speditor_permissions,
             }
             return render(request, "drivers_card.html", context)
         else:
@@ -656,7 +754,7 @@ def company_driver_details(request, employee_id):
 
 
 def edit_driver_profile(request, employee_id):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     employee = Employee.get_employee_by_id(employee_id)
     if current_driver.is_employed and employee:
         if current_driver.company and current_driver.job_title == "owner" and current_driver.company == employee.company:
@@ -675,8 +773,6 @@ def edit_driver_profile(request, employee_id):
                     "info": info,
                     "employee_id": employee_id,
                     "manage_drivers": "option--active",
-                    "is_employed": current_driver.is_employed,
-                    "has_speditor_permissions": current_driver.has_speditor_permissions,
                     "form": form,
                 }
             return render(request, "edit_driver.html", context)
@@ -687,7 +783,7 @@ def edit_driver_profile(request, employee_id):
 
 
 def dismiss_driver(request, employee_id):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     employee = Employee.get_employee_by_id(employee_id)
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner" and current_driver.company == employee.company:
@@ -701,7 +797,7 @@ def dismiss_driver(request, employee_id):
 
 
 def hire_driver(request):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner":
             if request.method == "POST" and request.POST:
@@ -718,8 +814,6 @@ def hire_driver(request):
                 form = AddEmployeeForm()
                 context = {
                     "manage_drivers": "option--active",
-                    "is_employed": current_driver.is_employed,
-                    "has_speditor_permissions": current_driver.has_speditor_permissions,
                     "form": form,
                     "vehicles": vehicles,
                 }
@@ -731,7 +825,7 @@ def hire_driver(request):
 
 
 def find_driver(request, nickname):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner":
             if nickname:
@@ -748,8 +842,26 @@ def find_driver(request, nickname):
         return HttpResponse(status=403, content="Nie jesteś uprawniony do wykonania tej operacji.")
 
 
+async def find_driver_async(request, nickname):
+    current_driver = await get_driver_async(request)
+    if current_driver.is_employed:
+        if current_driver.company and current_driver.job_title == "owner":
+            if nickname:
+                drivers = await run_sync(Driver.find_driver_by_nickname, nickname)
+                if drivers:
+                    return JsonResponse({'drivers': list(drivers)})
+                else:
+                    return JsonResponse({"message": "Nie znaleziono kierowców spełniających żądanie."})
+            else:
+                return HttpResponse(status=401, content="Nieprawidłowa nazwa użytkownika lub jej brak.")
+        else:
+            return HttpResponse(status=403, content="Nie jesteś uprawniony do wykonania tej operacji.")
+    else:
+        return HttpResponse(status=403, content="Nie jesteś uprawniony do wykonania tej operacji.")
+
+
 def show_company_vehicles(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     employee = Employee.get_employee_by_driver_account(driver)
     vehicles = Vehicle.get_company_vehicles(driver.company, employee)
     current_vehicle = Vehicle.get_vehicle_for_driver(employee=employee)
@@ -757,13 +869,11 @@ def show_company_vehicles(request):
         'current_vehicle': current_vehicle,
         'vehicles': vehicles,
         'vehicles_tag': "option--active",
-        'is_employed': driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "vehicles.html", context)
 
 def delete_vehicle(request, vehicle_id):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     if driver.is_employed and driver.job_title == "owner":
         response = Vehicle.delete_vehicle(vehicle_id)
         if response.get("error"):
@@ -775,27 +885,18 @@ def delete_vehicle(request, vehicle_id):
         return HttpResponse(status=403, content="Nie masz uprawnień do usuwania pojazdu.")
 
 def show_company_dispositions(request):
-    driver = Driver.get_driver_by_user_profile(request.user)
+    driver = request.driver_ctx.driver
     dispositions_list = Disposition.get_company_dispositions(driver.company)
 
-    paginator = Paginator(dispositions_list, 7)
-    page = request.GET.get('page')
-    try:
-        dispositions = paginator.page(page)
-    except PageNotAnInteger:
-        dispositions = paginator.page(1)
-    except EmptyPage:
-        dispositions = paginator.page(paginator.num_pages)
+    dispositions = CursorPaginator(dispositions_list, 7).page(request.GET.get('cursor'))
     context = {
         'dispositions': dispositions,
         'company_dispositions_tag': "option--active",
-        'is_employed': driver.is_employed,
-        "has_speditor_permissions": driver.has_speditor_permissions,
     }
     return render(request, "company_dispositions.html", context)
 
 def company_preferences(request):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner":
             if request.POST:
@@ -809,8 +910,6 @@ def company_preferences(request):
                 context = {
                     'form': form,
                     'company_preferences': "option--active",
-                    'is_employed': current_driver.is_employed,
-                    "has_speditor_permissions": current_driver.has_speditor_permissions,
                 }
                 return render(request, "company_settings.html", context)
         else:
@@ -819,7 +918,7 @@ def company_preferences(request):
         return HttpResponse(status=403, content="Nie jesteś uprawniony do wykonania tej operacji.")
 
 def delete_company(request):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner":
             current_driver.company.delete_company()
@@ -831,23 +930,14 @@ def delete_company(request):
         return HttpResponse(status=403, content="Nie jesteś uprawniony do wykonania tej operacji.")
 
 def show_company_applications(request):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner":
             applications_list = EmployeeApplication.get_all_company_applications(current_driver.company)
-            paginator = Paginator(applications_list, 10)
-            page = request.GET.get('page')
-            try:
-                applications = paginator.page(page)
-            except PageNotAnInteger:
-                applications = paginator.page(1)
-            except EmptyPage:
-                applications = paginator.page(paginator.num_pages)
+            applications = CursorPaginator(applications_list, 10).page(request.GET.get('cursor'))
             context = {
                 'applications': applications,
                 'company_applications': "option--active",
-                'is_employed': current_driver.is_employed,
-                "has_speditor_permissions": current_driver.has_speditor_permissions,
             }
             return render(request, "company_applications.html", context)
         else:
@@ -856,7 +946,7 @@ def show_company_applications(request):
         return HttpResponse(status=403, content="Nie jesteś uprawniony do wykonania tej operacji.")
 
 def check_application(request, application_id):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner":
             application = EmployeeApplication.get_application_by_id(application_id)
@@ -866,8 +956,6 @@ def check_application(request, application_id):
                     'application': application,
                     'dlc': dlc,
                     'company_applications': "option--active",
-                    'is_employed': current_driver.is_employed,
-                    "has_speditor_permissions": current_driver.has_speditor_permissions,
                 }
             else:
                 return HttpResponse(status=401, content="Nie znaleziono aplikacji o takim id.")
@@ -879,7 +967,7 @@ def check_application(request, application_id):
 
 
 def accept_application(request, application_id):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner":
             application = EmployeeApplication.get_application_by_id(application_id)
@@ -896,7 +984,7 @@ def accept_application(request, application_id):
 
 
 def reject_application(request, application_id):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and current_driver.job_title == "owner":
             application = EmployeeApplication.get_application_by_id(application_id)
@@ -913,7 +1001,7 @@ def reject_application(request, application_id):
 
 
 def manage_disposition(request, disposition_id):
-    current_driver = Driver.get_driver_by_user_profile(request.user)
+    current_driver = request.driver_ctx.driver
     if current_driver.is_employed:
         if current_driver.company and (current_driver.job_title == "owner" or current_driver.job_title == "speditor"):
             disposition = Disposition.get_disposition_by_id(disposition_id)
@@ -938,8 +1026,6 @@ def manage_disposition(request, disposition_id):
                 context = {
                     "company_dispositions_tag": "option--active",
                     'employees': employees,
-                    "is_employed": current_driver.is_employed,
-                    "has_speditor_permissions": current_driver.has_speditor_permissions,
                     "form": form,
                 }
                 return render(request, "manage_disposition.html", context)